@@ -0,0 +1,34 @@
+'''
+Compares loading a program from the binary ast format with parsing its
+source and with unpickling it, and the sizes of both encodings.
+
+Run from the src directory:
+    python -m benchmarks.bench_ast_binary
+'''
+
+import pickle
+from timeit import repeat
+
+from i64lang import ast_binary
+from i64lang.parser import parse_str
+from benchmarks.bench_lexer import generate_source
+
+def main():
+    for size in (10**5, 10**6):
+        source = generate_source(size)
+        program = parse_str(source)
+        print(f"{len(source) / 10**6:.1f} MB:")
+        seconds = min(repeat(lambda: parse_str(source), number=1, repeat=3))
+        print(f"  {'parse_str':24}: {seconds * 1000:9.1f} ms")
+
+        pickled = pickle.dumps(program)
+        seconds = min(repeat(lambda: pickle.loads(pickled), number=1, repeat=3))
+        print(f"  {'pickle.loads':24}: {seconds * 1000:9.1f} ms, {len(pickled) / 10**6:6.2f} MB")
+
+        for spans in (True, False):
+            data = ast_binary.dumps(program, spans)
+            seconds = min(repeat(lambda: ast_binary.loads(data), number=1, repeat=3))
+            print(f"  {f'ast_binary.loads({spans})':24}: {seconds * 1000:9.1f} ms, {len(data) / 10**6:6.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+'''
+Measures how fast Bits values are built and combined, and how fast the
+x64 instructions produce their encoding on top of them.
+
+Run from the src directory:
+    python -m benchmarks.bench_bits
+'''
+
+from timeit import timeit
+
+from i64lang import x64
+from i64lang.bits import Bits
+
+def bench_concatenation():
+    parts = [Bits.from_hex("48"), Bits.from_hex("c7"), Bits("11000"), Bits("011")]
+    imm = Bits.from_int(123456, 32)
+    return lambda: (parts[0] + parts[1] + parts[2] + parts[3] + imm.reversed_bytes()).to_hex()
+
+def bench_encoding():
+    registers = [x64.rax, x64.rbx, x64.rsp, x64.rbp, x64.r8, x64.r13]
+    instructions = []
+    for dst in registers:
+        for src in registers:
+            instructions.append(x64.AddRegToReg(dst, src))
+            instructions.append(x64.MovRegToMem(dst, src))
+            instructions.append(x64.MovMemToReg(dst, src))
+        instructions.append(x64.MovImmToReg(dst, -1234567890000))
+        instructions.append(x64.SetIfLess(dst))
+
+    def run():
+        for instruction in instructions:
+            instruction.to_machine_code()
+    return run, len(instructions)
+
+def main():
+    number = 20000
+    seconds = timeit(bench_concatenation(), number=number)
+    print(f"concatenation: {number / seconds:12.0f} ops/s")
+
+    run, count = bench_encoding()
+    number = 500
+    seconds = timeit(run, number=number)
+    print(f"to_machine_code: {count * number / seconds:10.0f} instructions/s")
+
+if __name__ == "__main__":
+    main()
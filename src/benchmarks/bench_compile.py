@@ -0,0 +1,39 @@
+'''
+Measures how fast large generated programs are compiled to machine code,
+in a single process and with one process per core.
+
+Run from the src directory:
+    python -m benchmarks.bench_compile
+'''
+
+import os
+from timeit import repeat
+
+from i64lang import jit
+from i64lang.parser import parse_str
+from benchmarks.bench_lexer import generate_source
+
+def generate_program(size: int):
+    # The generated functions read variables that might never be assigned, which only the interpreters accept.
+    source = generate_source(size).replace("counter = 0;", "counter = 0; value_2 = 0; _tmp = 0;")
+    return parse_str(source)
+
+def main():
+    if not jit.is_supported():
+        print("requires x86-64 Linux")
+        return
+    workers = os.cpu_count()
+    for size in (10**5, 10**6):
+        program = generate_program(size)
+        print(f"{len(program.functions)} functions:")
+        for optimize in (False, True):
+            compilers = [
+                ("compile_program", lambda: jit.compile_program(program, optimize=optimize)),
+                (f"compile_program_parallel({workers})", lambda: jit.compile_program_parallel(program, optimize=optimize, workers=workers)),
+            ]
+            for name, compile in compilers:
+                seconds = min(repeat(compile, number=1, repeat=3))
+                print(f"  {name:30} optimize={optimize!s:5}: {seconds * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    main()
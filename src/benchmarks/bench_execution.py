@@ -0,0 +1,66 @@
+'''
+Measures how fast programs are executed by the available backends.
+
+Run from the src directory:
+    python -m benchmarks.bench_execution
+'''
+
+from time import perf_counter
+
+from i64lang.parser import parse_str
+from i64lang.interpreter import Interpreter
+from i64lang.backends import get_backend_names, load_program
+
+source = """
+def fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+
+def loop_sum(n) {
+    s = 0;
+    i = 0;
+    while (i < n) {
+        s = s + i * 3 - i / 2;
+        i = i + 1;
+    }
+    return s;
+}
+"""
+
+cases = [("fib", 20), ("loop_sum", 50000)]
+
+def count_evaluated_nodes(program, name, arg):
+    interpreter = Interpreter(program)
+    counter = [0]
+
+    def counting(handler):
+        def wrapper(node, frame):
+            counter[0] += 1
+            return handler(node, frame)
+        return wrapper
+
+    for handlers in (interpreter.statement_handlers, interpreter.expression_handlers):
+        for node_type, handler in handlers.items():
+            handlers[node_type] = counting(handler)
+    interpreter.call(name, arg)
+    return counter[0]
+
+def measure(function, *args):
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+def main():
+    program = parse_str(source)
+    backends = [(name, load_program(program, name)) for name in get_backend_names()]
+
+    for name, arg in cases:
+        node_amount = count_evaluated_nodes(program, name, arg)
+        print(f"{name}({arg}): {node_amount} nodes")
+        for backend_name, backend in backends:
+            result, seconds = measure(getattr(backend, name), arg)
+            print(f"  {backend_name:14}: {seconds * 1000:9.2f} ms, {node_amount / seconds:14.0f} nodes/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+'''
+Compares the latency of an edit in a large file when the whole file is
+parsed again and when only the edited function is reparsed.
+
+The second table edits the same function in files of growing size, the
+latency of an edit should not depend on the size of the file.
+
+Run from the src directory:
+    python -m benchmarks.bench_incremental
+'''
+
+import random
+from time import perf_counter
+
+from i64lang.parser import parse_str
+from i64lang.incremental import ParsedCode
+from benchmarks.bench_lexer import generate_source
+
+statement = " a = a + 1;"
+
+def insert_statement(parsed, function_index) -> int:
+    '''Inserts a statement at the start of the body of the function and returns its position.'''
+    function_start = parsed.get_function_span(function_index)[0]
+    position = parsed.code.index("{", function_start) + 1
+    parsed.edit(position, position, statement)
+    return position
+
+def measure_random_edits():
+    rng = random.Random(0)
+    for size in (10**5, 10**6):
+        source = generate_source(size)
+        parsed = ParsedCode(source)
+
+        start = perf_counter()
+        parse_str(source)
+        full_seconds = perf_counter() - start
+
+        edit_amount = 100
+        start = perf_counter()
+        for _ in range(edit_amount):
+            insert_statement(parsed, rng.randrange(len(parsed.program.functions)))
+        edit_seconds = (perf_counter() - start) / edit_amount
+
+        print(f"{len(source) / 10**6:.1f} MB: parse_str {full_seconds * 1000:8.2f} ms, edit {edit_seconds * 1000:8.3f} ms")
+
+def measure_edits_of_one_function():
+    for size in (10**5, 10**6, 8 * 10**6):
+        source = generate_source(size)
+        parsed = ParsedCode(source)
+        # A function in the middle, so that there are functions before and after it.
+        function_index = len(parsed.program.functions) // 2
+
+        # Every statement is removed again, so that the function keeps its size.
+        edit_amount = 1000
+        start = perf_counter()
+        for _ in range(edit_amount // 2):
+            position = insert_statement(parsed, function_index)
+            parsed.edit(position, position + len(statement), "")
+        edit_seconds = (perf_counter() - start) / edit_amount
+
+        print(f"{len(source) / 10**6:.1f} MB: same function, edit {edit_seconds * 1000:8.3f} ms")
+
+def main():
+    measure_random_edits()
+    measure_edits_of_one_function()
+
+if __name__ == "__main__":
+    main()
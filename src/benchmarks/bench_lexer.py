@@ -0,0 +1,77 @@
+'''
+Measures how many tokens per second the lexer produces on large generated
+sources, and how much memory the token list and the token buffer take.
+Streaming lexing only needs memory for a single chunk, its peak is reported
+as well.
+
+Run from the src directory:
+    python -m benchmarks.bench_lexer
+'''
+
+import random
+import tracemalloc
+from time import perf_counter
+
+from i64lang.lexer import iter_tokens, tokenize_str, tokenize_str_to_buffer
+
+def generate_function(rng: random.Random, index: int) -> str:
+    names = ["a", "b", "counter", "value_2", "_tmp"]
+    lines = [f"def function_{index}(a, b) {{", "    counter = 0;"]
+    for _ in range(rng.randint(3, 12)):
+        left, right = rng.choice(names), rng.choice(names)
+        operator = rng.choice(["+", "-", "*", "/", "==", "!=", "<=", ">=", "<", ">"])
+        kind = rng.randint(0, 2)
+        if kind == 0:
+            lines.append(f"    {left} = {right} {operator} {rng.randint(0, 10**6)};")
+        elif kind == 1:
+            lines.append(f"    if ({left} {operator} {right}) {{ {left} = -{right}; }} else {{ {right} = {left}; }}")
+        else:
+            lines.append(f"    while ({left} < {rng.randint(0, 100)}) {{ {left} = {left} + 1; }}")
+    lines.append("    return function_0(a, b) + counter;")
+    lines.append("}")
+    return "\n".join(lines)
+
+def generate_source(size: int, seed: int = 0) -> str:
+    '''Source code with at least `size` characters.'''
+    rng = random.Random(seed)
+    functions = []
+    length = 0
+    while length < size:
+        function = generate_function(rng, len(functions))
+        functions.append(function)
+        length += len(function) + 2
+    return "\n\n".join(functions)
+
+def measure_memory(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def main():
+    for size in (10**5, 10**6, 4 * 10**6):
+        source = generate_source(size)
+        print(f"{len(source) / 10**6:.1f} MB:")
+        for tokenize in (tokenize_str, tokenize_str_to_buffer):
+            start = perf_counter()
+            tokens = tokenize(source)
+            seconds = perf_counter() - start
+            del tokens
+            tokens, memory = measure_memory(tokenize, source)
+            print(f"  {tokenize.__name__:22}: {len(tokens):8} tokens, {seconds * 1000:9.1f} ms, "
+                  f"{len(tokens) / seconds:12.0f} tokens/s, {memory / len(tokens):5.1f} bytes/token")
+
+        chunks = [source[i:i + 2**16] for i in range(0, len(source), 2**16)]
+        start = perf_counter()
+        token_amount = sum(1 for _ in iter_tokens(chunks))
+        seconds = perf_counter() - start
+        tracemalloc.start()
+        sum(1 for _ in iter_tokens(chunks))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {'iter_tokens':22}: {token_amount:8} tokens, {seconds * 1000:9.1f} ms, "
+              f"{token_amount / seconds:12.0f} tokens/s, {peak / 1000:7.0f} kB peak")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+'''
+Measures how fast large generated sources are parsed, including lexing,
+in a single process, with lazily parsed function bodies and with one
+process per core. Expression-heavy code is also parsed from an already
+lexed token buffer, which measures the expression parser on its own.
+
+Run from the src directory:
+    python -m benchmarks.bench_parser
+'''
+
+import os
+import random
+from timeit import repeat
+
+from i64lang.lexer import tokenize_str_to_buffer
+from i64lang.parser import parse, parse_str, parse_parallel
+from benchmarks.bench_lexer import generate_source
+
+def generate_expression(rng: random.Random, depth: int) -> str:
+    operands = ["a", "b", "c", str(rng.randint(0, 1000))]
+    if depth > 0:
+        operands += [f"({generate_expression(rng, depth - 1)})", f"-{rng.choice(operands)}", f"c({rng.choice(operands)})"]
+    code = rng.choice(operands)
+    for _ in range(rng.randint(0, 8)):
+        code += f" {rng.choice(['+', '-', '*', '/'])} {rng.choice(operands)}"
+    return code
+
+def generate_expression_source(size: int, seed: int = 0) -> str:
+    '''Functions that return a long expression each, with at least `size` characters in total.'''
+    rng = random.Random(seed)
+    functions = []
+    length = 0
+    while length < size:
+        function = f"def function_{len(functions)}(a, b, c) {{ return {generate_expression(rng, 2)} < {generate_expression(rng, 2)}; }}"
+        functions.append(function)
+        length += len(function) + 1
+    return "\n".join(functions)
+
+def main():
+    workers = os.cpu_count()
+    for size in (10**5, 10**6, 4 * 10**6):
+        source = generate_source(size)
+        print(f"{len(source) / 10**6:.1f} MB:")
+        parsers = [
+            ("parse_str", parse_str),
+            ("parse_str(lazy=True)", lambda code: parse_str(code, lazy=True)),
+            (f"parse_parallel({workers})", lambda code: parse_parallel(code, workers)),
+        ]
+        for name, parse_code in parsers:
+            seconds = min(repeat(lambda: parse_code(source), number=1, repeat=3))
+            print(f"  {name:20}: {seconds * 1000:9.1f} ms, {len(source) / seconds / 10**6:6.2f} MB/s")
+
+    for size in (10**5, 10**6):
+        tokens = tokenize_str_to_buffer(generate_expression_source(size))
+        seconds = min(repeat(lambda: parse(tokens), number=1, repeat=3))
+        print(f"expressions, {len(tokens)} tokens: {seconds * 1000:9.1f} ms, {len(tokens) / seconds / 10**6:6.2f} M tokens/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+'''
+Measures x64 instruction encoding throughput, once through to_machine_code
+and once by appending to a shared buffer with encode_into.
+
+Run from the src directory:
+    python -m benchmarks.bench_x64
+'''
+
+from timeit import timeit
+
+from i64lang import x64
+
+registers = [x64.rax, x64.rcx, x64.rbx, x64.rsp, x64.rbp, x64.rdi, x64.r8, x64.r12, x64.r13, x64.r15]
+
+def make_instructions():
+    instructions = []
+    for dst in registers:
+        for src in registers:
+            instructions.append(x64.AddRegToReg(dst, src))
+            instructions.append(x64.Compare(dst, src))
+            instructions.append(x64.MovRegToMem(dst, src))
+            instructions.append(x64.MovMemToReg(dst, src))
+        instructions.append(x64.MovImmToReg(dst, 42))
+        instructions.append(x64.MovImmToReg(dst, -1234567890000))
+        instructions.append(x64.SetIfLess(dst))
+        instructions.append(x64.Return())
+    return instructions
+
+def main():
+    instructions = make_instructions()
+    number = 200
+
+    def to_machine_code():
+        for instruction in instructions:
+            instruction.to_machine_code()
+
+    def encode_into():
+        x64.encode_instructions(instructions)
+
+    for name, function in [("to_machine_code", to_machine_code), ("encode_into", encode_into)]:
+        seconds = timeit(function, number=number)
+        print(f"{name:16}: {len(instructions) * number / seconds:10.0f} instructions/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+__all__ = [
+    "ObjectCode",
+    "Relocation",
+    "assemble",
+    "link",
+]
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from . import x64
+
+@dataclass
+class Relocation:
+    # Position of the 32 bit displacement that has to be patched.
+    offset: int
+    label: str
+
+@dataclass
+class ObjectCode:
+    code: bytes
+    labels: Dict[str, int] = field(default_factory=dict)
+
+    # References to labels that are not defined in this code.
+    relocations: List[Relocation] = field(default_factory=list)
+
+def assemble(instructions: Iterable[x64.Instruction]) -> ObjectCode:
+    buffer = bytearray()
+    labels = {}
+    references = []
+
+    for instruction in instructions:
+        if isinstance(instruction, x64.Label):
+            if instruction.name in labels:
+                raise RuntimeError(f"label defined twice: {instruction.name}")
+            labels[instruction.name] = len(buffer)
+        else:
+            instruction.encode_into(buffer)
+            if isinstance(instruction, x64.LabelReferenceInstruction):
+                references.append(Relocation(len(buffer) - 4, instruction.label))
+
+    relocations = []
+    for reference in references:
+        if reference.label in labels:
+            patch_displacement(buffer, reference.offset, labels[reference.label])
+        else:
+            relocations.append(reference)
+
+    return ObjectCode(bytes(buffer), labels, relocations)
+
+def link(objects: Iterable[ObjectCode], alignment: int = 16) -> ObjectCode:
+    '''
+    Concatenates the given object codes and resolves references between them.
+    References to labels that are not defined in any of them stay relocations.
+    '''
+    buffer = bytearray()
+    labels = {}
+    references = []
+
+    for obj in objects:
+        padding = -len(buffer) % alignment
+        buffer += b"\xcc" * padding
+
+        base = len(buffer)
+        buffer += obj.code
+        for name, offset in obj.labels.items():
+            if name in labels:
+                raise RuntimeError(f"label defined twice: {name}")
+            labels[name] = base + offset
+        for relocation in obj.relocations:
+            references.append(Relocation(base + relocation.offset, relocation.label))
+
+    relocations = []
+    for reference in references:
+        if reference.label in labels:
+            patch_displacement(buffer, reference.offset, labels[reference.label])
+        else:
+            relocations.append(reference)
+
+    return ObjectCode(bytes(buffer), labels, relocations)
+
+def patch_displacement(buffer: bytearray, offset: int, target: int):
+    # The displacement is relative to the end of the instruction,
+    # which is also where the displacement ends.
+    displacement = target - (offset + 4)
+    buffer[offset:offset + 4] = displacement.to_bytes(4, "little", signed=True)
@@ -1,68 +1,119 @@
 from __future__ import annotations
 
-from typing import List
-from dataclasses import dataclass
+from typing import Callable, List, Optional
+from dataclasses import dataclass, field
 
-@dataclass
-class Program:
+from . spans import Span
+
+def span_field():
+    '''Where the node comes from in the code, if it was parsed from a token buffer.'''
+    return field(default=None, compare=False, repr=False)
+
+class Node:
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Pickles the fields as constructor arguments, which is smaller and faster than the slot names and values.
+        return type(self), tuple([getattr(self, name) for name in self.__slots__])
+
+@dataclass(slots=True)
+class Program(Node):
     functions: List[Function]
 
-@dataclass
-class Function:
+@dataclass(slots=True)
+class Function(Node):
     name: str
     arg_names: List[str]
     stmt: Statement
+    span: Optional[Span] = span_field()
+
+class DeferredStatement:
+    '''
+    Stands in for the statement of a function until it is read for the first time,
+    then `load` is called and its result replaces this object.
+    '''
+
+    __slots__ = ("load",)
+
+    def __init__(self, load: Callable[[], Statement]):
+        self.load = load
+
+# Reading `stmt` of a function loads deferred statements, all other code sees only the loaded statement.
+stored_function_stmt = Function.stmt
+
+def get_function_stmt(function: Function) -> Statement:
+    stmt = stored_function_stmt.__get__(function)
+    if type(stmt) is DeferredStatement:
+        stmt = stmt.load()
+        stored_function_stmt.__set__(function, stmt)
+    return stmt
+
+def is_function_loaded(function: Function) -> bool:
+    return type(stored_function_stmt.__get__(function)) is not DeferredStatement
+
+Function.stmt = property(get_function_stmt, stored_function_stmt.__set__)
 
-class Statement:
-    pass
+class Statement(Node):
+    __slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class BlockStmt(Statement):
     statements: List[Statement]
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStmt(Statement):
     expr: Expression
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Statement):
     condition: Expression
     body_stmt: Statement
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class IfStmt(Statement):
     condition: Expression
     then_stmt: Statement
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class IfElseStmt(Statement):
     condition: Expression
     then_stmt: Statement
     else_stmt: Statement
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class AssignmentStmt(Statement):
     name: str
     expr: Expression
+    span: Optional[Span] = span_field()
 
-class Expression:
-    pass
+class Expression(Node):
+    # Only set on expressions that were made by an `interning.ExpressionInterner`.
+    __slots__ = ("structural_hash",)
 
-@dataclass
+@dataclass(slots=True)
 class InfixExpr(Expression):
     operator: str
     left_expr: Expression
     right_expr: Expression
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class Identifier(Expression):
     name: str
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class Int(Expression):
     value: int
+    span: Optional[Span] = span_field()
 
-@dataclass
+@dataclass(slots=True)
 class Call(Expression):
     ptr_expr: Expression
     args: List[Expression]
+    span: Optional[Span] = span_field()
@@ -0,0 +1,299 @@
+'''
+Compact binary form of a program, to send parsed programs to other processes
+or hosts without parsing them again.
+
+    magic, version, flags
+    string table: amount, then length and utf-8 bytes of every string
+    function table: amount, then the size of every encoded function
+    the encoded functions
+
+All numbers are varints. A function is encoded node by node, every child
+before its parent, so that neither writing nor reading recurses. A node
+is a tag byte, which is one of the kinds of `FlatAst`, followed by its
+operands:
+
+    BLOCK amount          RETURN, WHILE, IF, IF_ELSE
+    ASSIGNMENT name       INFIX operator        IDENTIFIER name
+    INT zigzag value      CALL argument amount
+    FUNCTION name, argument amount, argument names
+
+Names are indices into the string table, operators into `FlatAst.operators`.
+With spans, every node ends with its span: zero when it has none, otherwise
+one plus the zigzag difference to the start of the previous span in the
+function, followed by the length.
+
+Functions can be decoded on their own, `ProgramView` only decodes the ones
+that are accessed.
+'''
+
+__all__ = [
+    "ProgramView",
+    "dumps",
+    "loads",
+]
+
+from typing import Iterator, List, Optional, Tuple
+
+from . import ast
+from . ast_utils import reduce_tree
+from . flat_ast import FlatAst
+from . names import NameTable
+from . parser import paused_garbage_collection
+
+MAGIC = b"I64A"
+VERSION = 1
+WITH_SPANS = 1
+
+def dumps(program: ast.Program, spans: bool = True) -> bytes:
+    writer = Writer(spans)
+    encoded_functions = [writer.encode_function(function) for function in program.functions]
+
+    data = bytearray(MAGIC)
+    data.append(VERSION)
+    data.append(WITH_SPANS if spans else 0)
+    write_varint(data, len(writer.name_table))
+    for name in writer.name_table.names:
+        encoded_name = name.encode("utf-8")
+        write_varint(data, len(encoded_name))
+        data += encoded_name
+    write_varint(data, len(encoded_functions))
+    for encoded_function in encoded_functions:
+        write_varint(data, len(encoded_function))
+    for encoded_function in encoded_functions:
+        data += encoded_function
+    return bytes(data)
+
+def loads(data: bytes) -> ast.Program:
+    return ProgramView(data).to_program()
+
+class ProgramView:
+    '''
+    Gives access to the functions of an encoded program, every function is decoded when it is
+    accessed for the first time.
+    '''
+
+    def __init__(self, data: bytes):
+        if data[:len(MAGIC)] != MAGIC or len(data) < len(MAGIC) + 2:
+            raise RuntimeError("not an encoded program")
+        if data[len(MAGIC)] != VERSION:
+            raise RuntimeError(f"unsupported version of encoded program: {data[len(MAGIC)]}")
+        self.data = data
+        self.spans = bool(data[len(MAGIC) + 1] & WITH_SPANS)
+
+        position = len(MAGIC) + 2
+        name_amount, position = read_varint(data, position)
+        self.names: List[str] = []
+        for _ in range(name_amount):
+            size, position = read_varint(data, position)
+            self.names.append(data[position:position + size].decode("utf-8"))
+            position += size
+
+        function_amount, position = read_varint(data, position)
+        sizes = []
+        for _ in range(function_amount):
+            size, position = read_varint(data, position)
+            sizes.append(size)
+        # Start of every function and the end of the last one.
+        self.function_starts = [position]
+        for size in sizes:
+            self.function_starts.append(self.function_starts[-1] + size)
+        if self.function_starts[-1] != len(data):
+            raise RuntimeError("truncated encoded program")
+        self.functions: List[Optional[ast.Function]] = [None] * function_amount
+
+    def __len__(self):
+        return len(self.functions)
+
+    def __getitem__(self, index: int) -> ast.Function:
+        function = self.functions[index]
+        if function is None:
+            if index < 0:
+                index += len(self.functions)
+            function = decode_function(self.data, self.function_starts[index], self.function_starts[index + 1],
+                                       self.names, self.spans)
+            self.functions[index] = function
+        return function
+
+    def __iter__(self):
+        for index in range(len(self.functions)):
+            yield self[index]
+
+    def to_program(self) -> ast.Program:
+        with paused_garbage_collection():
+            return ast.Program(list(self))
+
+# Writing
+###################################
+
+class Writer:
+    def __init__(self, spans: bool):
+        self.spans = spans
+        self.name_table = NameTable()
+        self.data = bytearray()
+        # Start of the last span that has been written.
+        self.span_start = 0
+
+    def encode_function(self, function: ast.Function) -> bytes:
+        self.data = bytearray()
+        self.span_start = 0
+        reduce_tree(function, self.write_node)
+        return bytes(self.data)
+
+    def write_node(self, node: ast.Node, children: list):
+        node_writers[type(node)](self, node)
+        if self.spans:
+            span = node.span
+            if span is None:
+                self.data.append(0)
+            else:
+                write_varint(self.data, zigzag(span[0] - self.span_start) + 1)
+                write_varint(self.data, span[1] - span[0])
+                self.span_start = span[0]
+
+    def write_tag(self, tag: int, *operands: int):
+        self.data.append(tag)
+        for operand in operands:
+            write_varint(self.data, operand)
+
+    def write_function(self, function: ast.Function):
+        self.write_tag(FlatAst.FUNCTION, self.name_table.intern(function.name), len(function.arg_names),
+                       *[self.name_table.intern(name) for name in function.arg_names])
+
+# Writes the tag and the operands of a node whose children have already been written.
+node_writers = {
+    ast.Function : Writer.write_function,
+    ast.BlockStmt : lambda writer, node: writer.write_tag(FlatAst.BLOCK, len(node.statements)),
+    ast.ReturnStmt : lambda writer, node: writer.write_tag(FlatAst.RETURN),
+    ast.WhileStmt : lambda writer, node: writer.write_tag(FlatAst.WHILE),
+    ast.IfStmt : lambda writer, node: writer.write_tag(FlatAst.IF),
+    ast.IfElseStmt : lambda writer, node: writer.write_tag(FlatAst.IF_ELSE),
+    ast.AssignmentStmt : lambda writer, node: writer.write_tag(FlatAst.ASSIGNMENT, writer.name_table.intern(node.name)),
+    ast.InfixExpr : lambda writer, node: writer.write_tag(FlatAst.INFIX, FlatAst.operator_ids[node.operator]),
+    ast.Identifier : lambda writer, node: writer.write_tag(FlatAst.IDENTIFIER, writer.name_table.intern(node.name)),
+    ast.Int : lambda writer, node: writer.write_tag(FlatAst.INT, zigzag(node.value)),
+    ast.Call : lambda writer, node: writer.write_tag(FlatAst.CALL, len(node.args)),
+}
+
+def zigzag(value: int) -> int:
+    '''Maps integers of small magnitude to small non-negative ones: 0, -1, 1, -2, ... to 0, 1, 2, 3, ...'''
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def write_varint(data: bytearray, value: int):
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+# Reading
+###################################
+
+def read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    '''The value at the position and the position after it.'''
+    value = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise RuntimeError("truncated encoded program")
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def read_varint_rest(first_byte: int, byte_iterator: Iterator[int]) -> int:
+    '''The value of a varint whose first byte has already been read and has the continuation bit set.'''
+    value = first_byte & 0x7f
+    shift = 7
+    for byte in byte_iterator:
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+    raise RuntimeError("invalid encoded function")
+
+def decode_function(data: bytes, start: int, end: int, names: List[str], spans: bool) -> ast.Function:
+    '''
+    Pushes every decoded node onto a stack, from which the nodes that follow take their children.
+    This runs for every node, so the types are bound to local names, the most common nodes are
+    tested first and varints of a single byte, which most are, are read inline.
+    '''
+    Identifier, InfixExpr, AssignmentStmt, Int, BlockStmt = ast.Identifier, ast.InfixExpr, ast.AssignmentStmt, ast.Int, ast.BlockStmt
+    IDENTIFIER, INFIX, ASSIGNMENT, INT, BLOCK = FlatAst.IDENTIFIER, FlatAst.INFIX, FlatAst.ASSIGNMENT, FlatAst.INT, FlatAst.BLOCK
+    operators = FlatAst.operators
+    stack: list = []
+    push = stack.append
+    pop = stack.pop
+    byte_iterator = iter(data[start:end])
+    span_start = 0
+    try:
+        for tag in byte_iterator:
+            if tag in tags_without_operand:
+                node = decode_statement(tag, stack)
+            else:
+                value = next(byte_iterator)
+                if value >= 0x80:
+                    value = read_varint_rest(value, byte_iterator)
+
+                if tag == IDENTIFIER:
+                    node = Identifier(names[value])
+                elif tag == INFIX:
+                    right_expr = pop()
+                    node = InfixExpr(operators[value], pop(), right_expr)
+                elif tag == ASSIGNMENT:
+                    node = AssignmentStmt(names[value], pop())
+                elif tag == INT:
+                    node = Int(value >> 1 if not value & 1 else -(value >> 1) - 1)
+                elif tag == BLOCK:
+                    node = BlockStmt(pop_elements(stack, value))
+                elif tag == FlatAst.CALL:
+                    args = pop_elements(stack, value)
+                    node = ast.Call(pop(), args)
+                elif tag == FlatAst.FUNCTION:
+                    arg_names = [names[read_varint_from(byte_iterator)] for _ in range(read_varint_from(byte_iterator))]
+                    node = ast.Function(names[value], arg_names, pop())
+                else:
+                    raise RuntimeError(f"invalid tag in encoded function: {tag}")
+
+            if spans:
+                span_delta = next(byte_iterator)
+                if span_delta:
+                    if span_delta >= 0x80:
+                        span_delta = read_varint_rest(span_delta, byte_iterator)
+                    span_delta -= 1
+                    span_start += span_delta >> 1 if not span_delta & 1 else -(span_delta >> 1) - 1
+                    node.span = span_start, span_start + read_varint_from(byte_iterator)
+            push(node)
+    except (IndexError, StopIteration):
+        # Reading past the end, popping from an empty stack or an invalid index.
+        raise RuntimeError("invalid encoded function") from None
+
+    if len(stack) != 1 or not isinstance(stack[0], ast.Function):
+        raise RuntimeError("invalid encoded function")
+    return stack[0]
+
+tags_without_operand = frozenset([FlatAst.RETURN, FlatAst.WHILE, FlatAst.IF, FlatAst.IF_ELSE])
+
+def read_varint_from(byte_iterator: Iterator[int]) -> int:
+    first_byte = next(byte_iterator)
+    return first_byte if first_byte < 0x80 else read_varint_rest(first_byte, byte_iterator)
+
+def pop_elements(stack: list, amount: int) -> list:
+    if not amount:
+        return []
+    if amount > len(stack):
+        raise IndexError()
+    elements = stack[-amount:]
+    del stack[-amount:]
+    return elements
+
+def decode_statement(tag: int, stack: list) -> ast.Statement:
+    if tag == FlatAst.RETURN:
+        return ast.ReturnStmt(stack.pop())
+    elif tag == FlatAst.IF_ELSE:
+        else_stmt = stack.pop()
+        then_stmt = stack.pop()
+        return ast.IfElseStmt(stack.pop(), then_stmt, else_stmt)
+    body_stmt = stack.pop()
+    condition = stack.pop()
+    return ast.WhileStmt(condition, body_stmt) if tag == FlatAst.WHILE else ast.IfStmt(condition, body_stmt)
@@ -0,0 +1,212 @@
+'''
+Optimizations on the ast that every backend benefits from.
+
+`fold_constants` evaluates constant subexpressions with the wraparound
+semantics of `i64` and simplifies algebraic identities. Branches and loops
+with constant conditions are resolved and statements after a return are
+dropped. The input is not modified, unchanged subtrees are shared between
+the old and the new tree.
+
+Expressions are only removed when evaluating them cannot have an effect,
+i.e. when they contain no calls, no divisions that might trap and no names
+other than local variables.
+'''
+
+__all__ = [
+    "fold_constants",
+    "fold_function_constants",
+]
+
+from typing import Optional, Set
+
+from . import ast
+from . import i64
+from . i64 import commutative_operators, self_comparisons
+from . ast_utils import get_local_names, iter_expressions
+
+def fold_constants(program: ast.Program) -> ast.Program:
+    return ast.Program([fold_function_constants(function) for function in program.functions])
+
+def fold_function_constants(function: ast.Function) -> ast.Function:
+    local_names = get_local_names(function)
+    folder = ConstantFolder(set(local_names))
+    stmt = folder.fold_block(function.stmt)
+
+    # Variables whose assignments have all been removed have to stay local variables,
+    # otherwise reading them could refer to a function or fail.
+    remaining_names = set(get_local_names(ast.Function(function.name, function.arg_names, stmt)))
+    used_names = {expr.name for expr in iter_expressions(stmt) if isinstance(expr, ast.Identifier)}
+    lost_names = [name for name in local_names if name not in remaining_names and name in used_names]
+    if lost_names:
+        stmt = ast.BlockStmt([ast.AssignmentStmt(name, ast.Int(0)) for name in lost_names] + stmt.statements)
+
+    return ast.Function(function.name, function.arg_names, stmt, function.span)
+
+class ConstantFolder:
+    def __init__(self, local_names: Set[str]):
+        self.local_names = local_names
+
+        self.statement_folders = {
+            ast.BlockStmt : self.fold_block,
+            ast.ReturnStmt : self.fold_return,
+            ast.AssignmentStmt : self.fold_assignment,
+            ast.WhileStmt : self.fold_while,
+            ast.IfStmt : self.fold_if,
+            ast.IfElseStmt : self.fold_if_else,
+        }
+        self.expression_folders = {
+            ast.Int : self.fold_int,
+            ast.Identifier : self.fold_identifier,
+            ast.InfixExpr : self.fold_infix,
+            ast.Call : self.fold_call,
+        }
+
+    # Statements
+    ###################################
+
+    def fold_statement(self, stmt: ast.Statement) -> ast.Statement:
+        return self.statement_folders[type(stmt)](stmt)
+
+    def fold_block(self, stmt: ast.Statement) -> ast.BlockStmt:
+        '''Nested blocks are flattened, statements after a return are unreachable.'''
+        statements = []
+        sub_statements = stmt.statements if isinstance(stmt, ast.BlockStmt) else [stmt]
+        for sub_stmt in sub_statements:
+            if not isinstance(sub_stmt, ast.BlockStmt):
+                sub_stmt = self.fold_statement(sub_stmt)
+            if isinstance(sub_stmt, ast.BlockStmt):
+                statements.extend(self.fold_block(sub_stmt).statements)
+            else:
+                statements.append(sub_stmt)
+            if statements and isinstance(statements[-1], ast.ReturnStmt):
+                break
+        return ast.BlockStmt(statements)
+
+    def fold_return(self, stmt: ast.ReturnStmt) -> ast.Statement:
+        return ast.ReturnStmt(self.fold_expression(stmt.expr), stmt.span)
+
+    def fold_assignment(self, stmt: ast.AssignmentStmt) -> ast.Statement:
+        return ast.AssignmentStmt(stmt.name, self.fold_expression(stmt.expr), stmt.span)
+
+    def fold_while(self, stmt: ast.WhileStmt) -> ast.Statement:
+        condition = self.fold_expression(stmt.condition)
+        if get_constant(condition) == 0:
+            return ast.BlockStmt([])
+        return ast.WhileStmt(condition, self.fold_statement(stmt.body_stmt), stmt.span)
+
+    def fold_if(self, stmt: ast.IfStmt) -> ast.Statement:
+        condition = self.fold_expression(stmt.condition)
+        value = get_constant(condition)
+        if value is None:
+            return ast.IfStmt(condition, self.fold_statement(stmt.then_stmt), stmt.span)
+        elif value != 0:
+            return self.fold_statement(stmt.then_stmt)
+        else:
+            return ast.BlockStmt([])
+
+    def fold_if_else(self, stmt: ast.IfElseStmt) -> ast.Statement:
+        condition = self.fold_expression(stmt.condition)
+        value = get_constant(condition)
+        if value is None:
+            return ast.IfElseStmt(condition, self.fold_statement(stmt.then_stmt), self.fold_statement(stmt.else_stmt), stmt.span)
+        elif value != 0:
+            return self.fold_statement(stmt.then_stmt)
+        else:
+            return self.fold_statement(stmt.else_stmt)
+
+    # Expressions
+    ###################################
+
+    def fold_expression(self, expr: ast.Expression) -> ast.Expression:
+        return self.expression_folders[type(expr)](expr)
+
+    def fold_int(self, expr: ast.Int) -> ast.Expression:
+        value = i64.wrap(expr.value)
+        return expr if value == expr.value else ast.Int(value, expr.span)
+
+    def fold_identifier(self, expr: ast.Identifier) -> ast.Expression:
+        return expr
+
+    def fold_call(self, expr: ast.Call) -> ast.Expression:
+        return ast.Call(self.fold_expression(expr.ptr_expr), [self.fold_expression(arg) for arg in expr.args], expr.span)
+
+    def fold_infix(self, expr: ast.InfixExpr) -> ast.Expression:
+        operator = expr.operator
+        left = self.fold_expression(expr.left_expr)
+        right = self.fold_expression(expr.right_expr)
+        left_value = get_constant(left)
+        right_value = get_constant(right)
+
+        if left_value is not None and right_value is not None:
+            if operator == "/" and right_value == 0:
+                return ast.InfixExpr(operator, left, right, expr.span)
+            return ast.Int(i64.binary_operations[operator](left_value, right_value), expr.span)
+
+        if operator in commutative_operators and left_value is not None:
+            left, right = right, left
+            left_value, right_value = right_value, left_value
+
+        if right_value is not None and self.is_integer(left):
+            if operator in ("+", "-") and right_value == 0:
+                return left
+            if operator in ("*", "/") and right_value == 1:
+                return left
+            if operator == "*" and right_value == 0 and self.is_pure(left):
+                return ast.Int(0, expr.span)
+            if operator in ("+", "-", "*"):
+                combined = combine_constants(operator, left, right_value)
+                if combined is not None and self.is_integer(combined):
+                    return combined
+
+        if self.is_pure(left) and left == right:
+            if operator == "-":
+                return ast.Int(0, expr.span)
+            if operator in self_comparisons:
+                return ast.Int(self_comparisons[operator], expr.span)
+
+        return ast.InfixExpr(operator, left, right, expr.span)
+
+    def is_integer(self, expr: ast.Expression) -> bool:
+        '''Names of functions are the only values that are not integers.'''
+        return not isinstance(expr, ast.Identifier) or expr.name in self.local_names
+
+    def is_pure(self, expr: ast.Expression) -> bool:
+        '''Whether evaluating the expression can be skipped without changing the behavior.'''
+        if isinstance(expr, ast.Int):
+            return True
+        elif isinstance(expr, ast.Identifier):
+            return expr.name in self.local_names
+        elif isinstance(expr, ast.InfixExpr):
+            if expr.operator == "/" and get_constant(expr.right_expr) in (None, 0, -1):
+                return False
+            return self.is_pure(expr.left_expr) and self.is_pure(expr.right_expr)
+        else:
+            return False
+
+def get_constant(expr: ast.Expression) -> Optional[int]:
+    return expr.value if isinstance(expr, ast.Int) else None
+
+def combine_constants(operator: str, left: ast.Expression, right_value: int) -> Optional[ast.Expression]:
+    '''
+    Merges a constant into a constant operand of the left expression,
+    e.g. (x + 2) - 5 becomes x + -3 and (x * 2) * 3 becomes x * 6.
+    '''
+    if not isinstance(left, ast.InfixExpr):
+        return None
+    inner_value = get_constant(left.right_expr)
+    if inner_value is None:
+        return None
+
+    if operator == "*":
+        if left.operator != "*":
+            return None
+        return ast.InfixExpr("*", left.left_expr, ast.Int(i64.mul(inner_value, right_value)))
+
+    if left.operator not in ("+", "-"):
+        return None
+    inner_value = inner_value if left.operator == "+" else -inner_value
+    outer_value = right_value if operator == "+" else -right_value
+    value = i64.wrap(inner_value + outer_value)
+    if value == 0:
+        return left.left_expr
+    return ast.InfixExpr("+", left.left_expr, ast.Int(value))
@@ -1,55 +1,43 @@
 from graphviz import Digraph
 from . import ast
+from . ast_utils import walk_edges
 
 def ast_to_graph(element):
     graph = Digraph()
-    build_subtree(graph, element)
+    for parent, field_name, node in walk_edges(element):
+        graph.node(node_id(node), node_labels[type(node)](node))
+        if parent is not None:
+            graph.edge(node_id(parent), node_id(node), edge_labels.get((type(parent), field_name), ""))
     return graph
 
 def node_id(element):
     return str(id(element))
 
-def build_subtree(graph, element):
-    def make_edge_to_subtree(to_element, label=""):
-        build_subtree(graph, to_element)
-        graph.edge(node_id(element), node_id(to_element), label)
+node_labels = {
+    ast.Program : lambda element: "Program",
+    ast.Function : lambda element: f"{element.name}({', '.join(element.arg_names)})",
+    ast.BlockStmt : lambda element: "Block",
+    ast.ReturnStmt : lambda element: "return",
+    ast.WhileStmt : lambda element: "while",
+    ast.IfStmt : lambda element: "if then",
+    ast.IfElseStmt : lambda element: "if then else",
+    ast.AssignmentStmt : lambda element: f"{element.name} =",
+    ast.InfixExpr : lambda element: element.operator,
+    ast.Identifier : lambda element: element.name,
+    ast.Int : lambda element: str(element.value),
+    ast.Call : lambda element: "call",
+}
 
-    def current_label(label):
-        graph.node(node_id(element), label)
-
-    if isinstance(element, ast.Program):
-        current_label("Program")
-        for function in element.functions:
-            make_edge_to_subtree(function)
-    elif isinstance(element, ast.Function):
-        current_label(f"{element.name}({', '.join(element.arg_names)})")
-        make_edge_to_subtree(element.stmt)
-    elif isinstance(element, ast.BlockStmt):
-        current_label("Block")
-        for stmt in element.statements:
-            make_edge_to_subtree(stmt)
-    elif isinstance(element, ast.ReturnStmt):
-        current_label("return")
-        make_edge_to_subtree(element.expr)
-    elif isinstance(element, ast.IfStmt):
-        current_label("if then")
-        make_edge_to_subtree(element.condition, "if")
-        make_edge_to_subtree(element.then_stmt, "then")
-    elif isinstance(element, ast.IfElseStmt):
-        current_label("if then else")
-        make_edge_to_subtree(element.condition, "if")
-        make_edge_to_subtree(element.then_stmt, "then")
-        make_edge_to_subtree(element.else_stmt, "else")
-    elif isinstance(element, ast.AssignmentStmt):
-        current_label(f"{element.name} =")
-        make_edge_to_subtree(element.expr)
-    elif isinstance(element, ast.InfixExpr):
-        current_label(element.operator)
-        make_edge_to_subtree(element.left_expr, "left")
-        make_edge_to_subtree(element.right_expr, "right")
-    elif isinstance(element, ast.Identifier):
-        current_label(element.name)
-    elif isinstance(element, ast.Int):
-        current_label(str(element.value))
-    else:
-        assert False
+edge_labels = {
+    (ast.WhileStmt, "condition") : "while",
+    (ast.WhileStmt, "body_stmt") : "do",
+    (ast.IfStmt, "condition") : "if",
+    (ast.IfStmt, "then_stmt") : "then",
+    (ast.IfElseStmt, "condition") : "if",
+    (ast.IfElseStmt, "then_stmt") : "then",
+    (ast.IfElseStmt, "else_stmt") : "else",
+    (ast.InfixExpr, "left_expr") : "left",
+    (ast.InfixExpr, "right_expr") : "right",
+    (ast.Call, "ptr_expr") : "function",
+    (ast.Call, "args") : "argument",
+}
@@ -0,0 +1,246 @@
+'''
+Builds the ir from the ast.
+
+Local variables are turned into SSA values while the control flow graph is
+built, following "Simple and Efficient Construction of Static Single
+Assignment Form" by Braun et al. A block is sealed once all its
+predecessors are known, phis for variables read in unsealed blocks are
+completed when the block is sealed.
+
+Variables that are read before they are assigned are zero and functions
+that end without a return statement return zero, like in the other backends.
+'''
+
+__all__ = [
+    "build_program",
+    "build_function",
+]
+
+from typing import Dict, List
+
+from . import ast
+from . import ir
+from . import i64
+from . ast_utils import get_function_arities, get_local_names
+
+def build_program(program: ast.Program) -> ir.Program:
+    function_arities = get_function_arities(program)
+    return ir.Program([build_function(function, function_arities) for function in program.functions])
+
+def build_function(function: ast.Function, function_arities: Dict[str, int]) -> ir.Function:
+    return FunctionBuilder(function, function_arities).build()
+
+class FunctionBuilder:
+    def __init__(self, function: ast.Function, function_arities: Dict[str, int]):
+        self.function = function
+        self.function_arities = function_arities
+        self.local_names = set(get_local_names(function))
+
+        self.blocks: List[ir.Block] = []
+        self.predecessors: Dict[ir.Block, List[ir.Block]] = {}
+        self.sealed_blocks = set()
+        self.current_definitions: Dict[ir.Block, Dict[str, ir.Instruction]] = {}
+        self.incomplete_phis: Dict[ir.Block, Dict[str, ir.Phi]] = {}
+        self.replacements: Dict[ir.Instruction, ir.Instruction] = {}
+
+        self.block = self.new_block("entry")
+        self.seal_block(self.block)
+
+    def build(self) -> ir.Function:
+        for i, name in enumerate(self.function.arg_names):
+            self.write_variable(name, self.block, self.emit(ir.Argument(i)))
+        self.build_statement(self.function.stmt)
+        self.terminate(ir.Return(self.emit(ir.Const(0))))
+
+        function = ir.Function(self.function.name, list(self.function.arg_names), self.blocks)
+        ir.replace_values(function, self.replacements)
+        ir.remove_unreachable_blocks(function)
+        return function
+
+    def new_block(self, name: str) -> ir.Block:
+        block = ir.Block(f"{name}{len(self.blocks)}" if self.blocks else name)
+        self.blocks.append(block)
+        self.predecessors[block] = []
+        self.current_definitions[block] = {}
+        return block
+
+    def emit(self, instruction: ir.Instruction) -> ir.Instruction:
+        self.block.instructions.append(instruction)
+        return instruction
+
+    def terminate(self, terminator: ir.Terminator):
+        self.block.terminator = terminator
+        for successor in terminator.successors:
+            self.predecessors[successor].append(self.block)
+
+    def jump_to(self, block: ir.Block):
+        self.terminate(ir.Jump(block))
+        self.block = block
+
+    def start_unreachable_block(self):
+        # Statements after a return are still built, but the block is removed later.
+        self.block = self.new_block("unreachable")
+        self.seal_block(self.block)
+
+    # Statements
+    ###################################
+
+    def build_statement(self, stmt: ast.Statement):
+        if isinstance(stmt, ast.BlockStmt):
+            for sub_stmt in stmt.statements:
+                self.build_statement(sub_stmt)
+        elif isinstance(stmt, ast.ReturnStmt):
+            self.terminate(ir.Return(self.build_expression(stmt.expr)))
+            self.start_unreachable_block()
+        elif isinstance(stmt, ast.AssignmentStmt):
+            self.write_variable(stmt.name, self.block, self.build_expression(stmt.expr))
+        elif isinstance(stmt, ast.WhileStmt):
+            self.build_while(stmt)
+        elif isinstance(stmt, ast.IfStmt):
+            self.build_if(stmt.condition, stmt.then_stmt, None)
+        elif isinstance(stmt, ast.IfElseStmt):
+            self.build_if(stmt.condition, stmt.then_stmt, stmt.else_stmt)
+        else:
+            raise NotImplementedError(f"unknown statement: {type(stmt).__name__}")
+
+    def build_while(self, stmt: ast.WhileStmt):
+        header_block = self.new_block("while")
+        self.jump_to(header_block)
+        condition = self.build_expression(stmt.condition)
+
+        body_block = self.new_block("body")
+        end_block = self.new_block("end_while")
+        self.terminate(ir.Branch(condition, body_block, end_block))
+        self.seal_block(body_block)
+        self.seal_block(end_block)
+
+        self.block = body_block
+        self.build_statement(stmt.body_stmt)
+        self.terminate(ir.Jump(header_block))
+        self.seal_block(header_block)
+        self.block = end_block
+
+    def build_if(self, condition_expr: ast.Expression, then_stmt: ast.Statement, else_stmt):
+        condition = self.build_expression(condition_expr)
+        then_block = self.new_block("then")
+        else_block = self.new_block("else") if else_stmt is not None else None
+        end_block = self.new_block("end_if")
+        self.terminate(ir.Branch(condition, then_block, else_block or end_block))
+        self.seal_block(then_block)
+
+        self.block = then_block
+        self.build_statement(then_stmt)
+        self.terminate(ir.Jump(end_block))
+
+        if else_block is not None:
+            self.seal_block(else_block)
+            self.block = else_block
+            self.build_statement(else_stmt)
+            self.terminate(ir.Jump(end_block))
+
+        self.seal_block(end_block)
+        self.block = end_block
+
+    # Expressions
+    ###################################
+
+    def build_expression(self, expr: ast.Expression) -> ir.Instruction:
+        if isinstance(expr, ast.Int):
+            return self.emit(ir.Const(i64.wrap(expr.value)))
+        elif isinstance(expr, ast.Identifier):
+            return self.build_identifier(expr.name)
+        elif isinstance(expr, ast.InfixExpr):
+            left = self.build_expression(expr.left_expr)
+            right = self.build_expression(expr.right_expr)
+            if expr.operator not in i64.binary_operations:
+                raise NotImplementedError(f"unknown operator: {expr.operator}")
+            return self.emit(ir.BinaryOp(expr.operator, left, right))
+        elif isinstance(expr, ast.Call):
+            return self.build_call(expr)
+        else:
+            raise NotImplementedError(f"unknown expression: {type(expr).__name__}")
+
+    def build_identifier(self, name: str) -> ir.Instruction:
+        if name in self.local_names:
+            return self.read_variable(name, self.block)
+        elif name in self.function_arities:
+            return self.emit(ir.FunctionAddress(name))
+        else:
+            raise RuntimeError(f"unknown name: {name}")
+
+    def build_call(self, expr: ast.Call) -> ir.Instruction:
+        ptr_expr = expr.ptr_expr
+        if isinstance(ptr_expr, ast.Identifier) and ptr_expr.name not in self.local_names and ptr_expr.name in self.function_arities:
+            expected_arg_amount = self.function_arities[ptr_expr.name]
+            if expected_arg_amount != len(expr.args):
+                raise RuntimeError(f"{ptr_expr.name} expects {expected_arg_amount} arguments, got {len(expr.args)}")
+            target = ptr_expr.name
+        else:
+            target = self.build_expression(ptr_expr)
+        args = [self.build_expression(arg) for arg in expr.args]
+        return self.emit(ir.Call(target, args))
+
+    # Variables
+    ###################################
+
+    def write_variable(self, name: str, block: ir.Block, value: ir.Instruction):
+        self.current_definitions[block][name] = value
+
+    def read_variable(self, name: str, block: ir.Block) -> ir.Instruction:
+        value = self.current_definitions[block].get(name)
+        if value is None:
+            value = self.read_variable_recursive(name, block)
+        return self.resolve(value)
+
+    def read_variable_recursive(self, name: str, block: ir.Block) -> ir.Instruction:
+        predecessors = self.predecessors[block]
+        if block not in self.sealed_blocks:
+            value = self.new_phi(block)
+            self.incomplete_phis.setdefault(block, {})[name] = value
+        elif len(predecessors) == 0:
+            # Reached the entry or an unreachable block without finding an assignment.
+            value = ir.Const(0)
+            block.instructions.insert(len(block.phis), value)
+        elif len(predecessors) == 1:
+            value = self.read_variable(name, predecessors[0])
+        else:
+            phi = self.new_phi(block)
+            self.write_variable(name, block, phi)
+            value = self.add_phi_operands(name, phi, block)
+        self.write_variable(name, block, value)
+        return value
+
+    def new_phi(self, block: ir.Block) -> ir.Phi:
+        phi = ir.Phi()
+        block.instructions.insert(len(block.phis), phi)
+        return phi
+
+    def add_phi_operands(self, name: str, phi: ir.Phi, block: ir.Block) -> ir.Instruction:
+        for predecessor in self.predecessors[block]:
+            phi.incoming[predecessor] = self.read_variable(name, predecessor)
+        return self.try_remove_trivial_phi(phi)
+
+    def try_remove_trivial_phi(self, phi: ir.Phi) -> ir.Instruction:
+        same = None
+        for value in phi.incoming.values():
+            value = self.resolve(value)
+            if value is same or value is phi:
+                continue
+            if same is not None:
+                return phi
+            same = value
+        if same is None:
+            # The phi is only reachable from itself.
+            return phi
+        self.replacements[phi] = same
+        return same
+
+    def resolve(self, value: ir.Instruction) -> ir.Instruction:
+        while value in self.replacements:
+            value = self.replacements[value]
+        return value
+
+    def seal_block(self, block: ir.Block):
+        for name, phi in self.incomplete_phis.pop(block, {}).items():
+            self.add_phi_operands(name, phi, block)
+        self.sealed_blocks.add(block)
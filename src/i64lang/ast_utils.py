@@ -0,0 +1,140 @@
+'''
+Helpers to inspect ast trees.
+
+The generic walkers keep the nodes that are still to be visited on an explicit
+stack instead of recursing, so that trees of any depth can be traversed.
+'''
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from . import ast
+
+Result = TypeVar("Result")
+
+def get_function_arities(program: ast.Program) -> Dict[str, int]:
+    function_arities = {}
+    for function in program.functions:
+        if function.name in function_arities:
+            raise RuntimeError(f"function defined twice: {function.name}")
+        function_arities[function.name] = len(function.arg_names)
+    return function_arities
+
+def get_local_names(function: ast.Function) -> List[str]:
+    '''Arguments first, followed by all other assigned names in order of appearance.'''
+    names = list(dict.fromkeys(function.arg_names))
+    if len(names) != len(function.arg_names):
+        raise RuntimeError(f"duplicate argument name in {function.name}")
+    for stmt in iter_statements(function.stmt):
+        if isinstance(stmt, ast.AssignmentStmt) and stmt.name not in names:
+            names.append(stmt.name)
+    return names
+
+def iter_statements(stmt: ast.Statement) -> Iterator[ast.Statement]:
+    '''The statement and all statements nested in it.'''
+    return walk(stmt, statement_child_getters)
+
+def iter_expressions(stmt: ast.Statement) -> Iterator[ast.Expression]:
+    '''All expressions in the statement and its sub-statements, including nested ones.'''
+    for node in walk(stmt):
+        if isinstance(node, ast.Expression):
+            yield node
+
+def iter_subexpressions(expr: ast.Expression) -> Iterator[ast.Expression]:
+    return walk(expr)
+
+# Generic traversal
+###################################
+
+# Fields of every node type that hold child nodes, in the order of the code.
+# Fields that hold lists contribute all their elements.
+child_fields = {
+    ast.Program : ("functions",),
+    ast.Function : ("stmt",),
+    ast.BlockStmt : ("statements",),
+    ast.ReturnStmt : ("expr",),
+    ast.WhileStmt : ("condition", "body_stmt"),
+    ast.IfStmt : ("condition", "then_stmt"),
+    ast.IfElseStmt : ("condition", "then_stmt", "else_stmt"),
+    ast.AssignmentStmt : ("expr",),
+    ast.InfixExpr : ("left_expr", "right_expr"),
+    ast.Identifier : (),
+    ast.Int : (),
+    ast.Call : ("ptr_expr", "args"),
+}
+
+# Same children as in `child_fields`, as functions that return a list of them.
+child_getters = {
+    ast.Program : lambda node: node.functions,
+    ast.Function : lambda node: [node.stmt],
+    ast.BlockStmt : lambda node: node.statements,
+    ast.ReturnStmt : lambda node: [node.expr],
+    ast.WhileStmt : lambda node: [node.condition, node.body_stmt],
+    ast.IfStmt : lambda node: [node.condition, node.then_stmt],
+    ast.IfElseStmt : lambda node: [node.condition, node.then_stmt, node.else_stmt],
+    ast.AssignmentStmt : lambda node: [node.expr],
+    ast.InfixExpr : lambda node: [node.left_expr, node.right_expr],
+    ast.Identifier : lambda node: [],
+    ast.Int : lambda node: [],
+    ast.Call : lambda node: [node.ptr_expr] + node.args,
+}
+
+# Only the statements nested in statements.
+statement_child_getters = {
+    ast.BlockStmt : lambda node: node.statements,
+    ast.ReturnStmt : lambda node: [],
+    ast.WhileStmt : lambda node: [node.body_stmt],
+    ast.IfStmt : lambda node: [node.then_stmt],
+    ast.IfElseStmt : lambda node: [node.then_stmt, node.else_stmt],
+    ast.AssignmentStmt : lambda node: [],
+}
+
+def iter_children(node: ast.Node) -> Iterator[Tuple[str, ast.Node]]:
+    '''The direct children of the node together with the names of the fields they are in.'''
+    for field_name in child_fields[type(node)]:
+        value = getattr(node, field_name)
+        if isinstance(value, list):
+            for element in value:
+                yield field_name, element
+        else:
+            yield field_name, value
+
+def walk(root: ast.Node, getters: Dict[type, Callable[[ast.Node], List[ast.Node]]] = child_getters) -> Iterator[ast.Node]:
+    '''
+    All nodes of the tree in the order of the code, parents before their children.
+    The getters give the children of every type of node that is visited.
+    '''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = getters[type(node)](node)
+        if children:
+            stack.extend(reversed(children))
+
+def walk_edges(root: ast.Node) -> Iterator[Tuple[Optional[ast.Node], str, ast.Node]]:
+    '''Like `walk`, but yields every node together with its parent and the name of the field it is in.'''
+    stack = [(None, "", root)]
+    while stack:
+        edge = stack.pop()
+        yield edge
+        node = edge[2]
+        stack.extend(reversed([(node, field_name, child) for field_name, child in iter_children(node)]))
+
+def reduce_tree(root: ast.Node, combine: Callable[[ast.Node, List[Result]], Result]) -> Result:
+    '''
+    Calls `combine` for every node with the results for its children, children before their
+    parents. Returns the result for the root.
+    '''
+    # Every entry holds a node, its children and the results for the children that have been combined so far.
+    stack = [(root, child_getters[type(root)](root), [])]
+    while True:
+        node, children, results = stack[-1]
+        if len(results) < len(children):
+            child = children[len(results)]
+            stack.append((child, child_getters[type(child)](child), []))
+            continue
+        result = combine(node, results)
+        stack.pop()
+        if not stack:
+            return result
+        stack[-1][2].append(result)
@@ -0,0 +1,47 @@
+'''
+Gives access to all ways to execute a program under a common interface.
+Every backend turns an ast.Program into an object that has the functions of
+the program as attributes.
+'''
+
+__all__ = [
+    "get_backend_names",
+    "load_program",
+    "load_str",
+]
+
+from typing import List
+
+from . import ast
+
+def load_str(code: str, backend: str = "interpreter", fold_constants: bool = False):
+    from . parser import parse_str
+    return load_program(parse_str(code), backend, fold_constants)
+
+def load_program(program: ast.Program, backend: str = "interpreter", fold_constants: bool = False):
+    '''With `fold_constants`, constant subexpressions are evaluated before the program is loaded.'''
+    if fold_constants:
+        from . import ast_passes
+        program = ast_passes.fold_constants(program)
+
+    if backend == "interpreter":
+        from . interpreter import load_program
+    elif backend == "closures":
+        from . closure_compiler import load_program
+    elif backend == "jit":
+        from . jit import compile_program as load_program
+    elif backend == "optimizing_jit":
+        from . jit import compile_program
+        return compile_program(program, optimize=True)
+    else:
+        raise ValueError(f"unknown backend: {backend}")
+    return load_program(program)
+
+def get_backend_names() -> List[str]:
+    '''Names of the backends that can be used on this machine.'''
+    from . import jit
+    names = ["interpreter", "closures"]
+    if jit.is_supported():
+        names.append("jit")
+        names.append("optimizing_jit")
+    return names
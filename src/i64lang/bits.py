@@ -1,9 +1,25 @@
 from __future__ import annotations
 
 class Bits:
+    '''
+    Immutable bit vector stored as an integer value and a bit length.
+    The first bit (index 0) is the most significant one.
+    '''
+
+    __slots__ = ("value", "length")
+
     def __init__(self, bit_string: str):
         Bits.assert_str_is_bit_string(bit_string)
-        self.bit_string = bit_string
+        self.value = int(bit_string, base=2) if bit_string else 0
+        self.length = len(bit_string)
+
+    @staticmethod
+    def from_value(value: int, length: int) -> Bits:
+        assert 0 <= value < (1 << length)
+        bits = Bits.__new__(Bits)
+        bits.value = value
+        bits.length = length
+        return bits
 
     @staticmethod
     def assert_str_is_bit_string(text):
@@ -12,98 +28,116 @@ class Bits:
 
     @staticmethod
     def zeros(length) -> Bits:
-        return Bits("0" * length)
+        return Bits.from_value(0, length)
 
     @staticmethod
     def from_int(number: int, length=None):
         if length is None:
             if number >= 0:
-                return Bits(bin(number)[2:])
+                return Bits.from_value(number, max(number.bit_length(), 1))
             else:
                 raise Exception("length has to be given when using negative integers")
         else:
-            bit_string = int_to_bits(number, length)
-            return Bits(bit_string)
+            return Bits.from_value(int_to_unsigned(number, length), length)
 
     @staticmethod
     def from_hex(hex_string: str):
         if hex_string.startswith("0x"):
             hex_string = hex_string[2:]
         if len(hex_string) == 0:
-            return Bits("")
+            return Bits.zeros(0)
         number = int(hex_string, base=16)
         length = len(hex_string) * 4
-        return Bits.from_int(number, length)
+        return Bits.from_value(number, length)
 
     @staticmethod
     def from_hex_and_offset(hex_string: str, offset: int):
         return Bits.from_hex(hex(int(hex_string, base=16) + offset))
 
+    @staticmethod
+    def from_bytes(data: bytes):
+        return Bits.from_value(int.from_bytes(data, "big"), len(data) * 8)
+
     @staticmethod
     def join(*args):
-        return Bits("".join(b.bit_string for b in args))
+        value = 0
+        length = 0
+        for bits in args:
+            value = (value << bits.length) | bits.value
+            length += bits.length
+        return Bits.from_value(value, length)
 
     def reversed_bytes(self):
-        length = len(self)
-        assert length % 8 == 0
-        new_bit_string = ""
-        for i in range(length - 8, -1, -8):
-            new_bit_string += self.bit_string[i:i + 8]
-        return Bits(new_bit_string)
+        return Bits.from_bytes(self.to_bytes()[::-1])
+
+    def to_bytes(self) -> bytes:
+        return self.value.to_bytes(self.byte_len, "big")
 
     def to_bin(self):
-        return self.bit_string
+        if self.length == 0:
+            return ""
+        return format(self.value, "b").zfill(self.length)
 
     def to_hex(self):
-        assert len(self) % 4 == 0
-        return "".join(bin_to_hex_dict[bit_string] for bit_string in iter_sequence_parts(self.bit_string, 4))
+        assert self.length % 4 == 0
+        if self.length == 0:
+            return ""
+        return format(self.value, "X").zfill(self.length // 4)
 
     @property
     def byte_len(self):
-        assert len(self) % 8 == 0
-        return len(self) // 8
+        assert self.length % 8 == 0
+        return self.length // 8
 
     def __eq__(self, other):
         if isinstance(other, str):
-            return self.bit_string == other.replace(" ", "")
+            return self.to_bin() == other.replace(" ", "")
         elif isinstance(other, Bits):
-            return self.bit_string == other.bit_string
+            return self.value == other.value and self.length == other.length
         else:
             raise Exception("cannot compare")
 
+    def __hash__(self):
+        return hash((self.value, self.length))
+
     def __add__(self, other):
-        return Bits(self.bit_string + other.bit_string)
+        return Bits.from_value((self.value << other.length) | other.value, self.length + other.length)
 
     def __len__(self):
-        return len(self.bit_string)
+        return self.length
 
     def __getitem__(self, index_or_slice):
-        return Bits(self.bit_string[index_or_slice])
+        if isinstance(index_or_slice, slice):
+            start, stop, step = index_or_slice.indices(self.length)
+            if step != 1:
+                return Bits(self.to_bin()[index_or_slice])
+            length = max(stop - start, 0)
+            value = (self.value >> (self.length - start - length)) & ((1 << length) - 1)
+            return Bits.from_value(value, length)
+        else:
+            index = index_or_slice
+            if index < 0:
+                index += self.length
+            if not 0 <= index < self.length:
+                raise IndexError("bit index out of range")
+            return Bits.from_value((self.value >> (self.length - index - 1)) & 1, 1)
 
     def __repr__(self):
         text = "0x" + self.to_hex() if len(self) % 4 == 0 else self.to_bin()
         return f"<Bits: {text}>"
 
     def __int__(self):
-        return int(self.bit_string, base=2)
+        return self.value
 
 
-def int_to_bits(number: int, length: int):
-    if number < 0:
-        result = complement(bin(abs(number) - 1)[2:]).rjust(length, "1")
+def int_to_unsigned(number: int, length: int):
+    if number >= 0:
+        fits = number < (1 << length)
     else:
-        result = bin(number)[2:].rjust(length, "0")
-    if len(result) > length:
+        fits = length > 0 and number >= -(1 << (length - 1))
+    if not fits:
         raise Exception("number requires more bits than specified by length")
-    return result
+    return number & ((1 << length) - 1)
 
-def complement(bit_string: str):
-    return "".join(complement_dict[c] for c in bit_string)
-
-def iter_sequence_parts(sequence, part_length):
-    assert len(sequence) % part_length == 0
-    for i in range(0, len(sequence), part_length):
-        yield sequence[i:i + part_length]
-
-complement_dict = {"0" : "1", "1" : "0"}
-bin_to_hex_dict = {bin(i)[2:].zfill(4) : hex(i)[2:].upper() for i in range(16)}
+def int_to_bits(number: int, length: int):
+    return Bits.from_int(number, length).to_bin()
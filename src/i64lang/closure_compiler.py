@@ -0,0 +1,248 @@
+'''
+Compiles the ast into nested Python closures.
+
+Every node is translated once into a closure that takes the frame of the
+current call, so that executing the program does not dispatch on node types
+anymore. Local variables are stored in a list and accessed by their index.
+This is the fastest backend that does not need executable memory, the
+semantics are the same as the ones of the interpreter.
+'''
+
+__all__ = [
+    "ClosureFunction",
+    "ClosureProgram",
+    "compile_program",
+    "load_program",
+]
+
+from typing import Callable, Dict, List, Optional
+
+from . import ast
+from . import i64
+from . ast_utils import get_function_arities, get_local_names
+from . interpreter import raised_recursion_limit
+
+Frame = List
+ExpressionClosure = Callable[[Frame], int]
+StatementClosure = Callable[[Frame], Optional[int]]
+
+MASK = 0xffffffffffffffff
+OFFSET = 2**63
+
+def load_program(program: ast.Program) -> "ClosureProgram":
+    return compile_program(program)
+
+def compile_program(program: ast.Program) -> "ClosureProgram":
+    get_function_arities(program)
+    functions = {function.name : ClosureFunction(function) for function in program.functions}
+    for function in program.functions:
+        if ast.is_function_loaded(function):
+            functions[function.name].compile(function, functions)
+        else:
+            functions[function.name].compile_on_first_call(function, functions)
+    return ClosureProgram(functions)
+
+def raise_operand_error(operator: str):
+    raise RuntimeError(f"operator {operator} expects integers")
+
+class ClosureProgram:
+    def __init__(self, functions: Dict[str, "ClosureFunction"]):
+        self.functions = functions
+
+    def call(self, name: str, *args: int) -> int:
+        return self.functions[name](*args)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["functions"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+class ClosureFunction:
+    def __init__(self, function: ast.Function):
+        self.name = function.name
+        self.arity = len(function.arg_names)
+        self.zero_locals: List[int] = []
+        self.body: StatementClosure = None
+
+    def compile(self, function: ast.Function, functions: Dict[str, "ClosureFunction"]):
+        local_names = get_local_names(function)
+        self.zero_locals = [0] * (len(local_names) - self.arity)
+        compiler = FunctionCompiler({name : i for i, name in enumerate(local_names)}, functions)
+        self.body = compiler.compile_statement(function.stmt)
+
+    def compile_on_first_call(self, function: ast.Function, functions: Dict[str, "ClosureFunction"]):
+        '''For functions whose body hasn't been parsed yet, which is only done when they are called.'''
+        def compile_and_run(frame: Frame) -> Optional[int]:
+            self.compile(function, functions)
+            return self.body(frame + self.zero_locals)
+        self.body = compile_and_run
+
+    def __call__(self, *args: int) -> int:
+        if len(args) != self.arity:
+            raise RuntimeError(f"{self.name} expects {self.arity} arguments, got {len(args)}")
+        with raised_recursion_limit():
+            return self.invoke([i64.wrap(arg) for arg in args])
+
+    def invoke(self, args: List[int]) -> int:
+        result = self.body(args + self.zero_locals)
+        return 0 if result is None else result
+
+    def __repr__(self):
+        return f"<ClosureFunction {self.name}>"
+
+class FunctionCompiler:
+    def __init__(self, slots: Dict[str, int], functions: Dict[str, ClosureFunction]):
+        self.slots = slots
+        self.functions = functions
+
+        self.statement_compilers = {
+            ast.BlockStmt : self.compile_block,
+            ast.ReturnStmt : self.compile_return,
+            ast.AssignmentStmt : self.compile_assignment,
+            ast.WhileStmt : self.compile_while,
+            ast.IfStmt : self.compile_if,
+            ast.IfElseStmt : self.compile_if_else,
+        }
+        self.expression_compilers = {
+            ast.Int : self.compile_int,
+            ast.Identifier : self.compile_identifier,
+            ast.InfixExpr : self.compile_infix,
+            ast.Call : self.compile_call,
+        }
+
+    def compile_statement(self, stmt: ast.Statement) -> StatementClosure:
+        return self.statement_compilers[type(stmt)](stmt)
+
+    def compile_block(self, stmt: ast.BlockStmt) -> StatementClosure:
+        statements = tuple(self.compile_statement(sub_stmt) for sub_stmt in stmt.statements)
+
+        def block(frame):
+            for statement in statements:
+                result = statement(frame)
+                if result is not None:
+                    return result
+            return None
+        return block
+
+    def compile_return(self, stmt: ast.ReturnStmt) -> StatementClosure:
+        return self.compile_expression(stmt.expr)
+
+    def compile_assignment(self, stmt: ast.AssignmentStmt) -> StatementClosure:
+        index = self.slots[stmt.name]
+        expr = self.compile_expression(stmt.expr)
+
+        def assignment(frame):
+            frame[index] = expr(frame)
+        return assignment
+
+    def compile_while(self, stmt: ast.WhileStmt) -> StatementClosure:
+        condition = self.compile_expression(stmt.condition)
+        body = self.compile_statement(stmt.body_stmt)
+
+        def while_loop(frame):
+            while condition(frame):
+                result = body(frame)
+                if result is not None:
+                    return result
+            return None
+        return while_loop
+
+    def compile_if(self, stmt: ast.IfStmt) -> StatementClosure:
+        condition = self.compile_expression(stmt.condition)
+        then_stmt = self.compile_statement(stmt.then_stmt)
+
+        def if_then(frame):
+            if condition(frame):
+                return then_stmt(frame)
+            return None
+        return if_then
+
+    def compile_if_else(self, stmt: ast.IfElseStmt) -> StatementClosure:
+        condition = self.compile_expression(stmt.condition)
+        then_stmt = self.compile_statement(stmt.then_stmt)
+        else_stmt = self.compile_statement(stmt.else_stmt)
+
+        def if_then_else(frame):
+            if condition(frame):
+                return then_stmt(frame)
+            return else_stmt(frame)
+        return if_then_else
+
+    def compile_expression(self, expr: ast.Expression) -> ExpressionClosure:
+        return self.expression_compilers[type(expr)](expr)
+
+    def compile_int(self, expr: ast.Int) -> ExpressionClosure:
+        value = i64.wrap(expr.value)
+        return lambda frame: value
+
+    def compile_identifier(self, expr: ast.Identifier) -> ExpressionClosure:
+        if expr.name in self.slots:
+            index = self.slots[expr.name]
+            return lambda frame: frame[index]
+        elif expr.name in self.functions:
+            function = self.functions[expr.name]
+            return lambda frame: function
+        else:
+            raise RuntimeError(f"unknown name: {expr.name}")
+
+    def compile_infix(self, expr: ast.InfixExpr) -> ExpressionClosure:
+        left = self.compile_expression(expr.left_expr)
+        right = self.compile_expression(expr.right_expr)
+        operator = expr.operator
+
+        # The common operators are inlined to avoid another function call. Values are ints or
+        # functions, like in the interpreter both operands are evaluated before their types are checked.
+        if operator == "+":
+            return lambda frame: ((a + b + OFFSET) & MASK) - OFFSET \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("+")
+        elif operator == "-":
+            return lambda frame: ((a - b + OFFSET) & MASK) - OFFSET \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("-")
+        elif operator == "*":
+            return lambda frame: ((a * b + OFFSET) & MASK) - OFFSET \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("*")
+        elif operator == "<":
+            return lambda frame: (1 if a < b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("<")
+        elif operator == ">":
+            return lambda frame: (1 if a > b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error(">")
+        elif operator == "<=":
+            return lambda frame: (1 if a <= b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("<=")
+        elif operator == ">=":
+            return lambda frame: (1 if a >= b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error(">=")
+        elif operator == "==":
+            return lambda frame: (1 if a == b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("==")
+        elif operator == "!=":
+            return lambda frame: (1 if a != b else 0) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error("!=")
+        else:
+            operation = i64.binary_operations[operator]
+            return lambda frame: operation(a, b) \
+                if (a := left(frame)).__class__ is (b := right(frame)).__class__ is int else raise_operand_error(operator)
+
+    def compile_call(self, expr: ast.Call) -> ExpressionClosure:
+        args = tuple(self.compile_expression(arg) for arg in expr.args)
+        arg_amount = len(args)
+
+        ptr_expr = expr.ptr_expr
+        if isinstance(ptr_expr, ast.Identifier) and ptr_expr.name not in self.slots and ptr_expr.name in self.functions:
+            function = self.functions[ptr_expr.name]
+            if function.arity != arg_amount:
+                raise RuntimeError(f"{function.name} expects {function.arity} arguments, got {arg_amount}")
+            return lambda frame: function.invoke([arg(frame) for arg in args])
+
+        target = self.compile_expression(ptr_expr)
+
+        def indirect_call(frame):
+            function = target(frame)
+            if not isinstance(function, ClosureFunction):
+                raise RuntimeError("only functions can be called")
+            if function.arity != arg_amount:
+                raise RuntimeError(f"{function.name} expects {function.arity} arguments, got {arg_amount}")
+            return function.invoke([arg(frame) for arg in args])
+        return indirect_call
@@ -30,13 +30,39 @@ class CodeStream:
         return char
 
     def consume_while(self, predicate: Callable[[str], bool]):
-        consumed_chars = ""
+        start = self.position
+        end = start
+        while end < len(self.code) and predicate(self.code[end]):
+            end += 1
+        self.position = end
+        return self.code[start:end]
 
-        while next_char := self.try_peek_next():
-            if predicate(next_char):
-                consumed_chars += next_char
-                self.consume_next()
-            else:
-                break
+class ByteCodeStream(CodeStream):
+    '''
+    Same interface as `CodeStream`, but the code is ASCII encoded in a bytes-like object,
+    e.g. an mmap of a file. Positions are byte offsets, only the returned parts are decoded.
+    '''
 
-        return consumed_chars
+    def try_peek_next(self) -> Optional[str]:
+        if self.position < len(self.code):
+            return chr(self.code[self.position])
+        else:
+            return None
+
+    def next_is(self, text: str):
+        return self.code[self.position:self.position + len(text)] == text.encode("ascii")
+
+    def consume_next(self) -> str:
+        assert self.position < len(self.code)
+
+        char = chr(self.code[self.position])
+        self.position += 1
+        return char
+
+    def consume_while(self, predicate: Callable[[str], bool]):
+        start = self.position
+        end = start
+        while end < len(self.code) and predicate(chr(self.code[end])):
+            end += 1
+        self.position = end
+        return self.code[start:end].decode("ascii")
@@ -0,0 +1,259 @@
+'''
+Lowers the ast to x64 instructions.
+
+Every local variable lives in a stack slot relative to rbp. Expressions are
+evaluated into rax, intermediate values are kept on the stack. Functions
+follow the System V calling convention: the first six arguments are passed
+in registers, the remaining ones on the stack, the result is returned in rax.
+
+Variables that are read before they are assigned are zero. Functions that
+end without a return statement return zero. A division by zero jumps to the
+error code of the `runtime`.
+'''
+
+__all__ = [
+    "generate_program",
+    "generate_function",
+]
+
+from typing import Dict, List
+
+from . import ast
+from . import i64
+from . import x64
+from . ast_utils import get_function_arities, get_local_names
+from . runtime import DIVISION_ERROR_LABEL
+
+argument_registers = [x64.rdi, x64.rsi, x64.rdx, x64.rcx, x64.r8, x64.r9]
+
+def generate_program(program: ast.Program) -> List[x64.Instruction]:
+    function_arities = get_function_arities(program)
+    instructions = []
+    for function in program.functions:
+        instructions.extend(generate_function(function, function_arities))
+    return instructions
+
+def generate_function(function: ast.Function, function_arities: Dict[str, int]) -> List[x64.Instruction]:
+    return FunctionGenerator(function, function_arities).generate()
+
+class FunctionGenerator:
+    def __init__(self, function: ast.Function, function_arities: Dict[str, int]):
+        self.function = function
+        self.function_arities = function_arities
+        self.instructions: List[x64.Instruction] = []
+        self.slot_offsets = {name : -8 * (i + 1) for i, name in enumerate(get_local_names(function))}
+        self.label_counter = 0
+        self.epilogue_label = self.new_label("epilogue")
+
+        # Number of values pushed onto the stack since the end of the prologue.
+        self.stack_depth = 0
+
+    def generate(self) -> List[x64.Instruction]:
+        self.generate_prologue()
+        self.generate_statement(self.function.stmt)
+        self.emit(x64.MovImmToReg(x64.rax, 0))
+        self.generate_epilogue()
+        return self.instructions
+
+    def emit(self, instruction: x64.Instruction):
+        self.instructions.append(instruction)
+
+    def new_label(self, name: str) -> str:
+        # Function names cannot contain dots, so these labels do not collide with them.
+        self.label_counter += 1
+        return f"{self.function.name}.{name}{self.label_counter}"
+
+    def push(self, reg: x64.Register):
+        self.emit(x64.Push(reg))
+        self.stack_depth += 1
+
+    def pop(self, reg: x64.Register):
+        self.emit(x64.Pop(reg))
+        self.stack_depth -= 1
+
+    def generate_prologue(self):
+        self.emit(x64.Label(self.function.name))
+        self.emit(x64.Push(x64.rbp))
+        self.emit(x64.MovRegToReg(x64.rbp, x64.rsp))
+
+        frame_size = 8 * len(self.slot_offsets)
+        frame_size += -frame_size % 16
+        if frame_size > 0:
+            self.emit(x64.SubImmFromReg(x64.rsp, frame_size))
+
+        for i, name in enumerate(self.function.arg_names):
+            if i < len(argument_registers):
+                self.emit(x64.MovRegToMem(x64.rbp, argument_registers[i], self.slot_offsets[name]))
+            else:
+                # Skip the saved rbp and the return address.
+                stack_offset = 16 + 8 * (i - len(argument_registers))
+                self.emit(x64.MovMemToReg(x64.rax, x64.rbp, stack_offset))
+                self.emit(x64.MovRegToMem(x64.rbp, x64.rax, self.slot_offsets[name]))
+
+        local_names = list(self.slot_offsets)[len(self.function.arg_names):]
+        if local_names:
+            self.emit(x64.MovImmToReg(x64.rax, 0))
+        for name in local_names:
+            self.emit(x64.MovRegToMem(x64.rbp, x64.rax, self.slot_offsets[name]))
+
+    def generate_epilogue(self):
+        self.emit(x64.Label(self.epilogue_label))
+        self.emit(x64.MovRegToReg(x64.rsp, x64.rbp))
+        self.emit(x64.Pop(x64.rbp))
+        self.emit(x64.Return())
+
+    def generate_statement(self, stmt: ast.Statement):
+        if isinstance(stmt, ast.BlockStmt):
+            for sub_stmt in stmt.statements:
+                self.generate_statement(sub_stmt)
+        elif isinstance(stmt, ast.ReturnStmt):
+            self.generate_expression(stmt.expr)
+            self.emit(x64.Jump(self.epilogue_label))
+        elif isinstance(stmt, ast.AssignmentStmt):
+            self.generate_expression(stmt.expr)
+            self.emit(x64.MovRegToMem(x64.rbp, x64.rax, self.slot_offsets[stmt.name]))
+        elif isinstance(stmt, ast.WhileStmt):
+            start_label = self.new_label("while")
+            end_label = self.new_label("end_while")
+            self.emit(x64.Label(start_label))
+            self.generate_condition_jump(stmt.condition, end_label)
+            self.generate_statement(stmt.body_stmt)
+            self.emit(x64.Jump(start_label))
+            self.emit(x64.Label(end_label))
+        elif isinstance(stmt, ast.IfStmt):
+            end_label = self.new_label("end_if")
+            self.generate_condition_jump(stmt.condition, end_label)
+            self.generate_statement(stmt.then_stmt)
+            self.emit(x64.Label(end_label))
+        elif isinstance(stmt, ast.IfElseStmt):
+            else_label = self.new_label("else")
+            end_label = self.new_label("end_if")
+            self.generate_condition_jump(stmt.condition, else_label)
+            self.generate_statement(stmt.then_stmt)
+            self.emit(x64.Jump(end_label))
+            self.emit(x64.Label(else_label))
+            self.generate_statement(stmt.else_stmt)
+            self.emit(x64.Label(end_label))
+        else:
+            raise NotImplementedError(f"unknown statement: {type(stmt).__name__}")
+
+    def generate_condition_jump(self, condition: ast.Expression, false_label: str):
+        self.generate_expression(condition)
+        self.emit(x64.TestRegs(x64.rax, x64.rax))
+        self.emit(x64.JumpIfEqual(false_label))
+
+    def generate_expression(self, expr: ast.Expression):
+        '''Generates code that leaves the value of the expression in rax.'''
+        if isinstance(expr, ast.Int):
+            self.emit(x64.MovImmToReg(x64.rax, i64.wrap(expr.value)))
+        elif isinstance(expr, ast.Identifier):
+            self.generate_identifier(expr.name)
+        elif isinstance(expr, ast.InfixExpr):
+            self.generate_infix_expression(expr)
+        elif isinstance(expr, ast.Call):
+            self.generate_call(expr)
+        else:
+            raise NotImplementedError(f"unknown expression: {type(expr).__name__}")
+
+    def generate_identifier(self, name: str):
+        if name in self.slot_offsets:
+            self.emit(x64.MovMemToReg(x64.rax, x64.rbp, self.slot_offsets[name]))
+        elif name in self.function_arities:
+            self.emit(x64.LoadLabelAddress(x64.rax, name))
+        else:
+            raise RuntimeError(f"unknown name: {name}")
+
+    def generate_infix_expression(self, expr: ast.InfixExpr):
+        self.generate_expression(expr.left_expr)
+        self.push(x64.rax)
+        self.generate_expression(expr.right_expr)
+        self.emit(x64.MovRegToReg(x64.rcx, x64.rax))
+        self.pop(x64.rax)
+
+        operator = expr.operator
+        if operator in simple_operator_instructions:
+            self.emit(simple_operator_instructions[operator](x64.rax, x64.rcx))
+        elif operator == "/":
+            self.generate_division()
+        elif operator in comparison_instructions:
+            self.emit(x64.Compare(x64.rax, x64.rcx))
+            self.emit(comparison_instructions[operator](x64.rax))
+        else:
+            raise NotImplementedError(f"unknown operator: {operator}")
+
+    def generate_division(self):
+        '''
+        Divides rax by rcx. idiv traps on a zero divisor and on the overflow of -2**63 / -1,
+        so a zero divisor is reported by the runtime and -1 negates, which wraps.
+        '''
+        divide_label = self.new_label("divide")
+        end_label = self.new_label("end_divide")
+        self.emit(x64.TestRegs(x64.rcx, x64.rcx))
+        self.emit(x64.JumpIfEqual(DIVISION_ERROR_LABEL))
+        self.emit(x64.MovImmToReg(x64.rdx, -1))
+        self.emit(x64.Compare(x64.rcx, x64.rdx))
+        self.emit(x64.JumpIfNotEqual(divide_label))
+        self.emit(x64.Negate(x64.rax))
+        self.emit(x64.Jump(end_label))
+        self.emit(x64.Label(divide_label))
+        self.emit(x64.SignExtendRaxToRdx())
+        self.emit(x64.SignedDivide(x64.rcx))
+        self.emit(x64.Label(end_label))
+
+    def generate_call(self, expr: ast.Call):
+        direct_target = self.get_direct_call_target(expr)
+
+        # Keep the stack 16 byte aligned at the call as required by the calling convention.
+        stack_arg_amount = max(len(expr.args) - len(argument_registers), 0)
+        padding = 8 * ((self.stack_depth + stack_arg_amount) % 2)
+        if padding:
+            self.emit(x64.SubImmFromReg(x64.rsp, padding))
+        # Calls in the arguments align the stack with the padding included.
+        self.stack_depth += padding // 8
+
+        # Arguments are evaluated from right to left, so that the
+        # stack arguments end up in the right order.
+        for arg in reversed(expr.args):
+            self.generate_expression(arg)
+            self.push(x64.rax)
+
+        if direct_target is None:
+            self.generate_expression(expr.ptr_expr)
+        for reg in argument_registers[:len(expr.args)]:
+            self.pop(reg)
+
+        if direct_target is None:
+            self.emit(x64.CallReg(x64.rax))
+        else:
+            self.emit(x64.CallLabel(direct_target))
+
+        cleanup_size = 8 * stack_arg_amount + padding
+        self.stack_depth -= stack_arg_amount + padding // 8
+        if cleanup_size > 0:
+            self.emit(x64.AddImmToReg(x64.rsp, cleanup_size))
+
+    def get_direct_call_target(self, expr: ast.Call):
+        if not isinstance(expr.ptr_expr, ast.Identifier):
+            return None
+        name = expr.ptr_expr.name
+        if name in self.slot_offsets or name not in self.function_arities:
+            return None
+        expected_arg_amount = self.function_arities[name]
+        if expected_arg_amount != len(expr.args):
+            raise RuntimeError(f"{name} expects {expected_arg_amount} arguments, got {len(expr.args)}")
+        return name
+
+simple_operator_instructions = {
+    "+" : x64.AddRegToReg,
+    "-" : x64.SubRegFromReg,
+    "*" : x64.SignedMultiply,
+}
+
+comparison_instructions = {
+    "==" : x64.SetIfEqual,
+    "!=" : x64.SetIfNotEqual,
+    "<" : x64.SetIfLess,
+    ">" : x64.SetIfGreater,
+    "<=" : x64.SetIfLessOrEqual,
+    ">=" : x64.SetIfGreaterOrEqual,
+}
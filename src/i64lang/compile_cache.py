@@ -0,0 +1,167 @@
+'''
+Keeps compiled programs on disk, so that a process that compiles the same
+code again skips lexing, parsing and code generation.
+
+Entries are addressed by a hash of the code, the options and the version of
+the compiler, which is a hash of the source of this package. An entry holds
+the flat ast of the program, the arities of its functions and the object
+code, which is already linked to the runtime. Entries are pickled, so the directory must only be writable by
+trusted users.
+
+Several processes can share a directory. Entries are written to a temporary
+file that is renamed into place, so readers see either a complete entry or
+none. Unreadable entries are treated as missing. Reading an entry updates its
+modification time, and after every write the least recently used entries are
+removed until the directory is below its size limit.
+'''
+
+__all__ = [
+    "CacheEntry",
+    "CompileCache",
+    "get_compiler_version",
+]
+
+import os
+import time
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from . import ast
+from . assembler import ObjectCode
+from . ast_utils import get_function_arities
+from . flat_ast import FlatAst, flatten
+from . jit import CodePool, CompiledProgram, assemble_functions, link_runtime, load_object_code
+
+ENTRY_SUFFIX = ".entry"
+TEMPORARY_SUFFIX = ".tmp"
+
+class CacheEntry:
+    def __init__(self, flat_ast: FlatAst, function_arities: Dict[str, int], obj: ObjectCode):
+        self.flat_ast = flat_ast
+        self.function_arities = function_arities
+        self.obj = obj
+
+    def get_program(self) -> ast.Program:
+        return self.flat_ast.to_node()
+
+class CompileCache:
+    def __init__(self, directory: Union[str, os.PathLike], max_size: int = 256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def compile_file(self, path: Union[str, os.PathLike], pool: Optional[CodePool] = None,
+                     optimize: bool = False) -> CompiledProgram:
+        return self.compile_str(Path(path).read_bytes().decode("utf-8"), pool, optimize)
+
+    def compile_str(self, code: str, pool: Optional[CodePool] = None, optimize: bool = False) -> CompiledProgram:
+        entry = self.get_entry(code, optimize)
+        return load_object_code(entry.function_arities, entry.obj, pool)
+
+    def get_entry(self, code: str, optimize: bool = False) -> CacheEntry:
+        '''The entry for the code, which is compiled and stored first if it isn't cached.'''
+        key = get_key(code, optimize)
+        entry = self.load(key)
+        if entry is None:
+            entry = compile_entry(code, optimize)
+            self.store(key, entry)
+        return entry
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / (key + ENTRY_SUFFIX)
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            entry = None
+        if not isinstance(entry, CacheEntry):
+            # Entries are only replaced by renaming, an unreadable one doesn't come from a cache and is removed.
+            remove_file(path)
+            return None
+        try:
+            # Marks the entry as recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def store(self, key: str, entry: CacheEntry):
+        file_descriptor, temporary_path = tempfile.mkstemp(suffix=TEMPORARY_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self.get_path(key))
+        except BaseException:
+            remove_file(Path(temporary_path))
+            raise
+        self.evict()
+
+    def evict(self):
+        '''Removes the least recently used entries until the entries fit into the size limit.'''
+        entries = []
+        now = time.time()
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.suffix == ENTRY_SUFFIX:
+                entries.append((stat.st_mtime, stat.st_size, path))
+            elif path.suffix == TEMPORARY_SUFFIX and now - stat.st_mtime > 60 * 60:
+                # Left behind by a process that died while writing.
+                remove_file(path)
+
+        total_size = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            remove_file(path)
+            total_size -= size
+
+    def clear(self):
+        for path in self.directory.glob("*" + ENTRY_SUFFIX):
+            remove_file(path)
+
+def compile_entry(code: str, optimize: bool) -> CacheEntry:
+    from . parser import parse_str
+    program = parse_str(code)
+    function_arities = get_function_arities(program)
+    obj = link_runtime(assemble_functions(program.functions, function_arities, optimize))
+    return CacheEntry(flatten(program), function_arities, obj)
+
+def get_key(code: str, optimize: bool) -> str:
+    digest = hashlib.sha256(get_compiler_version().encode())
+    digest.update(b"optimize" if optimize else b"")
+    digest.update(b"\0")
+    digest.update(code.encode("utf-8"))
+    return digest.hexdigest()
+
+_compiler_version = None
+
+def get_compiler_version() -> str:
+    '''Hash of the modules of this package, so that every change of the compiler invalidates the cache.'''
+    global _compiler_version
+    if _compiler_version is None:
+        digest = hashlib.sha256()
+        package_directory = Path(__file__).parent
+        for path in sorted(package_directory.glob("*.py")):
+            if not path.name.startswith("test_"):
+                digest.update(path.name.encode() + b"\0")
+                digest.update(path.read_bytes())
+        _compiler_version = digest.hexdigest()
+    return _compiler_version
+
+def remove_file(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
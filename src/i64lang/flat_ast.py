@@ -0,0 +1,143 @@
+'''
+Stores an ast as parallel arrays instead of one object per node.
+
+Nodes are numbered so that children come before their parents, the root is
+the last node. Arrays hold a few bytes per node and are pickled as a whole,
+which makes the flat form cheap to keep in memory and to send to other
+processes. `flatten` and `FlatAst.to_node` convert between both forms.
+'''
+
+__all__ = [
+    "FlatAst",
+    "flatten",
+]
+
+from array import array
+from typing import Dict, List, Optional
+
+from . import ast
+from . ast_utils import reduce_tree
+from . names import NameTable
+from . spans import Span
+
+class FlatAst:
+    '''
+    `kinds` gives the type of every node. For functions, assignments and identifiers the
+    value is an id in `name_table`, for infix expressions an index into `operators` and
+    for integers the value itself. Integers that don't fit into 64 bits are stored in
+    `big_ints` and referenced by index. The children of node i are
+    `children[child_starts[i]:child_starts[i + 1]]`, in the order of the code.
+    '''
+
+    PROGRAM = 0
+    FUNCTION = 1
+    BLOCK = 2
+    RETURN = 3
+    WHILE = 4
+    IF = 5
+    IF_ELSE = 6
+    ASSIGNMENT = 7
+    INFIX = 8
+    IDENTIFIER = 9
+    INT = 10
+    BIG_INT = 11
+    CALL = 12
+
+    operators = ["+", "-", "*", "/", "==", "!=", "<", ">", "<=", ">="]
+    operator_ids = {operator : i for i, operator in enumerate(operators)}
+
+    def __init__(self):
+        self.kinds = array("b")
+        self.values = array("q")
+        self.child_starts = array("i", [0])
+        self.children = array("i")
+        # Spans of nodes without one are (-1, -1).
+        self.span_starts = array("q")
+        self.span_ends = array("q")
+        self.name_table = NameTable()
+        self.big_ints: List[int] = []
+        # Ids of the argument names of every function node.
+        self.arg_names: Dict[int, List[int]] = {}
+
+    def add_node(self, kind: int, value: int, children: List[int], span: Optional[Span]) -> int:
+        self.kinds.append(kind)
+        self.values.append(value)
+        self.children.extend(children)
+        self.child_starts.append(len(self.children))
+        start, end = span if span is not None else (-1, -1)
+        self.span_starts.append(start)
+        self.span_ends.append(end)
+        return len(self.kinds) - 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self) -> int:
+        return len(self.kinds) - 1
+
+    def get_children(self, index: int) -> array:
+        return self.children[self.child_starts[index]:self.child_starts[index + 1]]
+
+    def get_span(self, index: int) -> Optional[Span]:
+        start = self.span_starts[index]
+        return None if start < 0 else (start, self.span_ends[index])
+
+    def to_node(self) -> ast.Node:
+        '''Builds the nodes of the tree, every child before its parent.'''
+        nodes = []
+        for index in range(len(self.kinds)):
+            children = [nodes[child] for child in self.get_children(index)]
+            nodes.append(node_builders[self.kinds[index]](self, index, children))
+        return nodes[-1]
+
+def flatten(root: ast.Node) -> FlatAst:
+    flat = FlatAst()
+    reduce_tree(root, lambda node, children: node_flatteners[type(node)](flat, node, children))
+    return flat
+
+def flatten_int(flat: FlatAst, node: ast.Int, children: List[int]) -> int:
+    if -2**63 <= node.value < 2**63:
+        return flat.add_node(FlatAst.INT, node.value, children, node.span)
+    flat.big_ints.append(node.value)
+    return flat.add_node(FlatAst.BIG_INT, len(flat.big_ints) - 1, children, node.span)
+
+def flatten_function(flat: FlatAst, node: ast.Function, children: List[int]) -> int:
+    index = flat.add_node(FlatAst.FUNCTION, flat.name_table.intern(node.name), children, node.span)
+    flat.arg_names[index] = [flat.name_table.intern(name) for name in node.arg_names]
+    return index
+
+# Adds a node to the flat ast, given the indices of its children, and returns its index.
+node_flatteners = {
+    ast.Program : lambda flat, node, children: flat.add_node(FlatAst.PROGRAM, 0, children, None),
+    ast.Function : flatten_function,
+    ast.BlockStmt : lambda flat, node, children: flat.add_node(FlatAst.BLOCK, 0, children, node.span),
+    ast.ReturnStmt : lambda flat, node, children: flat.add_node(FlatAst.RETURN, 0, children, node.span),
+    ast.WhileStmt : lambda flat, node, children: flat.add_node(FlatAst.WHILE, 0, children, node.span),
+    ast.IfStmt : lambda flat, node, children: flat.add_node(FlatAst.IF, 0, children, node.span),
+    ast.IfElseStmt : lambda flat, node, children: flat.add_node(FlatAst.IF_ELSE, 0, children, node.span),
+    ast.AssignmentStmt : lambda flat, node, children: flat.add_node(FlatAst.ASSIGNMENT, flat.name_table.intern(node.name), children, node.span),
+    ast.InfixExpr : lambda flat, node, children: flat.add_node(FlatAst.INFIX, FlatAst.operator_ids[node.operator], children, node.span),
+    ast.Identifier : lambda flat, node, children: flat.add_node(FlatAst.IDENTIFIER, flat.name_table.intern(node.name), children, node.span),
+    ast.Int : flatten_int,
+    ast.Call : lambda flat, node, children: flat.add_node(FlatAst.CALL, 0, children, node.span),
+}
+
+# Builds the node with the given index, given its already built children.
+node_builders = {
+    FlatAst.PROGRAM : lambda flat, i, children: ast.Program(children),
+    FlatAst.FUNCTION : lambda flat, i, children: ast.Function(
+        flat.name_table.names[flat.values[i]], [flat.name_table.names[name_id] for name_id in flat.arg_names[i]], children[0], flat.get_span(i)),
+    FlatAst.BLOCK : lambda flat, i, children: ast.BlockStmt(children, flat.get_span(i)),
+    FlatAst.RETURN : lambda flat, i, children: ast.ReturnStmt(children[0], flat.get_span(i)),
+    FlatAst.WHILE : lambda flat, i, children: ast.WhileStmt(children[0], children[1], flat.get_span(i)),
+    FlatAst.IF : lambda flat, i, children: ast.IfStmt(children[0], children[1], flat.get_span(i)),
+    FlatAst.IF_ELSE : lambda flat, i, children: ast.IfElseStmt(children[0], children[1], children[2], flat.get_span(i)),
+    FlatAst.ASSIGNMENT : lambda flat, i, children: ast.AssignmentStmt(flat.name_table.names[flat.values[i]], children[0], flat.get_span(i)),
+    FlatAst.INFIX : lambda flat, i, children: ast.InfixExpr(
+        FlatAst.operators[flat.values[i]], children[0], children[1], flat.get_span(i)),
+    FlatAst.IDENTIFIER : lambda flat, i, children: ast.Identifier(flat.name_table.names[flat.values[i]], flat.get_span(i)),
+    FlatAst.INT : lambda flat, i, children: ast.Int(flat.values[i], flat.get_span(i)),
+    FlatAst.BIG_INT : lambda flat, i, children: ast.Int(flat.big_ints[flat.values[i]], flat.get_span(i)),
+    FlatAst.CALL : lambda flat, i, children: ast.Call(children[0], children[1:], flat.get_span(i)),
+}
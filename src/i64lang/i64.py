@@ -0,0 +1,66 @@
+'''
+Semantics of the 64 bit integer operations of the language.
+All operations wrap around on overflow, division truncates towards zero
+like the x64 idiv instruction and comparisons evaluate to 0 or 1.
+Dividing MIN by -1 wraps around to MIN, while idiv traps.
+'''
+
+MIN = -2**63
+MAX = 2**63 - 1
+
+def wrap(value: int) -> int:
+    return ((value - MIN) & 0xffffffffffffffff) + MIN
+
+def add(a: int, b: int) -> int:
+    return wrap(a + b)
+
+def sub(a: int, b: int) -> int:
+    return wrap(a - b)
+
+def mul(a: int, b: int) -> int:
+    return wrap(a * b)
+
+def div(a: int, b: int) -> int:
+    if b == 0:
+        raise ZeroDivisionError("integer division by zero")
+    quotient = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        quotient = -quotient
+    return wrap(quotient)
+
+def equal(a: int, b: int) -> int:
+    return int(a == b)
+
+def not_equal(a: int, b: int) -> int:
+    return int(a != b)
+
+def less(a: int, b: int) -> int:
+    return int(a < b)
+
+def greater(a: int, b: int) -> int:
+    return int(a > b)
+
+def less_or_equal(a: int, b: int) -> int:
+    return int(a <= b)
+
+def greater_or_equal(a: int, b: int) -> int:
+    return int(a >= b)
+
+binary_operations = {
+    "+" : add,
+    "-" : sub,
+    "*" : mul,
+    "/" : div,
+    "==" : equal,
+    "!=" : not_equal,
+    "<" : less,
+    ">" : greater,
+    "<=" : less_or_equal,
+    ">=" : greater_or_equal,
+}
+
+# Operators whose operands can be swapped.
+commutative_operators = {"+", "*", "==", "!="}
+
+# Results of comparing a value with itself.
+self_comparisons = {"==" : 1, "<=" : 1, ">=" : 1, "!=" : 0, "<" : 0, ">" : 0}
@@ -0,0 +1,149 @@
+'''
+Incremental parsing for editors that change the code in small steps.
+
+`ParsedCode` keeps the code together with its program and the span of every
+function. An edit only relexes and reparses the functions it touches, the
+other `ast.Function` objects are reused. The result is always the same as
+`parse_str` on the new code. Cases that can't be handled locally, e.g.
+tokens outside of functions, fall back to parsing everything.
+
+Spans of nodes in reused functions still refer to the position at which the
+function was parsed. `get_span` shifts them to the current code.
+'''
+
+__all__ = [
+    "ParsedCode",
+]
+
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import List, Optional, Tuple
+
+from . import ast
+from . code_stream import CodeStream
+from . lexer import tokenize_to_buffer
+from . parser import parse__functions, parse_str
+from . spans import ParseError, Span
+from . token_stream import TokenBufferStream
+
+class ParsedCode:
+    def __init__(self, code: str):
+        self.code = code
+        self.program = ast.Program([])
+        # Span of every function in the code and the amount by which spans of nodes in the function
+        # have moved since it was parsed. Like text in a gap buffer, the entries from `gap` on are
+        # stored relative to the end of the code, so that an edit doesn't change the entries after
+        # it. Moving the gap to an edit only converts the entries between the two edits.
+        self.stored_spans: List[Span] = []
+        self.stored_shifts: List[int] = []
+        self.gap = 0
+        self.parse_all()
+
+    def parse_all(self):
+        # Only when the code consists of functions alone, regions between them can be parsed on their own.
+        self.clean = False
+        try:
+            functions = parse_region(self.code, 0, len(self.code))
+        except ParseError:
+            functions = None
+        if functions is None:
+            # parse_str decides which functions are kept and gives the error its location.
+            functions = parse_str(self.code).functions
+        else:
+            self.clean = True
+        self.program = ast.Program(functions)
+        self.stored_spans = [function.span for function in functions]
+        self.stored_shifts = [0] * len(functions)
+        self.gap = len(functions)
+
+    def edit(self, start: int, end: int, text: str) -> ast.Program:
+        '''
+        Replaces the code between the offsets with the text and returns the new program. Unless
+        everything is parsed again, the program is updated in place.
+        '''
+        assert 0 <= start <= end <= len(self.code)
+        if not self.clean:
+            # Tokens outside of functions end the program early, only a full parse knows where.
+            self.code = self.code[:start] + text + self.code[end:]
+            self.parse_all()
+            return self.program
+
+        first, last = self.find_touched_functions(start, end)
+        # The functions after the edit are relative to the end of the code and stay valid.
+        self.move_gap(last)
+        self.code = self.code[:start] + text + self.code[end:]
+
+        # The region also contains the whitespace around the touched functions,
+        # so that text that is inserted there is parsed as well.
+        region_start = self.stored_spans[first - 1][1] if first > 0 else 0
+        region_end = self.get_function_span(last)[0] if last < len(self.stored_spans) else len(self.code)
+        try:
+            new_functions = parse_region(self.code, region_start, region_end)
+        except ParseError:
+            new_functions = None
+        if new_functions is None:
+            self.parse_all()
+            return self.program
+
+        self.program.functions[first:last] = new_functions
+        self.stored_spans[first:last] = [function.span for function in new_functions]
+        self.stored_shifts[first:last] = [0] * len(new_functions)
+        self.gap = first + len(new_functions)
+        return self.program
+
+    def move_gap(self, index: int):
+        size = len(self.code)
+        spans = self.stored_spans
+        shifts = self.stored_shifts
+        for i in range(index, self.gap):
+            span_start, span_end = spans[i]
+            spans[i] = span_start - size, span_end - size
+            shifts[i] -= size
+        for i in range(self.gap, index):
+            span_start, span_end = spans[i]
+            spans[i] = span_start + size, span_end + size
+            shifts[i] += size
+        self.gap = index
+
+    def find_touched_functions(self, start: int, end: int) -> Tuple[int, int]:
+        '''
+        Range of functions that overlap or touch the edited code. An empty range is the gap
+        between the functions in which the edit happened.
+        '''
+        first = self.bisect(bisect_left, start, itemgetter(1), 0)
+        last = self.bisect(bisect_right, end, itemgetter(0), first)
+        return first, last
+
+    def bisect(self, bisect_function, position: int, key, lo: int) -> int:
+        '''Bisects the spans before the gap and, when the position is after them, the ones after it.'''
+        if lo < self.gap:
+            index = bisect_function(self.stored_spans, position, lo, self.gap, key=key)
+            if index < self.gap:
+                return index
+        return bisect_function(self.stored_spans, position - len(self.code), max(lo, self.gap), key=key)
+
+    def get_function_span(self, function_index: int) -> Span:
+        '''Span of the function in the current code.'''
+        span_start, span_end = self.stored_spans[function_index]
+        if function_index >= self.gap:
+            return span_start + len(self.code), span_end + len(self.code)
+        return span_start, span_end
+
+    def get_span(self, function_index: int, node) -> Optional[Span]:
+        '''Span of a node in the function in the current code.'''
+        if node.span is None:
+            return None
+        shift = self.stored_shifts[function_index]
+        if function_index >= self.gap:
+            shift += len(self.code)
+        return node.span[0] + shift, node.span[1] + shift
+
+def parse_region(code: str, start: int, end: int) -> Optional[List[ast.Function]]:
+    '''Functions in the code between the offsets, None when there are other tokens as well.'''
+    code_stream = CodeStream(code)
+    code_stream.skip_n(start)
+    tokens = TokenBufferStream(tokenize_to_buffer(code_stream, end))
+    functions = list(parse__functions(tokens))
+    if tokens.try_peek_next_token() is not None:
+        return None
+    return functions
@@ -0,0 +1,89 @@
+'''
+Shares structurally equal expressions between all places that contain them.
+
+An `ExpressionInterner` builds every distinct expression once. Expressions
+made by the same interner are equal exactly when they are the same object,
+so later passes can compare them with `is` and use `id` as a dict key
+instead of comparing trees. Every interned expression also carries its
+`structural_hash`, which equal expressions of different interners share
+within one process.
+
+A shared expression stands for all of its occurrences, so interned
+expressions have no span. Statements and functions are never shared and
+keep theirs.
+'''
+
+__all__ = [
+    "ExpressionInterner",
+]
+
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import ast
+from . ast_utils import child_getters, reduce_tree
+
+class ExpressionInterner:
+    def __init__(self):
+        # Keyed by the type, the other fields and the ids of the already interned children.
+        # Holding the expressions keeps the ids of the children from being reused.
+        self.expressions: Dict[Tuple[Any, ...], ast.Expression] = {}
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def intern(self, root: ast.Node) -> ast.Node:
+        '''
+        The tree with every expression replaced by the interned one. Statements and functions
+        are only rebuilt when their expressions have changed.
+        '''
+        return reduce_tree(root, self.intern_node)
+
+    def intern_node(self, node: ast.Node, children: List[ast.Node]) -> ast.Node:
+        if isinstance(node, ast.Expression):
+            return expression_interners[type(node)](self, node, children)
+        if all(child is old_child for child, old_child in zip(children, child_getters[type(node)](node))):
+            return node
+        return node_rebuilders[type(node)](node, children)
+
+    def get(self, node_type: type, fields: Tuple[Any, ...], children: List[ast.Expression],
+            make: Callable[[], ast.Expression]) -> ast.Expression:
+        key = (node_type, *fields, *map(id, children))
+        expr = self.expressions.get(key)
+        if expr is None:
+            expr = make()
+            expr.structural_hash = hash((node_type, *fields, *[child.structural_hash for child in children]))
+            self.expressions[key] = expr
+        return expr
+
+    def identifier(self, name: str) -> ast.Identifier:
+        return self.get(ast.Identifier, (name,), [], lambda: ast.Identifier(name))
+
+    def int(self, value: int) -> ast.Int:
+        return self.get(ast.Int, (value,), [], lambda: ast.Int(value))
+
+    def infix(self, operator: str, left_expr: ast.Expression, right_expr: ast.Expression) -> ast.InfixExpr:
+        return self.get(ast.InfixExpr, (operator,), [left_expr, right_expr],
+                        lambda: ast.InfixExpr(operator, left_expr, right_expr))
+
+    def call(self, ptr_expr: ast.Expression, args: List[ast.Expression]) -> ast.Call:
+        return self.get(ast.Call, (), [ptr_expr, *args], lambda: ast.Call(ptr_expr, list(args)))
+
+# Interns an expression, given its already interned children.
+expression_interners = {
+    ast.InfixExpr : lambda interner, node, children: interner.infix(node.operator, children[0], children[1]),
+    ast.Identifier : lambda interner, node, children: interner.identifier(node.name),
+    ast.Int : lambda interner, node, children: interner.int(node.value),
+    ast.Call : lambda interner, node, children: interner.call(children[0], children[1:]),
+}
+
+# Copies a node that isn't an expression with new children.
+node_rebuilders = {
+    ast.Program : lambda node, children: ast.Program(children),
+    ast.Function : lambda node, children: ast.Function(node.name, node.arg_names, children[0], node.span),
+    ast.BlockStmt : lambda node, children: ast.BlockStmt(children, node.span),
+    ast.ReturnStmt : lambda node, children: ast.ReturnStmt(children[0], node.span),
+    ast.WhileStmt : lambda node, children: ast.WhileStmt(children[0], children[1], node.span),
+    ast.IfStmt : lambda node, children: ast.IfStmt(children[0], children[1], node.span),
+    ast.IfElseStmt : lambda node, children: ast.IfElseStmt(children[0], children[1], children[2], node.span),
+    ast.AssignmentStmt : lambda node, children: ast.AssignmentStmt(node.name, children[0], node.span),
+}
@@ -0,0 +1,162 @@
+'''
+Reference interpreter that executes the ast directly.
+
+Node handlers are looked up in tables indexed by the type of the node, so
+that the dispatch does not depend on the number of node types. The
+semantics are the same as the ones of the generated machine code, see
+`i64` and `codegen`: arithmetic wraps around and a division by zero raises
+ZeroDivisionError.
+'''
+
+__all__ = [
+    "Interpreter",
+    "load_program",
+    "raised_recursion_limit",
+]
+
+import sys
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from . import ast
+from . import i64
+from . ast_utils import get_function_arities, get_local_names
+
+def load_program(program: ast.Program) -> "Interpreter":
+    return Interpreter(program)
+
+# Python frames that a call of a program may use. Since Python 3.11, calls between Python
+# functions don't use the C stack, before that a deep recursion would crash the process.
+RECURSION_LIMIT = 1_000_000 if sys.version_info >= (3, 11) else 20_000
+
+@contextmanager
+def raised_recursion_limit():
+    '''
+    Every call of the program takes several Python frames, so the default limit would only allow
+    a few hundred nested calls. Running out of frames is reported as a RuntimeError.
+    '''
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, RECURSION_LIMIT))
+    try:
+        yield
+    except RecursionError:
+        raise RuntimeError("maximum recursion depth exceeded") from None
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+class Interpreter:
+    '''
+    Functions can be called with `interpreter.call("f", 1, 2)` or as attributes `interpreter.f(1, 2)`.
+    '''
+
+    def __init__(self, program: ast.Program):
+        self.program = program
+        self.functions = {function.name : function for function in program.functions}
+        get_function_arities(program)
+        # Functions whose body hasn't been parsed yet are only inspected when they are called.
+        self.local_names = {function.name : get_local_names(function)
+                            for function in program.functions if ast.is_function_loaded(function)}
+
+        self.statement_handlers = {
+            ast.BlockStmt : self.exec_block,
+            ast.ReturnStmt : self.exec_return,
+            ast.AssignmentStmt : self.exec_assignment,
+            ast.WhileStmt : self.exec_while,
+            ast.IfStmt : self.exec_if,
+            ast.IfElseStmt : self.exec_if_else,
+        }
+        self.expression_handlers = {
+            ast.Int : self.eval_int,
+            ast.Identifier : self.eval_identifier,
+            ast.InfixExpr : self.eval_infix,
+            ast.Call : self.eval_call,
+        }
+
+    def call(self, name: str, *args: int) -> int:
+        with raised_recursion_limit():
+            return self.call_function(self.functions[name], [i64.wrap(arg) for arg in args])
+
+    def __getattr__(self, name):
+        functions = self.__dict__.get("functions", {})
+        if name not in functions:
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    def call_function(self, function: ast.Function, args: List[int]) -> int:
+        if len(args) != len(function.arg_names):
+            raise RuntimeError(f"{function.name} expects {len(function.arg_names)} arguments, got {len(args)}")
+        local_names = self.local_names.get(function.name)
+        if local_names is None:
+            local_names = self.local_names[function.name] = get_local_names(function)
+        frame = dict.fromkeys(local_names, 0)
+        frame.update(zip(function.arg_names, args))
+        result = self.exec(function.stmt, frame)
+        return 0 if result is None else result
+
+    # Statements return None when execution continues with the next statement
+    # and the return value when the function returns.
+
+    def exec(self, stmt: ast.Statement, frame: Dict) -> Optional[int]:
+        return self.statement_handlers[type(stmt)](stmt, frame)
+
+    def exec_block(self, stmt: ast.BlockStmt, frame: Dict) -> Optional[int]:
+        handlers = self.statement_handlers
+        for sub_stmt in stmt.statements:
+            result = handlers[type(sub_stmt)](sub_stmt, frame)
+            if result is not None:
+                return result
+        return None
+
+    def exec_return(self, stmt: ast.ReturnStmt, frame: Dict) -> Optional[int]:
+        return self.eval(stmt.expr, frame)
+
+    def exec_assignment(self, stmt: ast.AssignmentStmt, frame: Dict) -> Optional[int]:
+        frame[stmt.name] = self.eval(stmt.expr, frame)
+        return None
+
+    def exec_while(self, stmt: ast.WhileStmt, frame: Dict) -> Optional[int]:
+        while self.eval(stmt.condition, frame):
+            result = self.exec(stmt.body_stmt, frame)
+            if result is not None:
+                return result
+        return None
+
+    def exec_if(self, stmt: ast.IfStmt, frame: Dict) -> Optional[int]:
+        if self.eval(stmt.condition, frame):
+            return self.exec(stmt.then_stmt, frame)
+        return None
+
+    def exec_if_else(self, stmt: ast.IfElseStmt, frame: Dict) -> Optional[int]:
+        if self.eval(stmt.condition, frame):
+            return self.exec(stmt.then_stmt, frame)
+        else:
+            return self.exec(stmt.else_stmt, frame)
+
+    def eval(self, expr: ast.Expression, frame: Dict):
+        return self.expression_handlers[type(expr)](expr, frame)
+
+    def eval_int(self, expr: ast.Int, frame: Dict) -> int:
+        return i64.wrap(expr.value)
+
+    def eval_identifier(self, expr: ast.Identifier, frame: Dict):
+        name = expr.name
+        if name in frame:
+            return frame[name]
+        elif name in self.functions:
+            return self.functions[name]
+        else:
+            raise RuntimeError(f"unknown name: {name}")
+
+    def eval_infix(self, expr: ast.InfixExpr, frame: Dict) -> int:
+        left = self.eval(expr.left_expr, frame)
+        right = self.eval(expr.right_expr, frame)
+        if not (isinstance(left, int) and isinstance(right, int)):
+            raise RuntimeError(f"operator {expr.operator} expects integers")
+        return i64.binary_operations[expr.operator](left, right)
+
+    def eval_call(self, expr: ast.Call, frame: Dict) -> int:
+        function = self.eval(expr.ptr_expr, frame)
+        if not isinstance(function, ast.Function):
+            raise RuntimeError("only functions can be called")
+        args = [self.eval(arg, frame) for arg in expr.args]
+        return self.call_function(function, args)
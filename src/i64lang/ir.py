@@ -0,0 +1,374 @@
+'''
+Intermediate representation between the ast and x64 instructions.
+
+A function is a control flow graph of basic blocks. Every block holds a list
+of instructions and ends with a terminator that either jumps to other blocks
+or returns. The instructions are in SSA form: every instruction is a value
+that is defined exactly once, operands refer to the instructions computing
+them. Phis at the start of a block select a value depending on the
+predecessor that control came from.
+
+`format_program` gives a textual dump in which values are numbered in order
+of appearance, so that dumps of different runs can be diffed.
+'''
+
+__all__ = [
+    "Argument",
+    "BinaryOp",
+    "Block",
+    "Branch",
+    "Call",
+    "Const",
+    "Function",
+    "FunctionAddress",
+    "Instruction",
+    "Jump",
+    "Phi",
+    "Program",
+    "Return",
+    "Terminator",
+    "compute_dominators",
+    "compute_predecessors",
+    "format_function",
+    "format_program",
+    "merge_blocks",
+    "remove_trivial_phis",
+    "remove_unreachable_blocks",
+    "replace_values",
+    "reverse_postorder",
+]
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Union
+
+class Instruction:
+    @property
+    def operands(self) -> List["Instruction"]:
+        return []
+
+    def map_operands(self, function: Callable[["Instruction"], "Instruction"]):
+        pass
+
+@dataclass(eq=False)
+class Const(Instruction):
+    value: int
+
+@dataclass(eq=False)
+class Argument(Instruction):
+    index: int
+
+@dataclass(eq=False)
+class BinaryOp(Instruction):
+    operator: str
+    left: Instruction
+    right: Instruction
+
+    @property
+    def operands(self):
+        return [self.left, self.right]
+
+    def map_operands(self, function):
+        self.left = function(self.left)
+        self.right = function(self.right)
+
+@dataclass(eq=False)
+class FunctionAddress(Instruction):
+    name: str
+
+@dataclass(eq=False)
+class Call(Instruction):
+    # The name of the function for direct calls, otherwise the value of the function pointer.
+    target: Union[str, Instruction]
+    args: List[Instruction]
+
+    @property
+    def operands(self):
+        if isinstance(self.target, str):
+            return list(self.args)
+        return [self.target] + self.args
+
+    def map_operands(self, function):
+        if not isinstance(self.target, str):
+            self.target = function(self.target)
+        self.args = [function(arg) for arg in self.args]
+
+@dataclass(eq=False)
+class Phi(Instruction):
+    incoming: Dict["Block", Instruction] = field(default_factory=dict)
+
+    @property
+    def operands(self):
+        return list(self.incoming.values())
+
+    def map_operands(self, function):
+        self.incoming = {block : function(value) for block, value in self.incoming.items()}
+
+class Terminator:
+    @property
+    def operands(self) -> List[Instruction]:
+        return []
+
+    @property
+    def successors(self) -> List["Block"]:
+        return []
+
+    def map_operands(self, function: Callable[[Instruction], Instruction]):
+        pass
+
+@dataclass(eq=False)
+class Jump(Terminator):
+    target: "Block"
+
+    @property
+    def successors(self):
+        return [self.target]
+
+@dataclass(eq=False)
+class Branch(Terminator):
+    condition: Instruction
+    then_block: "Block"
+    else_block: "Block"
+
+    @property
+    def operands(self):
+        return [self.condition]
+
+    @property
+    def successors(self):
+        return [self.then_block, self.else_block]
+
+    def map_operands(self, function):
+        self.condition = function(self.condition)
+
+@dataclass(eq=False)
+class Return(Terminator):
+    value: Instruction
+
+    @property
+    def operands(self):
+        return [self.value]
+
+    def map_operands(self, function):
+        self.value = function(self.value)
+
+@dataclass(eq=False)
+class Block:
+    name: str
+    # Phis come before all other instructions.
+    instructions: List[Instruction] = field(default_factory=list)
+    terminator: Optional[Terminator] = None
+
+    @property
+    def successors(self) -> List["Block"]:
+        return self.terminator.successors if self.terminator is not None else []
+
+    @property
+    def phis(self) -> List[Phi]:
+        phis = []
+        for instruction in self.instructions:
+            if not isinstance(instruction, Phi):
+                break
+            phis.append(instruction)
+        return phis
+
+    def __repr__(self):
+        return f"<Block {self.name}>"
+
+@dataclass(eq=False)
+class Function:
+    name: str
+    arg_names: List[str]
+    # The first block is the entry.
+    blocks: List[Block]
+
+    @property
+    def entry(self) -> Block:
+        return self.blocks[0]
+
+@dataclass(eq=False)
+class Program:
+    functions: List[Function]
+
+# Analysis
+###################################
+
+def compute_predecessors(function: Function) -> Dict[Block, List[Block]]:
+    predecessors = {block : [] for block in function.blocks}
+    for block in function.blocks:
+        for successor in block.successors:
+            if block not in predecessors[successor]:
+                predecessors[successor].append(block)
+    return predecessors
+
+def reverse_postorder(function: Function) -> List[Block]:
+    '''Blocks that are reachable from the entry, every block comes before its successors except along back edges.'''
+    order = []
+    visited = {function.entry}
+    stack = [(function.entry, iter(function.entry.successors))]
+    while stack:
+        block, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(successor.successors)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+def compute_dominators(function: Function) -> Dict[Block, Block]:
+    '''
+    Maps every reachable block to its immediate dominator, the entry is mapped to itself.
+    Uses the iterative algorithm by Cooper, Harvey and Kennedy.
+    '''
+    order = reverse_postorder(function)
+    index = {block : i for i, block in enumerate(order)}
+    predecessors = compute_predecessors(function)
+    idoms = {function.entry : function.entry}
+
+    def intersect(a: Block, b: Block) -> Block:
+        while a is not b:
+            while index[a] > index[b]:
+                a = idoms[a]
+            while index[b] > index[a]:
+                b = idoms[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = None
+            for predecessor in predecessors[block]:
+                if predecessor in idoms:
+                    new_idom = predecessor if new_idom is None else intersect(predecessor, new_idom)
+            if idoms.get(block) is not new_idom:
+                idoms[block] = new_idom
+                changed = True
+    return idoms
+
+# Transformation
+###################################
+
+def replace_values(function: Function, replacements: Dict[Instruction, Instruction]):
+    '''Replaces all uses of the keys with their values. Replacements can be chained.'''
+    if not replacements:
+        return
+
+    def resolve(value: Instruction) -> Instruction:
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    for block in function.blocks:
+        block.instructions = [instruction for instruction in block.instructions if instruction not in replacements]
+        for instruction in block.instructions:
+            instruction.map_operands(resolve)
+        if block.terminator is not None:
+            block.terminator.map_operands(resolve)
+
+def remove_unreachable_blocks(function: Function):
+    reachable = set(reverse_postorder(function))
+    function.blocks = [block for block in function.blocks if block in reachable]
+    for block in function.blocks:
+        for phi in block.phis:
+            phi.incoming = {predecessor : value for predecessor, value in phi.incoming.items()
+                            if predecessor in reachable}
+    remove_trivial_phis(function)
+
+def merge_blocks(function: Function):
+    '''Appends blocks to their only predecessor when it jumps to them unconditionally.'''
+    predecessors = compute_predecessors(function)
+    merged = set()
+    for block in function.blocks:
+        if block in merged:
+            continue
+        while isinstance(block.terminator, Jump):
+            successor = block.terminator.target
+            if successor is function.entry or successor is block or predecessors[successor] != [block]:
+                break
+            for phi in successor.phis:
+                replace_values(function, {phi : phi.incoming[block]})
+            block.instructions.extend(successor.instructions)
+            block.terminator = successor.terminator
+            for next_block in successor.successors:
+                predecessors[next_block] = [block if predecessor is successor else predecessor
+                                            for predecessor in predecessors[next_block]]
+                for phi in next_block.phis:
+                    if successor in phi.incoming:
+                        phi.incoming[block] = phi.incoming.pop(successor)
+            merged.add(successor)
+    function.blocks = [block for block in function.blocks if block not in merged]
+
+def remove_trivial_phis(function: Function):
+    '''Removes phis that only select a single value other than themselves.'''
+    while True:
+        replacements = {}
+        for block in function.blocks:
+            for phi in block.phis:
+                values = {id(value) : value for value in phi.incoming.values() if value is not phi}
+                if len(values) == 1:
+                    replacements[phi] = next(iter(values.values()))
+                elif len(values) == 0:
+                    zero = Const(0)
+                    block.instructions.insert(len(block.phis), zero)
+                    replacements[phi] = zero
+        if not replacements:
+            return
+        replace_values(function, replacements)
+
+# Textual representation
+###################################
+
+def format_program(program: Program) -> str:
+    return "\n\n".join(format_function(function) for function in program.functions)
+
+def format_function(function: Function) -> str:
+    names = {}
+    for block in function.blocks:
+        for instruction in block.instructions:
+            names[instruction] = f"v{len(names)}"
+
+    def name(value: Instruction) -> str:
+        return names.get(value, "<undefined>")
+
+    lines = [f"def {function.name}({', '.join(function.arg_names)}) {{"]
+    for block in function.blocks:
+        lines.append(f"{block.name}:")
+        for instruction in block.instructions:
+            lines.append(f"    {name(instruction)} = {format_instruction(instruction, name)}")
+        lines.append(f"    {format_terminator(block.terminator, name)}")
+    lines.append("}")
+    return "\n".join(lines)
+
+def format_instruction(instruction: Instruction, name: Callable[[Instruction], str]) -> str:
+    if isinstance(instruction, Const):
+        return str(instruction.value)
+    elif isinstance(instruction, Argument):
+        return f"arg {instruction.index}"
+    elif isinstance(instruction, BinaryOp):
+        return f"{name(instruction.left)} {instruction.operator} {name(instruction.right)}"
+    elif isinstance(instruction, FunctionAddress):
+        return f"function {instruction.name}"
+    elif isinstance(instruction, Call):
+        target = instruction.target if isinstance(instruction.target, str) else name(instruction.target)
+        return f"call {target}({', '.join(name(arg) for arg in instruction.args)})"
+    elif isinstance(instruction, Phi):
+        incoming = ", ".join(f"{block.name}: {name(value)}" for block, value in instruction.incoming.items())
+        return f"phi [{incoming}]"
+    else:
+        raise NotImplementedError(f"unknown instruction: {type(instruction).__name__}")
+
+def format_terminator(terminator: Optional[Terminator], name: Callable[[Instruction], str]) -> str:
+    if terminator is None:
+        return "<no terminator>"
+    elif isinstance(terminator, Jump):
+        return f"jump {terminator.target.name}"
+    elif isinstance(terminator, Branch):
+        return f"branch {name(terminator.condition)}, {terminator.then_block.name}, {terminator.else_block.name}"
+    elif isinstance(terminator, Return):
+        return f"return {name(terminator.value)}"
+    else:
+        raise NotImplementedError(f"unknown terminator: {type(terminator).__name__}")
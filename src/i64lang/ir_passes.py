@@ -0,0 +1,265 @@
+'''
+Optimizations on the ir. Every pass changes the function in place.
+
+Calls are assumed to have side effects, so they are never removed, merged
+or moved. The same is true for divisions that might fail, i.e. divisions
+whose divisor is not a constant other than 0.
+'''
+
+__all__ = [
+    "eliminate_common_subexpressions",
+    "eliminate_dead_code",
+    "fold_constants",
+    "hoist_loop_invariants",
+    "optimize_function",
+    "optimize_program",
+]
+
+from typing import Dict, List, Set
+
+from . import ir
+from . import i64
+from . i64 import commutative_operators, self_comparisons
+
+def optimize_program(program: ir.Program):
+    for function in program.functions:
+        optimize_function(function)
+
+def optimize_function(function: ir.Function):
+    fold_constants(function)
+    eliminate_common_subexpressions(function)
+    hoist_loop_invariants(function)
+    eliminate_dead_code(function)
+
+def is_pure(instruction: ir.Instruction) -> bool:
+    '''Pure instructions can be removed, merged and moved.'''
+    if isinstance(instruction, (ir.Const, ir.Argument, ir.FunctionAddress)):
+        return True
+    if isinstance(instruction, ir.BinaryOp):
+        if instruction.operator == "/":
+            return isinstance(instruction.right, ir.Const) and instruction.right.value != 0
+        return True
+    return False
+
+# Constant folding
+###################################
+
+def fold_constants(function: ir.Function):
+    '''
+    Evaluates operations on constants, simplifies algebraic identities and
+    replaces branches on constants with jumps. Blocks that are only reached
+    by such a jump are merged into their predecessor afterwards.
+    '''
+    replacements = {}
+
+    def resolve(value):
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    for block in ir.reverse_postorder(function):
+        new_instructions = []
+        for instruction in block.instructions:
+            instruction.map_operands(resolve)
+            if isinstance(instruction, ir.BinaryOp):
+                simplified = simplify_binary_op(instruction)
+                if simplified is not instruction:
+                    replacements[instruction] = simplified
+                    if simplified not in instruction.operands:
+                        # A new constant.
+                        new_instructions.append(simplified)
+                    continue
+            new_instructions.append(instruction)
+        block.instructions = new_instructions
+
+        terminator = block.terminator
+        terminator.map_operands(resolve)
+        if isinstance(terminator, ir.Branch) and isinstance(terminator.condition, ir.Const):
+            if terminator.condition.value != 0:
+                taken, not_taken = terminator.then_block, terminator.else_block
+            else:
+                taken, not_taken = terminator.else_block, terminator.then_block
+            block.terminator = ir.Jump(taken)
+            if not_taken is not taken:
+                for phi in not_taken.phis:
+                    phi.incoming.pop(block, None)
+
+    ir.replace_values(function, replacements)
+    ir.remove_unreachable_blocks(function)
+    ir.merge_blocks(function)
+
+def simplify_binary_op(instruction: ir.BinaryOp) -> ir.Instruction:
+    '''Returns the instruction itself, an existing value or a new constant.'''
+    operator = instruction.operator
+    left, right = instruction.left, instruction.right
+    left_value = left.value if isinstance(left, ir.Const) else None
+    right_value = right.value if isinstance(right, ir.Const) else None
+
+    if left_value is not None and right_value is not None:
+        if operator == "/" and right_value == 0:
+            return instruction
+        return ir.Const(i64.binary_operations[operator](left_value, right_value))
+
+    if operator in commutative_operators and left_value is not None:
+        left, right = right, left
+        left_value, right_value = right_value, left_value
+
+    if operator == "+" and right_value == 0:
+        return left
+    if operator == "-" and right_value == 0:
+        return left
+    if operator == "*" and right_value == 1:
+        return left
+    if operator == "*" and right_value == 0:
+        return ir.Const(0)
+    if operator == "/" and right_value == 1:
+        return left
+    if left is right:
+        if operator == "-":
+            return ir.Const(0)
+        if operator in self_comparisons:
+            return ir.Const(self_comparisons[operator])
+    return instruction
+
+# Dead code elimination
+###################################
+
+def eliminate_dead_code(function: ir.Function):
+    '''Removes pure instructions whose values are never used.'''
+    live = set()
+    worklist = []
+    for block in function.blocks:
+        for instruction in block.instructions:
+            if not is_pure(instruction) and not isinstance(instruction, ir.Phi):
+                worklist.append(instruction)
+        worklist.extend(block.terminator.operands)
+
+    while worklist:
+        instruction = worklist.pop()
+        if instruction in live:
+            continue
+        live.add(instruction)
+        worklist.extend(instruction.operands)
+
+    for block in function.blocks:
+        block.instructions = [instruction for instruction in block.instructions if instruction in live]
+
+# Common subexpression elimination
+###################################
+
+def eliminate_common_subexpressions(function: ir.Function):
+    '''
+    Replaces pure instructions with an equal one that dominates them.
+    The dominator tree is walked with an explicit stack and the table of
+    available values is restored when a subtree has been visited.
+    '''
+    idoms = ir.compute_dominators(function)
+    children = {block : [] for block in idoms}
+    for block in ir.reverse_postorder(function):
+        if block is not function.entry:
+            children[idoms[block]].append(block)
+
+    available = {}
+    replacements = {}
+
+    def resolve(value):
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    # Entries are blocks to visit or lists of keys to remove from the table.
+    stack = [function.entry]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, list):
+            for key in entry:
+                del available[key]
+            continue
+
+        block = entry
+        added_keys = []
+        for instruction in block.instructions:
+            instruction.map_operands(resolve)
+            if not is_pure(instruction):
+                continue
+            key = get_value_key(instruction)
+            if key in available:
+                replacements[instruction] = available[key]
+            else:
+                available[key] = instruction
+                added_keys.append(key)
+        stack.append(added_keys)
+        stack.extend(reversed(children[block]))
+
+    ir.replace_values(function, replacements)
+    # Phis whose incoming values were equal constants have become trivial.
+    ir.remove_trivial_phis(function)
+
+def get_value_key(instruction: ir.Instruction):
+    if isinstance(instruction, ir.Const):
+        return ("const", instruction.value)
+    elif isinstance(instruction, ir.Argument):
+        return ("arg", instruction.index)
+    elif isinstance(instruction, ir.FunctionAddress):
+        return ("function", instruction.name)
+    elif isinstance(instruction, ir.BinaryOp):
+        left, right = id(instruction.left), id(instruction.right)
+        if instruction.operator in commutative_operators and left > right:
+            left, right = right, left
+        return (instruction.operator, left, right)
+    else:
+        raise NotImplementedError(f"no key for: {type(instruction).__name__}")
+
+# Loop invariant code motion
+###################################
+
+def hoist_loop_invariants(function: ir.Function):
+    '''
+    Moves pure instructions whose operands are defined outside of a loop into the
+    block that enters the loop. Loops are only handled when that block exists,
+    i.e. when the loop header has a single predecessor outside of the loop that
+    jumps to it unconditionally. The ir built from the ast always has one.
+    '''
+    idoms = ir.compute_dominators(function)
+    predecessors = ir.compute_predecessors(function)
+
+    # Inner loops come first, so that their invariants can be hoisted further by outer loops.
+    for header in reversed(ir.reverse_postorder(function)):
+        latches = [block for block in predecessors[header] if block in idoms and dominates(header, block, idoms)]
+        if not latches:
+            continue
+        loop_blocks = find_loop_blocks(header, latches, predecessors)
+        entering = [block for block in predecessors[header] if block not in loop_blocks]
+        if len(entering) != 1 or not isinstance(entering[0].terminator, ir.Jump):
+            continue
+        preheader = entering[0]
+
+        defined_in_loop = {instruction for block in loop_blocks for instruction in block.instructions}
+        for block in ir.reverse_postorder(function):
+            if block not in loop_blocks:
+                continue
+            remaining = []
+            for instruction in block.instructions:
+                if is_pure(instruction) and not any(operand in defined_in_loop for operand in instruction.operands):
+                    preheader.instructions.append(instruction)
+                    defined_in_loop.discard(instruction)
+                else:
+                    remaining.append(instruction)
+            block.instructions = remaining
+
+def dominates(a: ir.Block, b: ir.Block, idoms: Dict[ir.Block, ir.Block]) -> bool:
+    while b is not a:
+        if idoms[b] is b:
+            return False
+        b = idoms[b]
+    return True
+
+def find_loop_blocks(header: ir.Block, latches: List[ir.Block], predecessors: Dict[ir.Block, List[ir.Block]]) -> Set[ir.Block]:
+    blocks = {header}
+    worklist = list(latches)
+    while worklist:
+        block = worklist.pop()
+        if block not in blocks:
+            blocks.add(block)
+            worklist.extend(predecessors[block])
+    return blocks
@@ -0,0 +1,344 @@
+'''
+Lowers the ir to x64 instructions.
+
+Every SSA value gets a virtual register, which are mapped to machine
+registers by `regalloc` afterwards. Constants are materialized where they are
+used instead, so that they do not occupy a register in between. Phis are
+replaced by copies at the end of the predecessors, edges from blocks with
+multiple successors to blocks with phis get their own code for the copies.
+
+Comparisons that are only used by the branch at the end of their block are
+fused with it into a compare and a conditional jump. Divisions check their
+divisor like the ones of `codegen`.
+'''
+
+__all__ = [
+    "generate_program",
+    "generate_function",
+]
+
+from typing import Dict, List, Optional
+
+from . import ir
+from . import x64
+from . codegen import argument_registers
+from . runtime import DIVISION_ERROR_LABEL
+from . regalloc import VirtualRegister, allocate_registers, rewrite_instructions
+
+def generate_program(program: ir.Program) -> List[x64.Instruction]:
+    instructions = []
+    for function in program.functions:
+        instructions.extend(generate_function(function))
+    return instructions
+
+def generate_function(function: ir.Function) -> List[x64.Instruction]:
+    body = FunctionLowering(function).lower()
+    allocation = allocate_registers(body)
+    body = rewrite_instructions(body, allocation)
+
+    saved_registers = allocation.used_callee_saved_registers
+    frame_size = allocation.spill_size + 8 * (len(saved_registers) % 2)
+
+    instructions = [x64.Label(function.name), x64.Push(x64.rbp), x64.MovRegToReg(x64.rbp, x64.rsp)]
+    if frame_size > 0:
+        instructions.append(x64.SubImmFromReg(x64.rsp, frame_size))
+    instructions.extend(x64.Push(reg) for reg in saved_registers)
+    instructions.extend(body)
+    instructions.append(x64.Label(get_epilogue_label(function)))
+    instructions.extend(x64.Pop(reg) for reg in reversed(saved_registers))
+    instructions.append(x64.MovRegToReg(x64.rsp, x64.rbp))
+    instructions.append(x64.Pop(x64.rbp))
+    instructions.append(x64.Return())
+    return instructions
+
+def get_epilogue_label(function: ir.Function) -> str:
+    # Function names cannot contain dots, so these labels do not collide with them.
+    return f"{function.name}.epilogue"
+
+class FunctionLowering:
+    def __init__(self, function: ir.Function):
+        self.function = function
+        self.instructions: List[x64.Instruction] = []
+        self.registers: Dict[ir.Instruction, VirtualRegister] = {}
+        self.register_amount = 0
+        self.label_counter = 0
+        self.layout = ir.reverse_postorder(function)
+        self.labels = {block : f"{function.name}.{block.name}" for block in self.layout}
+        self.epilogue_label = get_epilogue_label(function)
+
+        # Code for edges that need copies for phis, emitted after all blocks.
+        self.edge_code: List[x64.Instruction] = []
+
+        self.use_counts: Dict[ir.Instruction, int] = {}
+        for block in self.layout:
+            for instruction in block.instructions:
+                for operand in instruction.operands:
+                    self.use_counts[operand] = self.use_counts.get(operand, 0) + 1
+            for operand in block.terminator.operands:
+                self.use_counts[operand] = self.use_counts.get(operand, 0) + 1
+
+    def lower(self) -> List[x64.Instruction]:
+        for i, block in enumerate(self.layout):
+            next_block = self.layout[i + 1] if i + 1 < len(self.layout) else None
+            self.emit(x64.Label(self.labels[block]))
+            for instruction in block.instructions:
+                self.lower_instruction(block, instruction)
+            self.lower_terminator(block, next_block)
+        self.instructions.extend(self.edge_code)
+        return self.instructions
+
+    def emit(self, instruction: x64.Instruction):
+        self.instructions.append(instruction)
+
+    def new_register(self) -> VirtualRegister:
+        self.register_amount += 1
+        return VirtualRegister(self.register_amount)
+
+    def new_label(self, name: str) -> str:
+        # Block names do not contain dots, so these labels do not collide with them.
+        self.label_counter += 1
+        return f"{self.function.name}.{name}.{self.label_counter}"
+
+    def get_register(self, value: ir.Instruction) -> VirtualRegister:
+        if value not in self.registers:
+            self.registers[value] = self.new_register()
+        return self.registers[value]
+
+    def use(self, value: ir.Instruction) -> VirtualRegister:
+        '''Returns a register that contains the value.'''
+        if isinstance(value, ir.Const):
+            reg = self.new_register()
+            self.emit(x64.MovImmToReg(reg, value.value))
+            return reg
+        return self.get_register(value)
+
+    # Instructions
+    ###################################
+
+    def lower_instruction(self, block: ir.Block, instruction: ir.Instruction):
+        if isinstance(instruction, (ir.Const, ir.Phi)):
+            pass
+        elif isinstance(instruction, ir.Argument):
+            self.lower_argument(instruction)
+        elif isinstance(instruction, ir.BinaryOp):
+            if not self.is_fused_with_branch(block, instruction):
+                self.lower_binary_op(instruction)
+        elif isinstance(instruction, ir.FunctionAddress):
+            self.emit(x64.LoadLabelAddress(self.get_register(instruction), instruction.name))
+        elif isinstance(instruction, ir.Call):
+            self.lower_call(instruction)
+        else:
+            raise NotImplementedError(f"unknown instruction: {type(instruction).__name__}")
+
+    def lower_argument(self, instruction: ir.Argument):
+        reg = self.get_register(instruction)
+        if instruction.index < len(argument_registers):
+            self.emit(x64.MovRegToReg(reg, argument_registers[instruction.index]))
+        else:
+            # Skip the saved rbp and the return address.
+            stack_offset = 16 + 8 * (instruction.index - len(argument_registers))
+            self.emit(x64.MovMemToReg(reg, x64.rbp, stack_offset))
+
+    def lower_binary_op(self, instruction: ir.BinaryOp):
+        operator = instruction.operator
+        left, right = instruction.left, instruction.right
+        reg = self.get_register(instruction)
+
+        if operator in ("+", "-") and fits_into_imm32(right):
+            self.emit(x64.MovRegToReg(reg, self.use(left)))
+            instruction_cls = x64.AddImmToReg if operator == "+" else x64.SubImmFromReg
+            self.emit(instruction_cls(reg, right.value))
+        elif operator == "+" and fits_into_imm32(left):
+            self.emit(x64.MovRegToReg(reg, self.use(right)))
+            self.emit(x64.AddImmToReg(reg, left.value))
+        elif operator in simple_operator_instructions:
+            left_reg = self.use(left)
+            right_reg = self.use(right)
+            self.emit(x64.MovRegToReg(reg, left_reg))
+            self.emit(simple_operator_instructions[operator](reg, right_reg))
+        elif operator == "/":
+            self.lower_division(reg, self.use(left), right)
+        elif operator in comparison_instructions:
+            left_reg = self.use(left)
+            right_reg = self.use(right)
+            self.emit(x64.Compare(left_reg, right_reg))
+            self.emit(comparison_instructions[operator](reg))
+        else:
+            raise NotImplementedError(f"unknown operator: {operator}")
+
+    def lower_division(self, reg: VirtualRegister, left_reg: VirtualRegister, right: ir.Instruction):
+        '''
+        idiv traps on a zero divisor and on the overflow of -2**63 / -1, so a zero divisor is
+        reported by the runtime and -1 negates, which wraps. The checks are left out when the
+        divisor is a constant other than 0.
+        '''
+        right_value = right.value if isinstance(right, ir.Const) else None
+        if right_value == -1:
+            self.emit(x64.MovRegToReg(reg, left_reg))
+            self.emit(x64.Negate(reg))
+            return
+
+        right_reg = self.use(right)
+        is_checked = right_value is None or right_value == 0
+        if is_checked:
+            divide_label = self.new_label("divide")
+            end_label = self.new_label("end_divide")
+            minus_one = self.new_register()
+            self.emit(x64.TestRegs(right_reg, right_reg))
+            self.emit(x64.JumpIfEqual(DIVISION_ERROR_LABEL))
+            self.emit(x64.MovImmToReg(minus_one, -1))
+            self.emit(x64.Compare(right_reg, minus_one))
+            self.emit(x64.JumpIfNotEqual(divide_label))
+            self.emit(x64.MovRegToReg(reg, left_reg))
+            self.emit(x64.Negate(reg))
+            self.emit(x64.Jump(end_label))
+            self.emit(x64.Label(divide_label))
+        self.emit(x64.MovRegToReg(x64.rax, left_reg))
+        self.emit(x64.SignExtendRaxToRdx())
+        self.emit(x64.SignedDivide(right_reg))
+        self.emit(x64.MovRegToReg(reg, x64.rax))
+        if is_checked:
+            self.emit(x64.Label(end_label))
+
+    def lower_call(self, instruction: ir.Call):
+        args = [self.use(arg) for arg in instruction.args]
+        target = None if isinstance(instruction.target, str) else self.use(instruction.target)
+
+        # Keep the stack 16 byte aligned at the call as required by the calling convention.
+        stack_args = args[len(argument_registers):]
+        padding = 8 * (len(stack_args) % 2)
+        if padding:
+            self.emit(x64.SubImmFromReg(x64.rsp, padding))
+        for arg in reversed(stack_args):
+            self.emit(x64.Push(arg))
+        for reg, arg in zip(argument_registers, args):
+            self.emit(x64.MovRegToReg(reg, arg))
+
+        if target is None:
+            self.emit(x64.CallLabel(instruction.target))
+        else:
+            self.emit(x64.CallReg(target))
+
+        cleanup_size = 8 * len(stack_args) + padding
+        if cleanup_size > 0:
+            self.emit(x64.AddImmToReg(x64.rsp, cleanup_size))
+        self.emit(x64.MovRegToReg(self.get_register(instruction), x64.rax))
+
+    # Terminators
+    ###################################
+
+    def lower_terminator(self, block: ir.Block, next_block: Optional[ir.Block]):
+        terminator = block.terminator
+        if isinstance(terminator, ir.Jump):
+            self.emit_phi_copies(block, terminator.target)
+            if terminator.target is not next_block:
+                self.emit(x64.Jump(self.labels[terminator.target]))
+        elif isinstance(terminator, ir.Branch):
+            self.lower_branch(block, terminator, next_block)
+        elif isinstance(terminator, ir.Return):
+            self.emit(x64.MovRegToReg(x64.rax, self.use(terminator.value)))
+            # The code for edges follows the last block.
+            if next_block is not None or self.edge_code:
+                self.emit(x64.Jump(self.epilogue_label))
+        else:
+            raise NotImplementedError(f"unknown terminator: {type(terminator).__name__}")
+
+    def lower_branch(self, block: ir.Block, terminator: ir.Branch, next_block: Optional[ir.Block]):
+        condition = terminator.condition
+        if self.is_fused_with_branch(block, condition):
+            self.emit(x64.Compare(self.use(condition.left), self.use(condition.right)))
+            jump_if_true = conditional_jumps[condition.operator]
+        else:
+            reg = self.use(condition)
+            self.emit(x64.TestRegs(reg, reg))
+            jump_if_true = x64.JumpIfNotEqual
+        jump_if_false = negated_conditional_jumps[jump_if_true]
+
+        then_label = self.get_edge_label(block, terminator.then_block)
+        else_label = self.get_edge_label(block, terminator.else_block)
+        if terminator.then_block is next_block and then_label == self.labels[next_block]:
+            self.emit(jump_if_false(else_label))
+        elif terminator.else_block is next_block and else_label == self.labels[next_block]:
+            self.emit(jump_if_true(then_label))
+        else:
+            self.emit(jump_if_false(else_label))
+            self.emit(x64.Jump(then_label))
+
+    def is_fused_with_branch(self, block: ir.Block, value: ir.Instruction) -> bool:
+        terminator = block.terminator
+        return (isinstance(terminator, ir.Branch)
+                and terminator.condition is value
+                and isinstance(value, ir.BinaryOp)
+                and value.operator in conditional_jumps
+                and self.use_counts.get(value) == 1
+                and bool(block.instructions) and block.instructions[-1] is value)
+
+    def get_edge_label(self, block: ir.Block, target: ir.Block) -> str:
+        '''Returns the label to jump to from a block with multiple successors.'''
+        if not target.phis:
+            return self.labels[target]
+        label = f"{self.labels[block]}.to.{target.name}"
+        instructions = self.instructions
+        self.instructions = self.edge_code
+        self.emit(x64.Label(label))
+        self.emit_phi_copies(block, target)
+        self.emit(x64.Jump(self.labels[target]))
+        self.instructions = instructions
+        return label
+
+    def emit_phi_copies(self, block: ir.Block, target: ir.Block):
+        phis = target.phis
+        if not phis:
+            return
+        sources = [phi.incoming[block] for phi in phis]
+        if any(source in phis for source in sources):
+            # The copies happen in parallel, so sources have to be read before any phi is written.
+            temporaries = []
+            for source in sources:
+                temporary = self.new_register()
+                self.emit(x64.MovRegToReg(temporary, self.use(source)))
+                temporaries.append(temporary)
+            for phi, temporary in zip(phis, temporaries):
+                self.emit(x64.MovRegToReg(self.get_register(phi), temporary))
+        else:
+            for phi, source in zip(phis, sources):
+                if isinstance(source, ir.Const):
+                    self.emit(x64.MovImmToReg(self.get_register(phi), source.value))
+                else:
+                    self.emit(x64.MovRegToReg(self.get_register(phi), self.use(source)))
+
+def fits_into_imm32(value: ir.Instruction) -> bool:
+    return isinstance(value, ir.Const) and -2**31 <= value.value <= 2**31 - 1
+
+simple_operator_instructions = {
+    "+" : x64.AddRegToReg,
+    "-" : x64.SubRegFromReg,
+    "*" : x64.SignedMultiply,
+}
+
+comparison_instructions = {
+    "==" : x64.SetIfEqual,
+    "!=" : x64.SetIfNotEqual,
+    "<" : x64.SetIfLess,
+    ">" : x64.SetIfGreater,
+    "<=" : x64.SetIfLessOrEqual,
+    ">=" : x64.SetIfGreaterOrEqual,
+}
+
+conditional_jumps = {
+    "==" : x64.JumpIfEqual,
+    "!=" : x64.JumpIfNotEqual,
+    "<" : x64.JumpIfLess,
+    ">" : x64.JumpIfGreater,
+    "<=" : x64.JumpIfLessOrEqual,
+    ">=" : x64.JumpIfGreaterOrEqual,
+}
+
+negated_conditional_jumps = {
+    x64.JumpIfEqual : x64.JumpIfNotEqual,
+    x64.JumpIfNotEqual : x64.JumpIfEqual,
+    x64.JumpIfLess : x64.JumpIfGreaterOrEqual,
+    x64.JumpIfGreaterOrEqual : x64.JumpIfLess,
+    x64.JumpIfGreater : x64.JumpIfLessOrEqual,
+    x64.JumpIfLessOrEqual : x64.JumpIfGreater,
+}
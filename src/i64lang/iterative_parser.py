@@ -0,0 +1,199 @@
+'''
+Parser that does not recurse, for code that is nested too deeply for `parser`.
+
+The rules are the same as in `parser`, but every rule that contains other
+rules is a generator. Instead of calling a nested rule, it yields the
+generator of that rule and receives its result. `run` keeps the generators
+that are in progress on an explicit stack, so the nesting depth is only
+limited by memory. Infix operators are combined with explicit stacks of
+operands and operators. Trees, spans and errors are the same as with `parser`.
+'''
+
+__all__ = [
+    "parse",
+    "parse__functions",
+]
+
+from typing import Any, Callable, Generator, Iterator, List, Optional, Tuple
+
+from . import ast
+from . parser import COMPARISON_PRECEDENCE, infix_precedences, parse__argument_names
+from . token_stream import TokenStream
+
+# A rule yields the generators of nested rules and receives their results.
+Rule = Generator[Generator, Any, Any]
+
+def parse(tokens: TokenStream) -> ast.Program:
+    return ast.Program(list(parse__functions(tokens)))
+
+def parse__functions(tokens: TokenStream) -> Iterator[ast.Function]:
+    while tokens.next_is_name("def"):
+        yield run(parse__function(tokens))
+
+def run(rule: Rule) -> Any:
+    '''Runs the rule and all rules nested in it, returns the result of the rule.'''
+    stack = [rule]
+    result = None
+    while True:
+        try:
+            nested_rule = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            if not stack:
+                return stop.value
+            result = stop.value
+        else:
+            stack.append(nested_rule)
+            result = None
+
+def parse__function(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    tokens.skip_name("def")
+    name = tokens.consume_name()
+    arg_names = parse__argument_names(tokens)
+    stmt = yield parse__statement__block(tokens)
+    return ast.Function(name, arg_names, stmt, tokens.get_span(start))
+
+# Statements
+###################################
+
+def parse__statement(tokens: TokenStream) -> Rule:
+    # Returns the rule of the statement instead of running it, which saves a level on the stack.
+    if tokens.next_is_symbol("{"):
+        return parse__statement__block(tokens)
+    elif tokens.next_is_name("return"):
+        return parse__statement__return(tokens)
+    elif tokens.next_is_name("while"):
+        return parse__statement__while(tokens)
+    elif tokens.next_is_name("if"):
+        return parse__statement__if(tokens)
+    elif tokens.next_is_any_name():
+        return parse__statement__assignment(tokens)
+    else:
+        raise tokens.error("unexpected token")
+
+def parse__statement__block(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    statements = yield parse__list(tokens, parse__statement, "{", "}")
+    return ast.BlockStmt(statements, tokens.get_span(start))
+
+def parse__statement__return(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    tokens.skip_name("return")
+    expr = yield parse__expression(tokens)
+    tokens.skip_symbol(";")
+    return ast.ReturnStmt(expr, tokens.get_span(start))
+
+def parse__statement__while(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    tokens.skip_name("while")
+    tokens.skip_symbol("(")
+    condition = yield parse__expression(tokens)
+    tokens.skip_symbol(")")
+    body_stmt = yield parse__statement(tokens)
+    return ast.WhileStmt(condition, body_stmt, tokens.get_span(start))
+
+def parse__statement__if(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    tokens.skip_name("if")
+    tokens.skip_symbol("(")
+    condition = yield parse__expression(tokens)
+    tokens.skip_symbol(")")
+    then_stmt = yield parse__statement(tokens)
+    if tokens.next_is_name("else"):
+        tokens.skip_name("else")
+        else_stmt = yield parse__statement(tokens)
+        return ast.IfElseStmt(condition, then_stmt, else_stmt, tokens.get_span(start))
+    else:
+        return ast.IfStmt(condition, then_stmt, tokens.get_span(start))
+
+def parse__statement__assignment(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    name = tokens.consume_name()
+    tokens.skip_symbol("=")
+    expr = yield parse__expression(tokens)
+    tokens.skip_symbol(";")
+    return ast.AssignmentStmt(name, expr, tokens.get_span(start))
+
+# Expressions
+###################################
+
+def parse__expression(tokens: TokenStream) -> Rule:
+    '''
+    Shifts operands and operators onto stacks. Before an operator is shifted, the operators
+    on the stack that bind at least as tightly are applied. Comparisons cannot be chained.
+    '''
+    operands: List[Tuple[ast.Expression, int]] = []
+    operators: List[Tuple[str, int]] = []
+    has_comparison = False
+    while True:
+        start = tokens.position
+        operand = yield parse__expression__call_level(tokens)
+        operands.append((operand, start))
+
+        symbol = tokens.try_peek_symbol()
+        precedence = infix_precedences.get(symbol)
+        if precedence is None or (precedence == COMPARISON_PRECEDENCE and has_comparison):
+            break
+        apply_operators(tokens, operands, operators, precedence)
+        tokens.skip_symbol(symbol)
+        operators.append((symbol, precedence))
+        has_comparison = has_comparison or precedence == COMPARISON_PRECEDENCE
+
+    apply_operators(tokens, operands, operators, COMPARISON_PRECEDENCE)
+    return operands[0][0]
+
+def apply_operators(tokens: TokenStream, operands: List[Tuple[ast.Expression, int]],
+                    operators: List[Tuple[str, int]], min_precedence: int):
+    '''Applies the operators at the top of the stack that bind at least as tightly as `min_precedence`.'''
+    while operators and operators[-1][1] >= min_precedence:
+        operator, _ = operators.pop()
+        right_expr, _ = operands.pop()
+        left_expr, start = operands[-1]
+        operands[-1] = ast.InfixExpr(operator, left_expr, right_expr, tokens.get_span(start)), start
+
+def parse__expression__call_level(tokens: TokenStream) -> Rule:
+    start = tokens.position
+    if (name := tokens.try_consume_name()) is not None:
+        ptr_expr = ast.Identifier(name, tokens.get_span(start))
+    elif tokens.next_is_int():
+        value = tokens.consume_int()
+        ptr_expr = ast.Int(value, tokens.get_span(start))
+    elif tokens.next_is_symbol("("):
+        tokens.skip_symbol("(")
+        ptr_expr = yield parse__expression(tokens)
+        tokens.skip_symbol(")")
+    elif tokens.next_is_symbol("-"):
+        tokens.skip_symbol("-")
+        # The implicit zero is attributed to the minus sign.
+        left_expr = ast.Int(0, tokens.get_span(start))
+        right_expr = yield parse__expression__call_level(tokens)
+        ptr_expr = ast.InfixExpr("-", left_expr, right_expr, tokens.get_span(start))
+    else:
+        raise tokens.error("invalid atom")
+
+    if tokens.next_is_symbol("("):
+        args = yield parse__list(tokens, parse__expression, "(", ")", ",")
+        return ast.Call(ptr_expr, args, tokens.get_span(start))
+    else:
+        return ptr_expr
+
+def parse__list(tokens: TokenStream,
+                parse_element: Callable[[TokenStream], Rule],
+                start_symbol: str,
+                end_symbol: str,
+                separator_symbol: Optional[str] = None) -> Rule:
+    tokens.skip_symbol(start_symbol)
+
+    elements = []
+    while not tokens.next_is_symbol(end_symbol):
+        elements.append((yield parse_element(tokens)))
+
+        if separator_symbol is not None:
+            if tokens.next_is_symbol(separator_symbol):
+                tokens.skip_symbol(separator_symbol)
+            else:
+                break
+
+    tokens.skip_symbol(end_symbol)
+    return elements
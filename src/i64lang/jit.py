@@ -0,0 +1,275 @@
+'''
+Runs generated machine code in the current process.
+
+The code is copied into pages that are mapped read-write and are switched to
+read-execute afterwards, so that a page is never writable and executable at
+the same time. Pages are owned by a pool. Every program gets a page of its
+own, because calls release the GIL and another thread could be running code
+of a page while it is writable. A page is reused once its program has been
+freed.
+
+Every function is assembled on its own and the object codes are linked
+afterwards, which lets `compile_program_parallel` generate the code of
+large programs in several processes. The `runtime` is linked when the code
+is loaded, functions are called through its entry, which turns errors of
+the generated code into exceptions.
+'''
+
+__all__ = [
+    "CodePool",
+    "CompiledProgram",
+    "compile_str",
+    "compile_program",
+    "compile_program_parallel",
+    "is_supported",
+]
+
+import os
+import sys
+import ctypes
+import platform
+import weakref
+from typing import Dict, List, Optional
+
+from . import ast
+from . import i64
+from . import x64
+from . import runtime
+from . assembler import ObjectCode, assemble, link
+from . ast_utils import get_function_arities
+from . codegen import generate_function
+
+PROT_READ = 0x1
+PROT_WRITE = 0x2
+PROT_EXEC = 0x4
+MAP_PRIVATE = 0x02
+MAP_ANONYMOUS = 0x20
+MAP_FAILED = ctypes.c_void_p(-1).value
+
+def is_supported() -> bool:
+    return sys.platform.startswith("linux") and platform.machine() in ("x86_64", "AMD64")
+
+def compile_str(code: str, pool: Optional["CodePool"] = None, optimize: bool = False) -> "CompiledProgram":
+    from . parser import parse_str
+    return compile_program(parse_str(code), pool, optimize)
+
+def compile_program(program: ast.Program, pool: Optional["CodePool"] = None, optimize: bool = False) -> "CompiledProgram":
+    '''
+    With `optimize`, the code is generated from the optimized ir with allocated registers
+    instead of directly from the ast.
+    '''
+    function_arities = get_function_arities(program)
+    obj = assemble_functions(program.functions, function_arities, optimize)
+    return load_object_code(function_arities, obj, pool)
+
+def compile_program_parallel(program: ast.Program, pool: Optional["CodePool"] = None, optimize: bool = False,
+                             workers: Optional[int] = None) -> "CompiledProgram":
+    '''
+    Generates the code for groups of functions in separate processes, the result is the same as
+    with `compile_program`. Every group is assembled on its own, calls to functions of other groups
+    stay relocations until the groups are linked.
+    '''
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    function_arities = get_function_arities(program)
+    functions = program.functions
+    if workers == 1 or len(functions) < 2:
+        return compile_program(program, pool, optimize)
+
+    # Several groups per worker balance the load when functions have very different sizes.
+    group_amount = min(len(functions), workers * 4)
+    bounds = [len(functions) * i // group_amount for i in range(group_amount + 1)]
+
+    # Forked workers inherit the functions, sending them would take longer than generating their code.
+    # Errors are raised for the first group that has one, like with compile_program.
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"), initializer=set_worker_functions,
+                             initargs=(functions, function_arities, optimize)) as executor:
+        objects = list(executor.map(assemble_worker_functions, bounds, bounds[1:]))
+    return load_object_code(function_arities, link(objects), pool)
+
+# Functions to compile in a worker process of compile_program_parallel.
+_worker_functions = None
+
+def set_worker_functions(functions: List[ast.Function], function_arities: Dict[str, int], optimize: bool):
+    global _worker_functions
+    _worker_functions = functions, function_arities, optimize
+
+def assemble_worker_functions(start: int, end: int) -> ObjectCode:
+    functions, function_arities, optimize = _worker_functions
+    return assemble_functions(functions[start:end], function_arities, optimize)
+
+def assemble_functions(functions: List[ast.Function], function_arities: Dict[str, int], optimize: bool) -> ObjectCode:
+    '''
+    Every function is assembled on its own and starts at an aligned offset, so that the code
+    does not depend on how the functions of a program are grouped.
+    '''
+    return link(assemble(generate_function_code(function, function_arities, optimize)) for function in functions)
+
+def generate_function_code(function: ast.Function, function_arities: Dict[str, int], optimize: bool) -> List[x64.Instruction]:
+    if not optimize:
+        return generate_function(function, function_arities)
+    from . ast_to_ir import build_function
+    from . ir_passes import optimize_function
+    from . ir_to_x64 import generate_function as generate_function_from_ir
+    ir_function = build_function(function, function_arities)
+    optimize_function(ir_function)
+    return generate_function_from_ir(ir_function)
+
+def load_object_code(function_arities: Dict[str, int], obj: ObjectCode, pool: Optional["CodePool"] = None) -> "CompiledProgram":
+    if runtime.ENTER_LABEL not in obj.labels:
+        obj = link_runtime(obj)
+    if pool is None:
+        pool = get_default_pool()
+    allocation = pool.allocate(obj.code)
+    return CompiledProgram(function_arities, obj, allocation)
+
+def link_runtime(obj: ObjectCode) -> ObjectCode:
+    '''Links the runtime to the code of a program, which resolves all references of the program.'''
+    obj = link([obj, get_runtime_object()])
+    if obj.relocations:
+        raise RuntimeError(f"unresolved label: {obj.relocations[0].label}")
+    return obj
+
+_runtime_object = None
+
+def get_runtime_object() -> ObjectCode:
+    global _runtime_object
+    if _runtime_object is None:
+        _runtime_object = assemble(runtime.generate_runtime())
+    return _runtime_object
+
+# enter(function address, arguments, end of arguments, error cell)
+enter_function_type = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p)
+
+class CompiledProgram:
+    '''
+    Gives access to the compiled functions as attributes, e.g. `compiled.fib(10)`.
+    The machine code stays alive as long as this object or one of its functions is referenced.
+    '''
+
+    def __init__(self, function_arities: Dict[str, int], obj: ObjectCode, allocation: "CodeAllocation"):
+        self.allocation = allocation
+        self.enter = enter_function_type(allocation.address + obj.labels[runtime.ENTER_LABEL])
+        self.functions = {}
+        for name, arity in function_arities.items():
+            self.functions[name] = CompiledFunction(self, name, arity, allocation.address + obj.labels[name])
+
+    def __getattr__(self, name):
+        try:
+            return self.functions[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+class CompiledFunction:
+    def __init__(self, program: CompiledProgram, name: str, arity: int, address: int):
+        self.program = program
+        self.name = name
+        self.arity = arity
+        self.address = address
+        # The register arguments are always passed, the stack arguments are padded to an even amount.
+        stack_arg_amount = max(arity - runtime.REGISTER_ARGUMENT_AMOUNT, 0)
+        self.arguments_type = ctypes.c_int64 * (runtime.REGISTER_ARGUMENT_AMOUNT + stack_arg_amount + stack_arg_amount % 2)
+
+    def __call__(self, *args):
+        if len(args) != self.arity:
+            raise RuntimeError(f"{self.name} expects {self.arity} arguments, got {len(args)}")
+        arguments = self.arguments_type(*[i64.wrap(arg) for arg in args])
+        error = ctypes.c_int64(0)
+        result = self.program.enter(self.address, ctypes.addressof(arguments),
+                                    ctypes.addressof(arguments) + ctypes.sizeof(arguments), ctypes.addressof(error))
+        if error.value == runtime.DIVISION_BY_ZERO:
+            raise ZeroDivisionError("integer division by zero")
+        return result
+
+    def __repr__(self):
+        return f"<CompiledFunction {self.name}>"
+
+class CodePage:
+    def __init__(self, address: int, size: int):
+        self.address = address
+        self.size = size
+
+class CodeAllocation:
+    def __init__(self, page: CodePage, address: int, size: int):
+        self.page = page
+        self.address = address
+        self.size = size
+
+class CodePool:
+    def __init__(self, page_size: int = 4096):
+        if not is_supported():
+            raise RuntimeError("executing machine code is only supported on x86-64 Linux")
+        self.page_size = page_size
+        self.pages: List[CodePage] = []
+        # Pages that hold no code that can still be called.
+        self.free_pages: List[CodePage] = []
+
+    def allocate(self, code: bytes) -> CodeAllocation:
+        page = self.find_free_page(len(code))
+        set_protection(page, PROT_READ | PROT_WRITE)
+        ctypes.memmove(page.address, code, len(code))
+        set_protection(page, PROT_READ | PROT_EXEC)
+
+        allocation = CodeAllocation(page, page.address, len(code))
+        weakref.finalize(allocation, self.release, page)
+        return allocation
+
+    def release(self, page: CodePage):
+        if page in self.pages:
+            self.free_pages.append(page)
+
+    def find_free_page(self, size: int) -> CodePage:
+        '''The smallest free page that is large enough or a new one.'''
+        best_index = None
+        for i, page in enumerate(self.free_pages):
+            if page.size >= size and (best_index is None or page.size < self.free_pages[best_index].size):
+                best_index = i
+        if best_index is not None:
+            return self.free_pages.pop(best_index)
+        page_size = max(self.page_size, size + (-size % self.page_size))
+        page = map_page(page_size)
+        self.pages.append(page)
+        return page
+
+    def free(self):
+        '''Unmaps all pages. Code from this pool must not be called afterwards.'''
+        for page in self.pages:
+            libc.munmap(ctypes.c_void_p(page.address), ctypes.c_size_t(page.size))
+        self.pages.clear()
+        self.free_pages.clear()
+
+_default_pool = None
+
+def get_default_pool() -> CodePool:
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = CodePool()
+    return _default_pool
+
+def map_page(size: int) -> CodePage:
+    address = libc.mmap(None, ctypes.c_size_t(size), PROT_READ | PROT_WRITE,
+                        MAP_PRIVATE | MAP_ANONYMOUS, -1, 0)
+    if address is None or address == MAP_FAILED:
+        raise OSError(ctypes.get_errno(), "mmap failed")
+    return CodePage(address, size)
+
+def set_protection(page: CodePage, protection: int):
+    if libc.mprotect(ctypes.c_void_p(page.address), ctypes.c_size_t(page.size), protection) != 0:
+        raise OSError(ctypes.get_errno(), "mprotect failed")
+
+def load_libc():
+    if not is_supported():
+        return None
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                          ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.mprotect.restype = ctypes.c_int
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    libc.munmap.restype = ctypes.c_int
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    return libc
+
+libc = load_libc()
@@ -1,34 +1,158 @@
 __all__ = [
+    "iter_file_chunks",
+    "iter_tokens",
     "tokenize",
+    "tokenize_file",
     "tokenize_str",
+    "tokenize_str_to_buffer",
+    "tokenize_to_buffer",
 ]
 
+import mmap
+import os
+import re
+from array import array
+from itertools import accumulate
 from collections import defaultdict
-from typing import Union, List, Set, Optional
+from typing import Union, List, Set, Optional, Tuple, Iterable, Iterator, TextIO
 from string import digits, ascii_letters, whitespace
 
-from . code_stream import CodeStream
-from . tokens import NameToken, IntToken, SymbolToken, Token
+from . code_stream import CodeStream, ByteCodeStream
+from . import i64
+from . tokens import NameToken, IntToken, SymbolToken, Token, TokenBuffer
 
 def tokenize_str(code: str) -> List[Token]:
     return tokenize(CodeStream(code))
 
 def tokenize(code: CodeStream) -> List[Token]:
-    tokens = list(iter_tokens(code))
-    return tokens
-
-def iter_tokens(code: CodeStream):
-    while next_char := code.try_peek_next():
-        if symbol_token := try_tokenize_symbol(code):
-            yield symbol_token
-        elif next_char in digits:
-            yield tokenize_int(code)
-        elif next_char in identifier_begins:
-            yield tokenize_name(code)
-        elif next_char in whitespace:
-            code.consume_next()
-        else:
-            raise ValueError(f"unknown symbol: {repr(next_char)}")
+    '''
+    Finds all tokens in the remaining code with a single regular expression, so that
+    strings are only sliced at token boundaries. Tokens are immutable, equal tokens
+    share the same object.
+    '''
+    texts = token_pattern.findall(code.code, code.position)
+    code.position = len(code.code)
+    return list(map(TokenCache().__getitem__, texts))
+
+def iter_tokens(chunks: Iterable[str]) -> Iterator[Token]:
+    '''
+    Lexes code that arrives in pieces, e.g. from `iter_file_chunks`. Tokens never contain
+    whitespace, so everything before the last whitespace of the received code can be
+    lexed. The rest is kept until more code arrives, it might be the start of a longer
+    token. Only the symbol tokens are shared, so that memory does not grow with the code.
+    '''
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        end = max(pending.rfind(char) for char in whitespace) + 1
+        if end > 0:
+            yield from tokenize_complete_code(pending[:end])
+            pending = pending[end:]
+    yield from tokenize_complete_code(pending)
+
+def tokenize_complete_code(code: str) -> List[Token]:
+    return [symbol_tokens.get(text) or tokenize_text(text) for text in token_pattern.findall(code)]
+
+def iter_file_chunks(file: TextIO, chunk_size: int = 2**16) -> Iterator[str]:
+    return iter(lambda: file.read(chunk_size), "")
+
+class TokenCache(dict):
+    def __init__(self):
+        super().__init__(symbol_tokens)
+
+    def __missing__(self, text: str) -> Token:
+        token = tokenize_text(text)
+        self[text] = token
+        return token
+
+def tokenize_str_to_buffer(code: str) -> TokenBuffer:
+    return tokenize_to_buffer(CodeStream(code))
+
+def tokenize_to_buffer(code: CodeStream, end: Optional[int] = None) -> TokenBuffer:
+    '''
+    Like `tokenize`, but fills the compact buffer that also knows where every token starts.
+    Works on `str` and on ASCII bytes, e.g. of an mmap. The code is processed in windows
+    that end at whitespace, so that large inputs are never copied as a whole.
+    With `end`, only the code up to that offset is lexed.
+    '''
+    buffer = TokenBuffer(possible_symbols)
+    source = code.code
+    is_bytes = not isinstance(source, str)
+    whitespace_chars = [char.encode("ascii") for char in whitespace] if is_bytes else whitespace
+    kinds = {}
+    values = {}
+
+    stop = len(source) if end is None else end
+    start = code.position
+    while start < stop:
+        window_end = find_window_end(source, start, stop, whitespace_chars)
+        add_window_to_buffer(buffer, source[start:window_end], start, is_bytes, kinds, values)
+        start = window_end
+
+    code.position = stop
+    return buffer
+
+def find_window_end(source, start: int, stop: int, whitespace_chars) -> int:
+    limit = start + window_size
+    if limit >= stop:
+        return stop
+    end = max(source.rfind(char, start, limit) for char in whitespace_chars)
+    if end == -1:
+        # A single token can be longer than the window.
+        ends = [source.find(char, limit, stop) for char in whitespace_chars]
+        return min([end for end in ends if end != -1], default=stop)
+    return end + 1
+
+window_size = 2**20
+
+def add_window_to_buffer(buffer: TokenBuffer, window, offset: int, is_bytes: bool, kinds: dict, values: dict):
+    '''
+    Splitting the code at the tokens gives alternating whitespace and token strings, all per
+    token work happens in C. Every distinct token text is only classified once in Python,
+    `kinds` and `values` remember the results.
+    '''
+    parts = (separated_byte_token_pattern if is_bytes else separated_token_pattern).split(window)
+    texts = parts[1::2]
+
+    for text in dict.fromkeys(texts):
+        if text not in kinds:
+            kinds[text], values[text] = get_buffer_entry(buffer, text.decode("latin-1") if is_bytes else text)
+
+    buffer.kinds.extend(array("b", map(kinds.__getitem__, texts)))
+    buffer.values.extend(array("q", map(values.__getitem__, texts)))
+    # Every token starts where the whitespace before it ends.
+    buffer.offsets.extend(array("q", accumulate(map(len, parts), initial=offset))[1:-1:2])
+    buffer.lengths.extend(array("i", map(len, texts)))
+
+def tokenize_file(path: Union[str, os.PathLike]) -> TokenBuffer:
+    '''Lexes the file through an mmap, it is neither read into memory nor decoded as a whole.'''
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return TokenBuffer(possible_symbols)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return tokenize_to_buffer(ByteCodeStream(mapped))
+
+def get_buffer_entry(buffer: TokenBuffer, text: str) -> Tuple[int, int]:
+    symbol_id = buffer.symbol_ids.get(text)
+    if symbol_id is not None:
+        return TokenBuffer.SYMBOL, symbol_id
+    token = tokenize_text(text)
+    if isinstance(token, NameToken):
+        return TokenBuffer.NAME, buffer.name_table.intern(token.name)
+    elif i64.MIN <= token.value <= i64.MAX:
+        return TokenBuffer.INT, token.value
+    else:
+        buffer.big_ints.append(token.value)
+        return TokenBuffer.BIG_INT, len(buffer.big_ints) - 1
+
+def tokenize_text(text: str) -> Token:
+    first_char = text[0]
+    if first_char in identifier_begins:
+        return NameToken(text)
+    elif first_char in digits:
+        return IntToken(int(text))
+    else:
+        raise ValueError(f"unknown symbol: {repr(text)}")
 
 def try_tokenize_symbol(code: CodeStream) -> Optional[SymbolToken]:
     first_char = code.try_peek_next()
@@ -57,3 +181,15 @@ for symbol in possible_symbols:
 
 sorted_symbols_by_first_char = {first_char : tuple(sorted(symbols, key=len, reverse=True))
                                 for first_char, symbols in symbols_by_first_char.items()}
+
+symbol_tokens = {symbol : SymbolToken(symbol) for symbol in possible_symbols}
+
+# Every character that is not whitespace is part of a match. Unknown characters
+# are matched on their own and rejected by `tokenize_text`.
+token_pattern = re.compile(r"[A-Za-z_]\w*|\d+|%s|[^%s]" % (
+    "|".join(re.escape(symbol) for symbol in possible_symbols if len(symbol) > 1),
+    re.escape(whitespace)), re.ASCII)
+
+# The same, but `split` also returns the tokens between the whitespace.
+separated_token_pattern = re.compile("(%s)" % token_pattern.pattern, re.ASCII)
+separated_byte_token_pattern = re.compile(separated_token_pattern.pattern.encode("ascii"))
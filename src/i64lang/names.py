@@ -0,0 +1,28 @@
+'''
+Tables that give every distinct name a small integer id. The token buffer,
+the flat ast and the binary form of programs store names by id.
+'''
+
+__all__ = [
+    "NameTable",
+]
+
+from typing import Dict, List
+
+class NameTable:
+    '''`names` holds the names in the order in which they were interned, `ids` maps them back.'''
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, name: str) -> int:
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = name_id
+        return name_id
+
+    def __len__(self):
+        return len(self.names)
@@ -1,21 +1,169 @@
 __all__ = [
+    "iter_functions",
     "parse",
+    "parse_chunks",
+    "parse_file",
+    "parse_parallel",
     "parse_str",
 ]
 
-from typing import List, Iterator, Callable, Any, Union, Optional
+import gc
+import os
+import re
+from array import array
+from contextlib import contextmanager
+from typing import List, Iterator, Iterable, Callable, Any, Union, Optional
 
 from . import ast
-from . token_stream import TokenStream
-from . tokens import Token
+from . token_stream import TokenStream, LazyTokenStream, TokenBufferStream
+from . tokens import Token, TokenBuffer
+from . spans import LineIndex, ParseError
 
-def parse_str(code: str) -> ast.Program:
-    from . lexer import tokenize_str
-    tokens = tokenize_str(code)
-    return parse(tokens)
+def parse_str(code: str, iterative: bool = False, intern: bool = False, lazy: bool = False) -> ast.Program:
+    from . lexer import tokenize_str_to_buffer
+    tokens = tokenize_str_to_buffer(code)
+    try:
+        return parse(tokens, iterative, intern, lazy, code=code)
+    except ParseError as error:
+        error.locate(LineIndex(code))
+        raise
 
-def parse(tokens: List[Token]) -> ast.Program:
-    return parse__program(TokenStream(tokens))
+def parse(tokens: Union[List[Token], TokenBuffer], iterative: bool = False, intern: bool = False, lazy: bool = False,
+          code: Optional[str] = None) -> ast.Program:
+    '''
+    With `iterative`, nested rules are kept on an explicit stack instead of the call stack,
+    which is slower but works for code of any depth.
+
+    With `intern`, structurally equal expressions of the program are the same object and
+    have no span, see `interning`. Every function is interned right after it is parsed,
+    so that copies of expressions don't pile up.
+
+    With `lazy`, the bodies of functions are only found by matching braces and are parsed
+    when the `stmt` of the function is read for the first time, see `ast.DeferredStatement`.
+    Errors in a body are raised at that point, located in `code` if it is given. The tokens
+    are kept until all bodies have been parsed.
+    '''
+    if lazy and intern:
+        raise ValueError("interning needs the bodies of all functions, it can't be combined with lazy parsing")
+    stream = create_stream(tokens)
+    if lazy:
+        functions = parse__functions__lazy(stream, iterative, code)
+    elif iterative:
+        from . import iterative_parser
+        functions = iterative_parser.parse__functions(stream)
+    else:
+        functions = parse__functions(stream)
+    if intern:
+        from . interning import ExpressionInterner
+        interner = ExpressionInterner()
+        functions = map(interner.intern, functions)
+    return ast.Program(list(functions))
+
+def create_stream(tokens: Union[List[Token], TokenBuffer]) -> TokenStream:
+    return TokenBufferStream(tokens) if isinstance(tokens, TokenBuffer) else TokenStream(tokens)
+
+def parse_file(path: Union[str, os.PathLike]) -> ast.Program:
+    from . lexer import tokenize_file
+    try:
+        return parse(tokenize_file(path))
+    except ParseError as error:
+        with open(path, "rb") as file:
+            error.locate(LineIndex(file.read()))
+        raise
+
+def parse_parallel(code: str, workers: Optional[int] = None) -> ast.Program:
+    '''
+    Parses groups of functions in separate processes, the result is the same as with `parse_str`.
+    The boundaries of the functions are found by matching braces. Code that is not only a sequence
+    of functions is parsed in the current process.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    function_ends = find_function_ends(code)
+    if workers == 1 or function_ends is None or len(function_ends) < 2:
+        return parse_str(code)
+
+    # Several groups per worker balance the load when functions have very different sizes.
+    group_amount = min(len(function_ends), workers * 4)
+    group_size = len(code) / group_amount
+    groups = []
+    group_start = 0
+    for end in function_ends:
+        if end >= (len(groups) + 1) * group_size or end == function_ends[-1]:
+            groups.append((code[group_start:end], group_start))
+            group_start = end
+
+    try:
+        # Most of the time to receive the functions would be spent in the cycle collector otherwise.
+        with ProcessPoolExecutor(workers) as executor, paused_garbage_collection():
+            function_groups = list(executor.map(parse__code_at_offset, *zip(*groups)))
+    except (ParseError, ValueError):
+        # Gives the same error as parsing everything at once.
+        return parse_str(code)
+    return ast.Program([function for functions in function_groups for function in functions])
+
+def find_function_ends(code: str) -> Optional[List[int]]:
+    '''
+    Offset after every function, None when the code is not a sequence of functions. Every function
+    has exactly one outermost pair of braces. There are no strings or comments, so every brace
+    character is a token.
+    '''
+    ends = []
+    depth = 0
+    for match in brace_pattern.finditer(code):
+        if match.group() == "{":
+            if depth == 0 and not function_start_pattern.match(code, ends[-1] if ends else 0):
+                return None
+            depth += 1
+        else:
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                ends.append(match.end())
+    if depth != 0 or not whitespace_pattern.fullmatch(code, ends[-1] if ends else 0):
+        return None
+    return ends
+
+brace_pattern = re.compile("[{}]")
+function_start_pattern = re.compile(r"\s*def(?!\w)", re.ASCII)
+whitespace_pattern = re.compile(r"\s*", re.ASCII)
+
+def parse__code_at_offset(code: str, offset: int) -> List[ast.Function]:
+    '''Parses functions that start at the offset in a larger code, so that the spans fit that code.'''
+    from . lexer import tokenize_str_to_buffer
+    buffer = tokenize_str_to_buffer(code)
+    buffer.offsets = array("q", [start + offset for start in buffer.offsets])
+    tokens = TokenBufferStream(buffer)
+    with paused_garbage_collection():
+        functions = list(parse__functions(tokens))
+    if tokens.try_peek_next_token() is not None:
+        raise tokens.error("expected def")
+    return functions
+
+@contextmanager
+def paused_garbage_collection():
+    '''The ast has no reference cycles, running the cycle collector while it is built only costs time.'''
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def parse_chunks(chunks: Iterable[str]) -> ast.Program:
+    '''Parses code that arrives in pieces, e.g. from `lexer.iter_file_chunks`.'''
+    return ast.Program(list(iter_functions(chunks)))
+
+def iter_functions(chunks: Iterable[str]) -> Iterator[ast.Function]:
+    '''
+    Yields every function as soon as it has been parsed. Only a few tokens are kept in
+    memory at a time, so arbitrarily large programs can be processed function by function.
+    '''
+    from . lexer import iter_tokens
+    yield from parse__functions(LazyTokenStream(iter_tokens(chunks)))
 
 def parse__program(tokens: TokenStream) -> ast.Program:
     functions = list(parse__functions(tokens))
@@ -26,11 +174,41 @@ def parse__functions(tokens: TokenStream) -> Iterator[ast.Function]:
         yield parse__function(tokens)
 
 def parse__function(tokens: TokenStream) -> ast.Function:
+    start = tokens.position
     tokens.skip_name("def")
     name = tokens.consume_name()
     arg_names = parse__argument_names(tokens)
     stmt = parse__statement__block(tokens)
-    return ast.Function(name, arg_names, stmt)
+    return ast.Function(name, arg_names, stmt, tokens.get_span(start))
+
+def parse__functions__lazy(tokens: TokenStream, iterative: bool, code: Optional[str]) -> Iterator[ast.Function]:
+    while tokens.next_is_name("def"):
+        yield parse__function__lazy(tokens, iterative, code)
+
+def parse__function__lazy(tokens: TokenStream, iterative: bool, code: Optional[str]) -> ast.Function:
+    start = tokens.position
+    tokens.skip_name("def")
+    name = tokens.consume_name()
+    arg_names = parse__argument_names(tokens)
+    body_start = tokens.position
+    tokens.skip_braces()
+    token_list = tokens.tokens
+    stmt = ast.DeferredStatement(lambda: parse__deferred_body(token_list, body_start, iterative, code))
+    return ast.Function(name, arg_names, stmt, tokens.get_span(start))
+
+def parse__deferred_body(tokens: Union[List[Token], TokenBuffer], position: int, iterative: bool,
+                         code: Optional[str]) -> ast.BlockStmt:
+    stream = create_stream(tokens)
+    stream.position = position
+    try:
+        if iterative:
+            from . import iterative_parser
+            return iterative_parser.run(iterative_parser.parse__statement__block(stream))
+        return parse__statement__block(stream)
+    except ParseError as error:
+        if code is not None:
+            error.locate(LineIndex(code))
+        raise
 
 def parse__argument_names(tokens: TokenStream) -> List[str]:
     return list(parse__list(tokens, parse__argument_name, "(", ")", ","))
@@ -50,26 +228,31 @@ def parse__statement(tokens: TokenStream) -> ast.Statement:
     elif tokens.next_is_any_name():
         return parse__statement__assignment(tokens)
     else:
-        raise RuntimeError("unexpected token")
+        raise tokens.error("unexpected token")
 
 def parse__statement__block(tokens: TokenStream) -> ast.BlockStmt:
+    start = tokens.position
     statements = list(parse__list(tokens, parse__statement, "{", "}"))
-    return ast.BlockStmt(statements)
+    return ast.BlockStmt(statements, tokens.get_span(start))
 
 def parse__statement__return(tokens: TokenStream) -> ast.ReturnStmt:
+    start = tokens.position
     tokens.skip_name("return")
     expr = parse__expression(tokens)
-    return ast.ReturnStmt(expr)
+    tokens.skip_symbol(";")
+    return ast.ReturnStmt(expr, tokens.get_span(start))
 
 def parse__statement__while(tokens: TokenStream) -> ast.WhileStmt:
+    start = tokens.position
     tokens.skip_name("while")
     tokens.skip_symbol("(")
     condition = parse__expression(tokens)
     tokens.skip_symbol(")")
     body_stmt = parse__statement(tokens)
-    return ast.WhileStmt(condition, body_stmt)
+    return ast.WhileStmt(condition, body_stmt, tokens.get_span(start))
 
 def parse__statement__if(tokens: TokenStream) -> Union[ast.IfStmt, ast.IfElseStmt]:
+    start = tokens.position
     tokens.skip_name("if")
     tokens.skip_symbol("(")
     condition = parse__expression(tokens)
@@ -78,63 +261,110 @@ def parse__statement__if(tokens: TokenStream) -> Union[ast.IfStmt, ast.IfElseStm
     if tokens.next_is_name("else"):
         tokens.skip_name("else")
         else_stmt = parse__statement(tokens)
-        return ast.IfElseStmt(condition, then_stmt, else_stmt)
+        return ast.IfElseStmt(condition, then_stmt, else_stmt, tokens.get_span(start))
     else:
-        return ast.IfStmt(condition, then_stmt)
+        return ast.IfStmt(condition, then_stmt, tokens.get_span(start))
 
 def parse__statement__assignment(tokens: TokenStream) -> ast.AssignmentStmt:
+    start = tokens.position
     name = tokens.consume_name()
     tokens.skip_symbol("=")
     expr = parse__expression(tokens)
     tokens.skip_symbol(";")
-    return ast.AssignmentStmt(name, expr)
+    return ast.AssignmentStmt(name, expr, tokens.get_span(start))
 
 def parse__expression(tokens: TokenStream) -> ast.Expression:
-    return parse__expression__comparison_level(tokens)
+    return parse__expression__infix(tokens, COMPARISON_PRECEDENCE)
 
 def parse__expression__comparison_level(tokens: TokenStream) -> ast.Expression:
-    left_expr = parse__expression__add_sub_level(tokens)
-    if tokens.next_is_any_symbol_of({"==", "<=", ">=", "!=", "<", ">"}):
-        operator = tokens.consume_symbol()
-        right_expr = parse__expression__add_sub_level(tokens)
-        return ast.InfixExpr(operator, left_expr, right_expr)
-    else:
-        return left_expr
+    return parse__expression__infix(tokens, COMPARISON_PRECEDENCE)
 
 def parse__expression__add_sub_level(tokens: TokenStream) -> ast.Expression:
-    left_expr = parse__expression__mul_div_level(tokens)
-    while tokens.next_is_any_symbol_of({"+", "-"}):
-        operator = tokens.consume_symbol()
-        right_expr = parse__expression__mul_div_level(tokens)
-        left_expr = ast.InfixExpr(operator, left_expr, right_expr)
-    return left_expr
+    return parse__expression__infix(tokens, ADD_SUB_PRECEDENCE)
 
 def parse__expression__mul_div_level(tokens: TokenStream) -> ast.Expression:
-    left_expr = parse__expression__call_level(tokens)
-    while tokens.next_is_any_symbol_of({"*", "/"}):
-        operator = tokens.consume_symbol()
-        right_expr = parse__expression__call_level(tokens)
-        left_expr = ast.InfixExpr(operator, left_expr, right_expr)
+    return parse__expression__infix(tokens, MUL_DIV_PRECEDENCE)
+
+def parse__expression__infix(tokens: TokenStream, min_precedence: int) -> ast.Expression:
+    start = tokens.position
+    left_expr = parse__expression__atom_level(tokens)
+    symbol = tokens.try_peek_symbol()
+    if symbol == "(":
+        left_expr = parse__expression__call(tokens, left_expr, start)
+        symbol = tokens.try_peek_symbol()
+    return parse__expression__infix_operators(tokens, left_expr, start, min_precedence, symbol)
+
+def parse__expression__infix_operators(tokens: TokenStream, left_expr: ast.Expression, start: int,
+                                       min_precedence: int, symbol: Optional[str]) -> ast.Expression:
+    '''
+    Precedence climbing: applies every following operator that binds at least as tightly as
+    `min_precedence` to the already parsed left operand, the next symbol has already been peeked.
+    Right operands only take operators that bind tighter, so operators are left associative.
+    Operands are only parsed recursively when such an operator follows them.
+    '''
+    max_precedence = MUL_DIV_PRECEDENCE
+    precedence = infix_precedences.get(symbol)
+    while precedence is not None and min_precedence <= precedence <= max_precedence:
+        tokens.skip_symbol(symbol)
+        right_start = tokens.position
+        right_expr = parse__expression__atom_level(tokens)
+        next_symbol = tokens.try_peek_symbol()
+        if next_symbol == "(":
+            right_expr = parse__expression__call(tokens, right_expr, right_start)
+            next_symbol = tokens.try_peek_symbol()
+        next_precedence = infix_precedences.get(next_symbol)
+        if next_precedence is not None and next_precedence > precedence:
+            right_expr = parse__expression__infix_operators(tokens, right_expr, right_start, precedence + 1, next_symbol)
+            next_symbol = tokens.try_peek_symbol()
+            next_precedence = infix_precedences.get(next_symbol)
+        left_expr = ast.InfixExpr(symbol, left_expr, right_expr, tokens.get_span(start))
+        if precedence == COMPARISON_PRECEDENCE:
+            # Comparisons cannot be chained.
+            max_precedence = COMPARISON_PRECEDENCE - 1
+        symbol = next_symbol
+        precedence = next_precedence
     return left_expr
 
+COMPARISON_PRECEDENCE = 1
+ADD_SUB_PRECEDENCE = 2
+MUL_DIV_PRECEDENCE = 3
+
+# Operators with higher precedence bind tighter.
+infix_precedences = {
+    "==" : COMPARISON_PRECEDENCE,
+    "!=" : COMPARISON_PRECEDENCE,
+    "<" : COMPARISON_PRECEDENCE,
+    ">" : COMPARISON_PRECEDENCE,
+    "<=" : COMPARISON_PRECEDENCE,
+    ">=" : COMPARISON_PRECEDENCE,
+    "+" : ADD_SUB_PRECEDENCE,
+    "-" : ADD_SUB_PRECEDENCE,
+    "*" : MUL_DIV_PRECEDENCE,
+    "/" : MUL_DIV_PRECEDENCE,
+}
+
 def parse__expression__call_level(tokens: TokenStream) -> ast.Expression:
+    start = tokens.position
     ptr_expr = parse__expression__atom_level(tokens)
     if tokens.next_is_symbol("("):
-        args = parse__call_arguments(tokens)
-        return ast.Call(ptr_expr, args)
+        return parse__expression__call(tokens, ptr_expr, start)
     else:
         return ptr_expr
 
+def parse__expression__call(tokens: TokenStream, ptr_expr: ast.Expression, start: int) -> ast.Call:
+    args = parse__call_arguments(tokens)
+    return ast.Call(ptr_expr, args, tokens.get_span(start))
+
 def parse__call_arguments(tokens: TokenStream) -> List[ast.Expression]:
     return list(parse__list(tokens, parse__expression__comparison_level, "(", ")", ","))
 
 def parse__expression__atom_level(tokens: TokenStream) -> ast.Expression:
-    if tokens.next_is_any_name():
-        name = tokens.consume_name()
-        return ast.Identifier(name)
+    start = tokens.position
+    if (name := tokens.try_consume_name()) is not None:
+        return ast.Identifier(name, tokens.get_span(start))
     elif tokens.next_is_int():
         value = tokens.consume_int()
-        return ast.Int(value)
+        return ast.Int(value, tokens.get_span(start))
     elif tokens.next_is_symbol("("):
         tokens.skip_symbol("(")
         expr = parse__expression(tokens)
@@ -142,11 +372,12 @@ def parse__expression__atom_level(tokens: TokenStream) -> ast.Expression:
         return expr
     elif tokens.next_is_symbol("-"):
         tokens.skip_symbol("-")
-        left_expr = ast.Int(0)
+        # The implicit zero is attributed to the minus sign.
+        left_expr = ast.Int(0, tokens.get_span(start))
         right_expr = parse__expression__call_level(tokens)
-        return ast.InfixExpr("-", left_expr, right_expr)
+        return ast.InfixExpr("-", left_expr, right_expr, tokens.get_span(start))
     else:
-        raise RuntimeError("invalid atom")
+        raise tokens.error("invalid atom")
 
 def parse__list(tokens: TokenStream,
                parse_element: Callable[[TokenStream], Any],
@@ -0,0 +1,460 @@
+'''
+Linear scan register allocation.
+
+The input is a list of x64 instructions in which values are held in virtual
+registers. Those are mapped to the 14 registers that are neither the stack
+pointer nor the frame pointer. Physical registers that are used explicitly,
+e.g. to pass arguments, to return a value or by idiv, are respected, as are
+the registers clobbered by calls. Therefore, values that are live across a
+call end up in callee-saved registers.
+
+Values are only spilled when there are more live values than registers. In
+that case the allocation is repeated without two scratch registers that are
+needed to load and store spilled values around the instructions using them.
+
+The rewritten code expects the following frame layout: spill slots are
+directly below rbp and the used callee-saved registers are pushed after the
+spill area has been reserved.
+'''
+
+__all__ = [
+    "Allocation",
+    "VirtualRegister",
+    "allocatable_registers",
+    "allocate_registers",
+    "callee_saved_registers",
+    "caller_saved_registers",
+    "rewrite_instructions",
+]
+
+from bisect import bisect_right
+from dataclasses import dataclass, field, replace
+from heapq import heappop, heappush
+from typing import Dict, List, Sequence, Tuple, Union
+
+from . import x64
+from . codegen import argument_registers
+
+@dataclass(frozen=True)
+class VirtualRegister:
+    id: int
+
+    @property
+    def name(self) -> str:
+        return f"v{self.id}"
+
+Operand = Union[x64.Register, VirtualRegister]
+
+caller_saved_registers = [x64.rax, x64.rcx, x64.rdx, x64.rsi, x64.rdi, x64.r8, x64.r9, x64.r10, x64.r11]
+callee_saved_registers = [x64.rbx, x64.r12, x64.r13, x64.r14, x64.r15]
+
+# Caller-saved registers come first, so that values which are not live
+# across calls do not cost a save and restore in the prologue and epilogue.
+allocatable_registers = caller_saved_registers + callee_saved_registers
+
+# Hold spilled values while an instruction uses them.
+scratch_registers = [x64.r10, x64.r11]
+
+@dataclass
+class Allocation:
+    registers: Dict[VirtualRegister, x64.Register] = field(default_factory=dict)
+
+    # Offsets of the slots of spilled values relative to rbp.
+    spill_offsets: Dict[VirtualRegister, int] = field(default_factory=dict)
+
+    # Size of the spill area in bytes, always a multiple of 16.
+    spill_size: int = 0
+
+    used_callee_saved_registers: List[x64.Register] = field(default_factory=list)
+
+def allocate_registers(instructions: Sequence[x64.Instruction],
+                       registers: Sequence[x64.Register] = allocatable_registers) -> Allocation:
+    operands = get_all_operands(instructions)
+    intervals, fixed_ranges = build_live_ranges(instructions, operands)
+    hints = find_hints(instructions)
+
+    assignment, spilled = linear_scan(intervals, fixed_ranges, hints, registers)
+    if spilled:
+        registers = [reg for reg in registers if reg not in scratch_registers]
+        assignment, spilled = linear_scan(intervals, fixed_ranges, hints, registers)
+
+    spill_offsets, slot_amount = assign_spill_slots(spilled, intervals)
+
+    used_indices = {reg.index for reg in assignment.values()}
+    for uses, defs in operands:
+        used_indices.update(operand for operand in defs if isinstance(operand, int))
+    used_callee_saved_registers = [reg for reg in callee_saved_registers if reg.index in used_indices]
+
+    spill_size = 8 * slot_amount
+    spill_size += -spill_size % 16
+    return Allocation(assignment, spill_offsets, spill_size, used_callee_saved_registers)
+
+def rewrite_instructions(instructions: Sequence[x64.Instruction], allocation: Allocation) -> List[x64.Instruction]:
+    '''
+    Replaces the virtual registers with the allocated ones and inserts loads and stores
+    for spilled values. Moves between the same register are removed.
+    '''
+    result = []
+    for instruction in instructions:
+        use_fields, def_fields = get_operand_fields(type(instruction))
+        virtual_fields = [name for name in dict.fromkeys(use_fields + def_fields)
+                          if isinstance(getattr(instruction, name), VirtualRegister)]
+        if not virtual_fields:
+            result.append(instruction)
+            continue
+
+        if isinstance(instruction, x64.MovRegToReg):
+            if move_to_or_from_spill_slot(instruction, allocation, result):
+                continue
+
+        changes = {}
+        loads = []
+        stores = []
+        scratch_by_value = {}
+        for name in virtual_fields:
+            value = getattr(instruction, name)
+            if value in allocation.registers:
+                changes[name] = allocation.registers[value]
+            else:
+                if value not in scratch_by_value:
+                    scratch_by_value[value] = scratch_registers[len(scratch_by_value)]
+                changes[name] = scratch_by_value[value]
+
+        for value, scratch in scratch_by_value.items():
+            offset = allocation.spill_offsets[value]
+            if any(getattr(instruction, name) == value for name in use_fields):
+                loads.append(x64.MovMemToReg(scratch, x64.rbp, offset))
+            if any(getattr(instruction, name) == value for name in def_fields):
+                stores.append(x64.MovRegToMem(x64.rbp, scratch, offset))
+
+        new_instruction = replace(instruction, **changes)
+        if isinstance(new_instruction, x64.MovRegToReg) and new_instruction.dst_reg == new_instruction.src_reg:
+            continue
+        result.extend(loads)
+        result.append(new_instruction)
+        result.extend(stores)
+    return result
+
+def move_to_or_from_spill_slot(instruction: x64.MovRegToReg, allocation: Allocation, result: List[x64.Instruction]) -> bool:
+    dst = get_allocated_operand(instruction.dst_reg, allocation)
+    src = get_allocated_operand(instruction.src_reg, allocation)
+    if isinstance(dst, int) and isinstance(src, x64.Register):
+        result.append(x64.MovRegToMem(x64.rbp, src, dst))
+        return True
+    if isinstance(src, int) and isinstance(dst, x64.Register):
+        result.append(x64.MovMemToReg(dst, x64.rbp, src))
+        return True
+    return False
+
+def get_allocated_operand(operand: Operand, allocation: Allocation) -> Union[x64.Register, int]:
+    '''Returns the register that holds the value or the offset of its spill slot.'''
+    if isinstance(operand, x64.Register):
+        return operand
+    if operand in allocation.registers:
+        return allocation.registers[operand]
+    return allocation.spill_offsets[operand]
+
+# Operands
+###################################
+
+# Names of the fields holding registers that are read and written by an instruction.
+operand_fields = {
+    x64.MovImmToReg : ((), ("reg",)),
+    x64.MovRegToMem : (("addr_reg", "src_reg"), ()),
+    x64.MovMemToReg : (("addr_reg",), ("dst_reg",)),
+    x64.MovRegToReg : (("src_reg",), ("dst_reg",)),
+    x64.Compare : (("dst_reg", "src_reg"), ()),
+    x64.TestRegs : (("dst_reg", "src_reg"), ()),
+    x64.SimpleTwoRegisterInstruction : (("dst_reg", "src_reg"), ("dst_reg",)),
+    x64.ImmediateToRegInstruction : (("reg",), ("reg",)),
+    x64.SignedDivide : (("reg",), ()),
+    x64.Negate : (("reg",), ("reg",)),
+    x64.Push : (("reg",), ()),
+    x64.Pop : ((), ("reg",)),
+    x64.SetOnConditionInstruction : ((), ("reg",)),
+    x64.CallReg : (("reg",), ()),
+    x64.LoadLabelAddress : ((), ("reg",)),
+}
+
+# Registers that are read and written without being named in the instruction.
+implicit_operands = {
+    x64.SignExtendRaxToRdx : ((x64.rax,), (x64.rdx,)),
+    x64.SignedDivide : ((x64.rax, x64.rdx), (x64.rax, x64.rdx)),
+    x64.Return : ((x64.rax,), ()),
+}
+
+_operand_fields_cache: Dict[type, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+def get_operand_fields(instruction_cls) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    if instruction_cls not in _operand_fields_cache:
+        _operand_fields_cache[instruction_cls] = next(
+            (operand_fields[cls] for cls in instruction_cls.__mro__ if cls in operand_fields), ((), ()))
+    return _operand_fields_cache[instruction_cls]
+
+def is_call(instruction: x64.Instruction) -> bool:
+    return isinstance(instruction, (x64.CallReg, x64.CallLabel))
+
+def is_block_end(instruction: x64.Instruction) -> bool:
+    return isinstance(instruction, (x64.Jump, x64.ConditionalJumpInstruction, x64.Return))
+
+def get_all_operands(instructions: Sequence[x64.Instruction]) -> List[Tuple[list, list]]:
+    '''
+    Finds the values that are read and written by every instruction. Virtual registers are
+    kept as they are, physical registers are represented by their index. rsp and rbp are
+    ignored because they are never allocated. A call reads the argument registers that
+    have been written in the same block before it and clobbers all caller-saved registers.
+    '''
+    all_operands = []
+    pending_arguments = set()
+    for instruction in instructions:
+        use_fields, def_fields = get_operand_fields(type(instruction))
+        uses = [getattr(instruction, name) for name in use_fields]
+        defs = [getattr(instruction, name) for name in def_fields]
+        implicit_uses, implicit_defs = implicit_operands.get(type(instruction), ((), ()))
+        uses.extend(implicit_uses)
+        defs.extend(implicit_defs)
+
+        if isinstance(instruction, x64.Label) or is_block_end(instruction):
+            pending_arguments.clear()
+        if is_call(instruction):
+            uses.extend(reg for reg in argument_registers if reg.index in pending_arguments)
+            defs.extend(caller_saved_registers)
+            pending_arguments.clear()
+        else:
+            pending_arguments.update(operand.index for operand in defs if operand in argument_registers)
+
+        all_operands.append((to_keys(uses), to_keys(defs)))
+    return all_operands
+
+def to_keys(operands: List[Operand]) -> list:
+    keys = []
+    for operand in operands:
+        if isinstance(operand, VirtualRegister):
+            keys.append(operand)
+        elif operand.index not in (x64.rsp.index, x64.rbp.index):
+            keys.append(operand.index)
+    return keys
+
+def find_hints(instructions: Sequence[x64.Instruction]) -> Dict[VirtualRegister, List[Operand]]:
+    '''Registers that a value should preferably get, so that moves from or to them can be removed.'''
+    hints = {}
+    for instruction in instructions:
+        if isinstance(instruction, x64.MovRegToReg):
+            dst, src = instruction.dst_reg, instruction.src_reg
+            if isinstance(dst, VirtualRegister):
+                hints.setdefault(dst, []).append(src)
+            if isinstance(src, VirtualRegister):
+                hints.setdefault(src, []).append(dst)
+    return hints
+
+# Liveness
+###################################
+
+@dataclass
+class Block:
+    start: int
+    end: int
+    successors: List[int] = field(default_factory=list)
+
+def split_blocks(instructions: Sequence[x64.Instruction]) -> List[Block]:
+    blocks = []
+    start = 0
+    for i, instruction in enumerate(instructions):
+        if isinstance(instruction, x64.Label) and i > start:
+            blocks.append(Block(start, i))
+            start = i
+        if is_block_end(instruction):
+            blocks.append(Block(start, i + 1))
+            start = i + 1
+    if start < len(instructions):
+        blocks.append(Block(start, len(instructions)))
+
+    block_by_label = {}
+    for block_index, block in enumerate(blocks):
+        first = instructions[block.start]
+        if isinstance(first, x64.Label):
+            block_by_label[first.name] = block_index
+
+    for block_index, block in enumerate(blocks):
+        last = instructions[block.end - 1]
+        if isinstance(last, (x64.Jump, x64.ConditionalJumpInstruction)) and last.label in block_by_label:
+            block.successors.append(block_by_label[last.label])
+        if not isinstance(last, (x64.Jump, x64.Return)) and block_index + 1 < len(blocks):
+            block.successors.append(block_index + 1)
+    return blocks
+
+def compute_live_outs(blocks: List[Block], operands: List[Tuple[list, list]]) -> List[set]:
+    gens = []
+    kills = []
+    for block in blocks:
+        gen = set()
+        kill = set()
+        for uses, defs in operands[block.start:block.end]:
+            gen.update(operand for operand in uses if operand not in kill)
+            kill.update(defs)
+        gens.append(gen)
+        kills.append(kill)
+
+    live_ins = [set() for _ in blocks]
+    live_outs = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for block_index in reversed(range(len(blocks))):
+            live_out = set()
+            for successor in blocks[block_index].successors:
+                live_out |= live_ins[successor]
+            live_in = gens[block_index] | (live_out - kills[block_index])
+            if live_in != live_ins[block_index] or live_out != live_outs[block_index]:
+                live_ins[block_index] = live_in
+                live_outs[block_index] = live_out
+                changed = True
+    return live_outs
+
+def build_live_ranges(instructions: Sequence[x64.Instruction], operands: List[Tuple[list, list]]):
+    '''
+    Instruction i reads its operands at position 2i and writes them at position 2i+1.
+    Virtual registers get a single interval from their first to their last live position.
+    Physical registers keep their exact ranges, so that the values in between can use them.
+    '''
+    blocks = split_blocks(instructions)
+    live_outs = compute_live_outs(blocks, operands)
+
+    ranges = {}
+
+    def add_range(key, start, end):
+        key_ranges = ranges.setdefault(key, [])
+        # Ranges are added from back to front.
+        if key_ranges and key_ranges[-1][0] <= end + 1:
+            key_ranges[-1][0] = min(start, key_ranges[-1][0])
+            key_ranges[-1][1] = max(end, key_ranges[-1][1])
+        else:
+            key_ranges.append([start, end])
+
+    for block, live_out in zip(reversed(blocks), reversed(live_outs)):
+        block_start, block_end = 2 * block.start, 2 * block.end - 1
+        live = set(live_out)
+        for key in live:
+            add_range(key, block_start, block_end)
+        for i in reversed(range(block.start, block.end)):
+            uses, defs = operands[i]
+            for key in defs:
+                if key in live:
+                    ranges[key][-1][0] = 2 * i + 1
+                    live.discard(key)
+                else:
+                    add_range(key, 2 * i + 1, 2 * i + 1)
+            for key in uses:
+                add_range(key, block_start, 2 * i)
+                live.add(key)
+
+    intervals = {}
+    fixed_ranges = {}
+    for key, key_ranges in ranges.items():
+        if isinstance(key, VirtualRegister):
+            intervals[key] = (min(start for start, _ in key_ranges), max(end for _, end in key_ranges))
+        else:
+            fixed_ranges[key] = FixedRanges(key_ranges)
+    return intervals, fixed_ranges
+
+class FixedRanges:
+    '''Positions at which a physical register is used explicitly.'''
+
+    def __init__(self, ranges: List[List[int]]):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(ranges):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def intersects(self, start: int, end: int) -> bool:
+        i = bisect_right(self.starts, end) - 1
+        return i >= 0 and self.ends[i] >= start
+
+# Allocation
+###################################
+
+def linear_scan(intervals: Dict[VirtualRegister, Tuple[int, int]],
+                fixed_ranges: Dict[int, FixedRanges],
+                hints: Dict[VirtualRegister, List[Operand]],
+                registers: Sequence[x64.Register]):
+    assignment = {}
+    spilled = []
+    # Entries are (end, id, value), so that the interval ending first is at the front.
+    active = []
+    used_indices = set()
+
+    def is_available(reg: x64.Register, start: int, end: int) -> bool:
+        if reg.index in used_indices:
+            return False
+        ranges = fixed_ranges.get(reg.index)
+        return ranges is None or not ranges.intersects(start, end)
+
+    for value, (start, end) in sorted(intervals.items(), key=lambda item: (item[1][0], item[0].id)):
+        while active and active[0][0] < start:
+            _, _, expired = heappop(active)
+            used_indices.discard(assignment[expired].index)
+
+        candidates = [reg for reg in registers if is_available(reg, start, end)]
+        if candidates:
+            reg = choose_register(candidates, hints.get(value, ()), assignment)
+            assignment[value] = reg
+            used_indices.add(reg.index)
+            heappush(active, (end, value.id, value))
+            continue
+
+        # Spill the value whose interval ends last, that frees a register for the longest time.
+        victim = None
+        for entry in active:
+            victim_end, _, victim_value = entry
+            if victim_end <= end:
+                continue
+            reg = assignment[victim_value]
+            ranges = fixed_ranges.get(reg.index)
+            if ranges is not None and ranges.intersects(start, end):
+                continue
+            if victim is None or victim_end > victim[0]:
+                victim = entry
+        if victim is None:
+            spilled.append(value)
+            continue
+
+        active.remove(victim)
+        active.sort()
+        victim_value = victim[2]
+        reg = assignment.pop(victim_value)
+        spilled.append(victim_value)
+        assignment[value] = reg
+        heappush(active, (end, value.id, value))
+
+    return assignment, spilled
+
+def choose_register(candidates: List[x64.Register], hints: Sequence[Operand], assignment: Dict[VirtualRegister, x64.Register]) -> x64.Register:
+    for hint in hints:
+        reg = assignment.get(hint) if isinstance(hint, VirtualRegister) else hint
+        if reg in candidates:
+            return reg
+    return candidates[0]
+
+def assign_spill_slots(spilled: List[VirtualRegister], intervals: Dict[VirtualRegister, Tuple[int, int]]):
+    '''Spilled values whose intervals do not overlap share a slot.'''
+    offsets = {}
+    free_slots = []
+    # Entries are (end, slot) of the values currently in a slot.
+    occupied = []
+    slot_amount = 0
+    for value in sorted(spilled, key=lambda value: intervals[value]):
+        start, end = intervals[value]
+        while occupied and occupied[0][0] < start:
+            heappush(free_slots, heappop(occupied)[1])
+        if free_slots:
+            slot = heappop(free_slots)
+        else:
+            slot = slot_amount
+            slot_amount += 1
+        heappush(occupied, (end, slot))
+        offsets[value] = -8 * (slot + 1)
+    return offsets, slot_amount
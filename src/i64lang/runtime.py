@@ -0,0 +1,104 @@
+'''
+Machine code that is linked to every compiled program and sits between the
+caller and the generated functions.
+
+Compiled functions are not called directly but through `ENTER_LABEL`:
+
+    enter(function address, arguments, end of arguments, error cell)
+
+The arguments are an array of the six register arguments followed by the
+stack arguments, whose amount has to be even to keep the stack aligned.
+The entry saves the callee-saved registers and the error cell in its frame:
+
+    rbp - 8 .. rbp - 40    rbx, r12, r13, r14, r15
+    rbp - 48               error cell
+
+Errors that the language defines, like a division by zero, jump to an error
+label instead of trapping. The error code follows the rbp chain of the
+generated functions up to the frame of the entry, which it recognizes by the
+return address of the call, writes the error into the cell and returns from
+the entry with the restored registers. Generated functions therefore must
+keep an rbp frame, which both code generators do.
+'''
+
+__all__ = [
+    "DIVISION_BY_ZERO",
+    "DIVISION_ERROR_LABEL",
+    "ENTER_LABEL",
+    "REGISTER_ARGUMENT_AMOUNT",
+    "generate_runtime",
+]
+
+from typing import List
+
+from . import x64
+
+# Function names cannot start with a dot, so these labels do not collide with them.
+ENTER_LABEL = ".runtime.enter"
+ENTER_RETURN_LABEL = ".runtime.enter_return"
+DIVISION_ERROR_LABEL = ".runtime.division_error"
+
+# Values of the error cell.
+DIVISION_BY_ZERO = 1
+
+argument_registers = [x64.rdi, x64.rsi, x64.rdx, x64.rcx, x64.r8, x64.r9]
+REGISTER_ARGUMENT_AMOUNT = len(argument_registers)
+
+saved_registers = [x64.rbx, x64.r12, x64.r13, x64.r14, x64.r15]
+ERROR_CELL_OFFSET = -8 * (len(saved_registers) + 1)
+
+def generate_runtime() -> List[x64.Instruction]:
+    return generate_enter() + generate_division_error()
+
+def generate_enter() -> List[x64.Instruction]:
+    instructions = [
+        x64.Label(ENTER_LABEL),
+        x64.Push(x64.rbp),
+        x64.MovRegToReg(x64.rbp, x64.rsp),
+        *[x64.Push(reg) for reg in saved_registers],
+        # The error cell, afterwards rsp is 16 byte aligned.
+        x64.Push(x64.rcx),
+        x64.MovRegToReg(x64.r11, x64.rdi),
+        x64.MovRegToReg(x64.r10, x64.rsi),
+
+        # Pushes the stack arguments from the last one to the first one.
+        x64.MovRegToReg(x64.r12, x64.rsi),
+        x64.AddImmToReg(x64.r12, 8 * REGISTER_ARGUMENT_AMOUNT),
+        x64.Label(".runtime.push_argument"),
+        x64.Compare(x64.rdx, x64.r12),
+        x64.JumpIfEqual(".runtime.call"),
+        x64.SubImmFromReg(x64.rdx, 8),
+        x64.MovMemToReg(x64.rax, x64.rdx),
+        x64.Push(x64.rax),
+        x64.Jump(".runtime.push_argument"),
+
+        x64.Label(".runtime.call"),
+        *[x64.MovMemToReg(reg, x64.r10, 8 * i) for i, reg in enumerate(argument_registers)],
+        x64.CallReg(x64.r11),
+
+        # Also reached from the error code, with rbp pointing to the frame of the entry.
+        x64.Label(ENTER_RETURN_LABEL),
+        x64.MovRegToReg(x64.rsp, x64.rbp),
+        x64.SubImmFromReg(x64.rsp, 8 * len(saved_registers)),
+        *[x64.Pop(reg) for reg in reversed(saved_registers)],
+        x64.Pop(x64.rbp),
+        x64.Return(),
+    ]
+    return instructions
+
+def generate_division_error() -> List[x64.Instruction]:
+    return [
+        x64.Label(DIVISION_ERROR_LABEL),
+        x64.LoadLabelAddress(x64.rcx, ENTER_RETURN_LABEL),
+        x64.Label(".runtime.find_entry_frame"),
+        x64.MovMemToReg(x64.rax, x64.rbp, 8),
+        x64.MovMemToReg(x64.rbp, x64.rbp),
+        x64.Compare(x64.rax, x64.rcx),
+        x64.JumpIfNotEqual(".runtime.find_entry_frame"),
+
+        x64.MovMemToReg(x64.rcx, x64.rbp, ERROR_CELL_OFFSET),
+        x64.MovImmToReg(x64.rax, DIVISION_BY_ZERO),
+        x64.MovRegToMem(x64.rcx, x64.rax),
+        x64.MovImmToReg(x64.rax, 0),
+        x64.Jump(ENTER_RETURN_LABEL),
+    ]
@@ -0,0 +1,51 @@
+'''
+Positions in the source code. A span is a (start, end) pair of offsets into
+the code, end is exclusive. Line and column numbers are not stored anywhere,
+a `LineIndex` computes them only when they are needed, e.g. for error
+messages.
+'''
+
+__all__ = [
+    "LineIndex",
+    "ParseError",
+    "Span",
+]
+
+import re
+from array import array
+from bisect import bisect_right
+from typing import Optional, Tuple, Union
+
+Span = Tuple[int, int]
+
+newline_str_pattern = re.compile("\n")
+newline_bytes_pattern = re.compile(b"\n")
+
+class LineIndex:
+    def __init__(self, code: Union[str, bytes]):
+        newline_pattern = newline_str_pattern if isinstance(code, str) else newline_bytes_pattern
+        # Every line starts after the newline that ends the previous line.
+        self.line_starts = array("q", [0])
+        self.line_starts.extend(match.end() for match in newline_pattern.finditer(code))
+
+    def get_line_column(self, offset: int) -> Tuple[int, int]:
+        '''Line and column of the offset, both start at 1.'''
+        line = bisect_right(self.line_starts, offset) - 1
+        return line + 1, offset - self.line_starts[line] + 1
+
+class ParseError(RuntimeError):
+    def __init__(self, message: str, span: Optional[Span] = None):
+        super().__init__(message)
+        self.message = message
+        self.span = span
+        self.line: Optional[int] = None
+        self.column: Optional[int] = None
+
+    def locate(self, line_index: LineIndex):
+        if self.span is not None:
+            self.line, self.column = line_index.get_line_column(self.span[0])
+
+    def __str__(self):
+        if self.line is None:
+            return self.message
+        return f"{self.message} at line {self.line}, column {self.column}"
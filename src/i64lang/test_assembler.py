@@ -0,0 +1,40 @@
+import pytest
+from . import x64
+from . assembler import assemble, link, Relocation
+
+class Test_assemble:
+    def test__labels_do_not_generate_code(self):
+        obj = assemble([x64.Label("start"), x64.Return(), x64.Label("end")])
+        assert obj.code == bytes.fromhex("c3")
+        assert obj.labels == {"start" : 0, "end" : 1}
+
+    def test__backward_jump(self):
+        obj = assemble([x64.Label("loop"), x64.Return(), x64.Jump("loop")])
+        assert obj.code == bytes.fromhex("c3 e9 fa ff ff ff")
+
+    def test__forward_jump(self):
+        obj = assemble([x64.JumpIfEqual("end"), x64.Return(), x64.Label("end")])
+        assert obj.code == bytes.fromhex("0f 84 01 00 00 00 c3")
+
+    def test__unknown_label_becomes_relocation(self):
+        obj = assemble([x64.Return(), x64.CallLabel("f")])
+        assert obj.relocations == [Relocation(2, "f")]
+
+    def test__duplicate_label(self):
+        with pytest.raises(Exception):
+            assemble([x64.Label("a"), x64.Label("a")])
+
+class Test_link:
+    def test__resolves_references_between_objects(self):
+        obj1 = assemble([x64.Label("f"), x64.CallLabel("g"), x64.Return()])
+        obj2 = assemble([x64.Label("g"), x64.Return()])
+        linked = link([obj1, obj2], alignment=8)
+        assert linked.labels == {"f" : 0, "g" : 8}
+        assert linked.relocations == []
+        assert linked.code == bytes.fromhex("e8 03 00 00 00 c3 cc cc c3")
+
+    def test__keeps_unresolved_relocations(self):
+        obj1 = assemble([x64.Return()])
+        obj2 = assemble([x64.CallLabel("h")])
+        linked = link([obj1, obj2], alignment=4)
+        assert linked.relocations == [Relocation(5, "h")]
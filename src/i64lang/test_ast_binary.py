@@ -0,0 +1,76 @@
+import pytest
+from . import ast
+from . parser import parse_str
+from . ast_utils import walk
+from . ast_binary import ProgramView, dumps, loads
+
+code = """
+    def f(a, b) {
+        while (a < b * 2) { a = a + -f(a, 1)(2); if (a) { return 1; } else if (b) b = 2; else {} }
+        return 123456789012345678901234567890 + -9223372036854775808 - -1000;
+    }
+    def g() {}
+    def h(x) { return (g() <= x) + (x != 0) * (0 >= x / 3) - (x == 1) + (x > 0); }"""
+
+def get_spans(node):
+    return [getattr(sub_node, "span", None) for sub_node in walk(node)]
+
+def deep_function(depth):
+    expr = ast.Identifier("a")
+    for i in range(depth):
+        expr = ast.InfixExpr("+", expr, ast.Int(i))
+    return ast.Function("f", ["a"], ast.BlockStmt([ast.ReturnStmt(expr)]))
+
+class Test_dumps_loads:
+    def test__round_trip(self):
+        program = parse_str(code)
+        loaded = loads(dumps(program))
+        assert loaded == program
+        assert get_spans(loaded) == get_spans(program)
+
+    def test__without_spans(self):
+        program = parse_str(code)
+        data = dumps(program, spans=False)
+        loaded = loads(data)
+        assert loaded == program
+        assert all(span is None for span in get_spans(loaded))
+        assert len(data) < len(dumps(program))
+
+    def test__nodes_without_span(self):
+        program = ast.Program([ast.Function("f", [], ast.BlockStmt([ast.AssignmentStmt("x", ast.Int(-2**70))]))])
+        assert get_spans(loads(dumps(program))) == get_spans(program)
+        assert loads(dumps(program)) == program
+
+    def test__deep_tree(self):
+        program = ast.Program([deep_function(100000)])
+        # Comparing the trees with == would recurse.
+        get_fields = lambda node: (type(node), getattr(node, "value", None), getattr(node, "name", None))
+        assert list(map(get_fields, walk(loads(dumps(program))))) == list(map(get_fields, walk(program)))
+
+    def test__names_are_stored_once(self):
+        data = dumps(parse_str("def long_name(long_name) { long_name = long_name; return long_name; }"))
+        assert data.count(b"long_name") == 1
+
+    def test__invalid_data(self):
+        data = dumps(parse_str(code))
+        with pytest.raises(RuntimeError, match="not an encoded program"):
+            loads(b"def f() {}")
+        with pytest.raises(RuntimeError, match="truncated encoded program"):
+            loads(data[:-1])
+        with pytest.raises(RuntimeError, match="invalid encoded function"):
+            view = ProgramView(data)
+            broken = bytearray(data)
+            broken[view.function_starts[1] - 1] = 0xff
+            loads(bytes(broken))
+
+class Test_ProgramView:
+    def test__functions_are_decoded_on_access(self):
+        program = parse_str(code)
+        view = ProgramView(dumps(program))
+        assert len(view) == 3
+        assert view.functions == [None, None, None]
+        assert view[-1] == program.functions[2]
+        assert view.functions[0] is None and view.functions[2] is not None
+        assert view[2] is view[-1]
+        assert list(view) == program.functions
+        assert view.to_program() == program
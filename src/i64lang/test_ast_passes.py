@@ -0,0 +1,83 @@
+from . import ast
+from . import i64
+from . parser import parse_str
+from . ast_passes import fold_constants
+
+def fold_str(code):
+    return fold_constants(parse_str(code))
+
+def fold_return_expr(code):
+    return fold_str(code).functions[0].stmt.statements[-1].expr
+
+class Test_fold_constants:
+    def test__arithmetic(self):
+        assert fold_return_expr("def f() { return 2 * 3 + 4 - -1; }") == ast.Int(11)
+
+    def test__unary_minus(self):
+        assert fold_return_expr("def f() { return -5; }") == ast.Int(-5)
+
+    def test__wraps_around(self):
+        assert fold_return_expr("def f() { return 9223372036854775807 + 1; }") == ast.Int(i64.MIN)
+        assert fold_return_expr("def f() { return 9223372036854775808; }") == ast.Int(i64.MIN)
+
+    def test__division_by_zero_is_kept(self):
+        expr = fold_return_expr("def f() { return 1 / 0; }")
+        assert expr == ast.InfixExpr("/", ast.Int(1), ast.Int(0))
+
+    def test__identities(self):
+        expr = fold_return_expr("def f(a) { return (a + 0) * 1 - 0 + (a - a) + a * 0 + 0 * a; }")
+        assert expr == ast.Identifier("a")
+
+    def test__constants_are_combined(self):
+        assert fold_return_expr("def f(a) { return 2 * 3 + a; }") == ast.InfixExpr("+", ast.Identifier("a"), ast.Int(6))
+        assert fold_return_expr("def f(a) { return a + 2 - 5; }") == ast.InfixExpr("+", ast.Identifier("a"), ast.Int(-3))
+        assert fold_return_expr("def f(a) { return a * 2 * 3; }") == ast.InfixExpr("*", ast.Identifier("a"), ast.Int(6))
+        assert fold_return_expr("def f(a) { return a + 2 - 2; }") == ast.Identifier("a")
+
+    def test__self_comparison(self):
+        assert fold_return_expr("def f(a) { return (a <= a) + (a < a); }") == ast.Int(1)
+
+    def test__calls_are_not_removed(self):
+        expr = fold_return_expr("def f(a) { return f(a) * 0 + (f(a) - f(a)); }")
+        assert sum(1 for e in [expr.left_expr.left_expr, expr.right_expr.left_expr, expr.right_expr.right_expr]
+                   if isinstance(e, ast.Call)) == 3
+
+    def test__divisions_that_might_trap_are_not_removed(self):
+        expr = fold_return_expr("def f(a) { return 1 / a * 0; }")
+        assert expr == ast.InfixExpr("*", ast.InfixExpr("/", ast.Int(1), ast.Identifier("a")), ast.Int(0))
+
+    def test__function_names_are_not_removed(self):
+        expr = fold_return_expr("def f(a) { return f * 0; }")
+        assert expr == ast.InfixExpr("*", ast.Identifier("f"), ast.Int(0))
+
+    def test__constant_if_else(self):
+        function = fold_str("def f(a) { if (1 < 2) a = 3; else a = 4; return a; }").functions[0]
+        assert function.stmt == ast.BlockStmt([
+            ast.AssignmentStmt("a", ast.Int(3)),
+            ast.ReturnStmt(ast.Identifier("a")),
+        ])
+
+    def test__constant_if(self):
+        function = fold_str("def f(a) { if (0) a = 3; return a; }").functions[0]
+        assert function.stmt == ast.BlockStmt([ast.ReturnStmt(ast.Identifier("a"))])
+
+    def test__loop_that_never_runs(self):
+        function = fold_str("def f(a) { while (1 - 1) a = a + 1; return a; }").functions[0]
+        assert function.stmt == ast.BlockStmt([ast.ReturnStmt(ast.Identifier("a"))])
+
+    def test__code_after_return_is_removed(self):
+        function = fold_str("def f(a) { { return a; } a = a + 1; return a; }").functions[0]
+        assert function.stmt == ast.BlockStmt([ast.ReturnStmt(ast.Identifier("a"))])
+
+    def test__removed_variable_stays_local(self):
+        program = fold_str("def f() { if (0) g = 1; return g; } def g() { return 2; }")
+        assert program.functions[0].stmt == ast.BlockStmt([
+            ast.AssignmentStmt("g", ast.Int(0)),
+            ast.ReturnStmt(ast.Identifier("g")),
+        ])
+
+    def test__input_is_not_modified(self):
+        program = parse_str("def f(a) { if (1) a = 2 + 3; return a; }")
+        before = str(program)
+        fold_constants(program)
+        assert str(program) == before
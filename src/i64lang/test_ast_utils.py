@@ -0,0 +1,57 @@
+from . import ast
+from . parser import parse_str
+from . ast_utils import iter_expressions, iter_statements, reduce_tree, walk, walk_edges
+
+def parse_function(code):
+    return parse_str(code).functions[0]
+
+def deep_expression(depth):
+    expr = ast.Identifier("a")
+    for i in range(depth):
+        expr = ast.InfixExpr("+", expr, ast.Int(i))
+    return expr
+
+class Test_walk:
+    def test__order_of_the_code(self):
+        function = parse_function("def f(a) { while (a < 2) a = g(a, 1); return -a; }")
+        labels = [type(node).__name__ for node in walk(function)]
+        assert labels == ["Function", "BlockStmt", "WhileStmt", "InfixExpr", "Identifier", "Int", "AssignmentStmt",
+                          "Call", "Identifier", "Identifier", "Int", "ReturnStmt", "InfixExpr", "Int", "Identifier"]
+
+    def test__deep_tree(self):
+        assert sum(1 for _ in walk(deep_expression(100000))) == 200001
+
+class Test_walk_edges:
+    def test__parents_and_fields(self):
+        function = parse_function("def f(a) { if (a) return 1; }")
+        edges = [(type(parent).__name__, field_name, type(node).__name__) for parent, field_name, node in walk_edges(function)]
+        assert edges == [
+            ("NoneType", "", "Function"),
+            ("Function", "stmt", "BlockStmt"),
+            ("BlockStmt", "statements", "IfStmt"),
+            ("IfStmt", "condition", "Identifier"),
+            ("IfStmt", "then_stmt", "ReturnStmt"),
+            ("ReturnStmt", "expr", "Int"),
+        ]
+
+class Test_reduce_tree:
+    def test__children_before_parents(self):
+        expr = parse_str("def f(a) { return (1 + 2) * 3 - a; }").functions[0].stmt.statements[0].expr
+        node_amount = reduce_tree(expr, lambda node, results: 1 + sum(results))
+        assert node_amount == 7
+
+    def test__deep_tree(self):
+        depth = reduce_tree(deep_expression(100000), lambda node, results: 1 + max(results, default=0))
+        assert depth == 100001
+
+class Test_iter_statements:
+    def test__nested_statements(self):
+        function = parse_function("def f(a) { if (a) { a = 1; } else while (a) a = 2; return a; }")
+        labels = [type(stmt).__name__ for stmt in iter_statements(function.stmt)]
+        assert labels == ["BlockStmt", "IfElseStmt", "BlockStmt", "AssignmentStmt", "WhileStmt", "AssignmentStmt", "ReturnStmt"]
+
+class Test_iter_expressions:
+    def test__expressions_of_all_statements(self):
+        function = parse_function("def f(a) { while (a) a = a + 1; return 2; }")
+        assert [type(expr).__name__ for expr in iter_expressions(function.stmt)] == [
+            "Identifier", "InfixExpr", "Identifier", "Int", "Int"]
@@ -0,0 +1,151 @@
+'''
+Runs the same programs with every backend and compares the results to the
+ones of the interpreter.
+'''
+
+import re
+import sys
+import pytest
+from . import ast
+from . import i64
+from . parser import parse_str
+from . interpreter import Interpreter
+from . backends import get_backend_names, load_program
+
+corpus = [
+    ("def f(a, b) { return a + b; }", "f", [(2, 3), (-5, 5), (i64.MAX, 1)]),
+    ("def f(a, b) { return a - b * 3 / 2; }", "f", [(10, 4), (-7, 3), (0, -9)]),
+    ("def f(a, b) { return a / b; }", "f", [(7, 2), (-7, 2), (7, -2), (-7, -2), (7, -1), (i64.MIN, -1), (i64.MIN, 1)]),
+    ("def f(a) { return a / -1 + a / 1; }", "f", [(5,), (i64.MIN,)]),
+    # Literals wrap around like every other value.
+    ("def f(a) { return a + 123456789012345678901234567890; }", "f", [(0,), (1,)]),
+    ("def g(a) { return a * 9223372036854775808 + 18446744073709551617 - 9223372036854775807; }", "g", [(0,), (3,)]),
+    ("def f(a, b) { return a * b; }", "f", [(2**40, 2**30), (-3, 2**62)]),
+    ("""def f(a, b) {
+            return (a == b) + 2 * (a != b) + 4 * (a < b) + 8 * (a > b) + 16 * (a <= b) + 32 * (a >= b);
+        }""", "f", [(1, 1), (1, 2), (3, 2), (-1, 0)]),
+    ("def f(a) { return -a + -(a * 2) - -3; }", "f", [(4,), (-4,)]),
+    ("""def sum(n) {
+            s = 0;
+            i = 0;
+            while (i < n) { s = s + i; i = i + 1; }
+            return s;
+        }""", "sum", [(0,), (1,), (100,)]),
+    ("""def fib(n) {
+            if (n < 2) return n;
+            else return fib(n - 1) + fib(n - 2);
+        }""", "fib", [(0,), (1,), (15,)]),
+    ("""def collatz(n) {
+            steps = 0;
+            while (n != 1) {
+                if (n - n / 2 * 2 == 0) n = n / 2;
+                else n = 3 * n + 1;
+                steps = steps + 1;
+            }
+            return steps;
+        }""", "collatz", [(1,), (27,), (97,)]),
+    ("""def f(a, b, c, d, e, f, g, h) { return a - b + c - d + e - f + g - h * 2; }
+        def g(x) { return f(x, 1, 2, 3, 4, 5, 6, 7) + f(1, x, 2, x, 3, x, 4, x); }""", "g", [(10,), (-3,)]),
+    ("""def twice(x) { return x * 2; }
+        def apply(f, x) { return f(f(x)); }
+        def main(x) { return apply(twice, x); }""", "main", [(21,)]),
+    ("""def f(n) {
+            i = 0;
+            while (1) { if (i == n) return i * 10; i = i + 1; }
+        }""", "f", [(0,), (4,)]),
+    ("def f(a) { if (a) b = 5; return b; }", "f", [(0,), (1,)]),
+    ("def f(a) { b = a; }", "f", [(3,)]),
+    ("""def even(n) { if (n == 0) return 1; return odd(n - 1); }
+        def odd(n) { if (n == 0) return 0; return even(n - 1); }""", "even", [(10,), (7,)]),
+    ("""def f(a) {
+            x = 1; y = 2; z = 3; w = 4; v = 5; u = 6; t = 7; s = 8; r = 9; q = 10; p = 11; o = 12; m = 13; l = 14;
+            while (a > 0) {
+                x = x + y; y = y + z; z = z + w; w = w + v; v = v + u; u = u + t; t = t + s;
+                s = s + r; r = r + q; q = q + p; p = p + o; o = o + m; m = m + l; l = l + x;
+                a = a - 1;
+            }
+            return x + y * 2 + z * 3 + w * 4 + v * 5 + u * 6 + t * 7 + s * 8 + r * 9 + q * 10 + p * 11 + o * 12 + m * 13 + l * 14;
+        }""", "f", [(0,), (5,), (100,)]),
+]
+
+@pytest.mark.parametrize("backend", get_backend_names())
+@pytest.mark.parametrize("code, name, args_list", corpus)
+def test_backend_matches_interpreter(backend, code, name, args_list):
+    program = parse_str(code)
+    reference = Interpreter(program)
+    loaded = load_program(program, backend)
+    for args in args_list:
+        assert getattr(loaded, name)(*args) == reference.call(name, *args), args
+
+@pytest.mark.parametrize("backend", get_backend_names())
+@pytest.mark.parametrize("code, name, args_list", corpus)
+def test_folded_backend_matches_interpreter(backend, code, name, args_list):
+    program = parse_str(code)
+    reference = Interpreter(program)
+    loaded = load_program(program, backend, fold_constants=True)
+    for args in args_list:
+        assert getattr(loaded, name)(*args) == reference.call(name, *args), args
+
+division_code = """
+    def divide(a, b) { return a / b; }
+    def f(a, b, c, d, e, f, g, h) { x = 1 + divide(a, h); return x * b + g; }
+    def g(a, b) { return f(a, 2, 3, 4, 5, 6, 7, b) + 1; }
+    def h(a) { return a / 0; }"""
+
+@pytest.mark.parametrize("backend", get_backend_names())
+def test_division_by_zero(backend):
+    loaded = load_program(parse_str(division_code), backend)
+    with pytest.raises(ZeroDivisionError):
+        loaded.divide(1, 0)
+    with pytest.raises(ZeroDivisionError):
+        loaded.h(1)
+    # Also from a function that is called with arguments on the stack.
+    with pytest.raises(ZeroDivisionError):
+        loaded.g(i64.MIN, 0)
+    # Errors leave the program usable.
+    assert loaded.g(7, 2) == 16
+    assert loaded.g(i64.MIN, -1) == i64.wrap(2 * (1 + i64.MIN) + 8)
+
+@pytest.mark.parametrize("backend", get_backend_names())
+def test_deep_recursion(backend):
+    code = """
+        def r(n) { if (n == 0) return 0; return 1 + r(n - 1); }
+        def even(n) { if (n == 0) return 1; return odd(n - 1); }
+        def odd(n) { if (n == 0) return 0; return even(n - 1); }"""
+    loaded = load_program(parse_str(code), backend)
+    assert loaded.r(5000) == 5000
+    assert loaded.even(3001) == 0
+    assert sys.getrecursionlimit() < 100_000
+
+@pytest.mark.parametrize("backend", ["interpreter", "closures"])
+def test_unbounded_recursion(backend):
+    loaded = load_program(parse_str("def r(n) { return r(n + 1); }"), backend)
+    with pytest.raises(RuntimeError, match="maximum recursion depth exceeded"):
+        loaded.r(0)
+
+# In the native backends functions are addresses, which are integers.
+@pytest.mark.parametrize("backend", ["interpreter", "closures"])
+@pytest.mark.parametrize("operator", ["+", "-", "*", "/", "<", ">", "<=", ">=", "==", "!="])
+def test_functions_as_operands(backend, operator):
+    loaded = load_program(parse_str(f"""
+        def g() {{ return 0; }}
+        def left() {{ return g {operator} 1; }}
+        def right() {{ return 1 {operator} g; }}
+        def both() {{ return g {operator} g; }}"""), backend)
+    for name in ["left", "right", "both"]:
+        with pytest.raises(RuntimeError, match=f"operator {re.escape(operator)} expects integers"):
+            getattr(loaded, name)()
+
+@pytest.mark.parametrize("backend", ["interpreter", "closures"])
+def test_lazily_parsed_functions_are_parsed_when_called(backend):
+    program = parse_str("""
+        def twice(x) { return x * 2; }
+        def main(x) { y = twice(x); return y + 1; }
+        def unused(x) { return x x; }""", lazy=True)
+    loaded = load_program(program, backend)
+    assert loaded.main(20) == 41
+    assert [ast.is_function_loaded(function) for function in program.functions] == [True, True, False]
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_program(parse_str(""), "unknown")
@@ -52,3 +52,20 @@ def test_getitem():
 
 def test_int():
     assert int(Bits("1100")) == 12
+
+def test_getitem_slice():
+    bits = Bits("011010")
+    assert bits[1:4] == "110"
+    assert bits[:2] == "01"
+    assert bits[4:] == "10"
+    assert bits[-3:] == "010"
+    assert bits[3:3] == ""
+
+def test_bytes_roundtrip():
+    bits = Bits.from_hex("00ff10")
+    assert bits.to_bytes() == b"\x00\xff\x10"
+    assert Bits.from_bytes(b"\x00\xff\x10") == bits
+
+def test_hash():
+    assert hash(Bits("0101")) == hash(Bits.from_int(5, 4))
+    assert Bits("0101") != Bits("00101")
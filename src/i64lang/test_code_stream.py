@@ -1,4 +1,4 @@
-from . code_stream import CodeStream
+from . code_stream import CodeStream, ByteCodeStream
 
 class Test_CodeStream_try_peek_next:
     def test__none_when_stream_is_empty(self):
@@ -43,3 +43,25 @@ class Test_CodeStream_consume_while:
     def test__returns_empty_string_on_empty_code(self):
         code = CodeStream("")
         assert code.consume_while(lambda c: True) == ""
+
+class Test_ByteCodeStream:
+    def test__peek_and_consume(self):
+        code = ByteCodeStream(b"ab==c")
+        assert code.try_peek_next() == "a"
+        assert code.consume_next() == "a"
+        assert code.consume_while(lambda c: c == "b") == "b"
+        assert code.next_is("==")
+        assert not code.next_is("=c")
+        code.skip_n(2)
+        assert code.consume_next() == "c"
+        assert code.try_peek_next() is None
+        assert not code.next_is("c")
+
+    def test__works_on_mmap(self, tmp_path):
+        import mmap
+        path = tmp_path / "code"
+        path.write_bytes(b"abc 12")
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            code = ByteCodeStream(mapped)
+            assert code.consume_while(lambda c: c != " ") == "abc"
+            assert code.next_is(" 12")
@@ -0,0 +1,103 @@
+import pytest
+from . import x64
+from . parser import parse_str
+from . assembler import assemble
+from . ast_utils import get_function_arities
+from . codegen import generate_function, generate_program
+
+def generate_str(code):
+    return generate_program(parse_str(code))
+
+def intel_syntax(instructions):
+    return [instruction.to_intel_syntax() for instruction in instructions]
+
+def get_call_alignments(instructions):
+    '''
+    Follows rsp through the code of one function and returns rsp modulo 16 at every call.
+    Offsets grow downwards from rsp before the call of the function.
+    '''
+    rsp_offset = 8
+    rbp_offset = None
+    alignments = []
+    for instruction in instructions:
+        if isinstance(instruction, x64.Push):
+            rsp_offset += 8
+        elif isinstance(instruction, x64.Pop):
+            rsp_offset -= 8
+        elif isinstance(instruction, x64.SubImmFromReg) and instruction.reg == x64.rsp:
+            rsp_offset += instruction.value
+        elif isinstance(instruction, x64.AddImmToReg) and instruction.reg == x64.rsp:
+            rsp_offset -= instruction.value
+        elif instruction == x64.MovRegToReg(x64.rbp, x64.rsp):
+            rbp_offset = rsp_offset
+        elif instruction == x64.MovRegToReg(x64.rsp, x64.rbp):
+            rsp_offset = rbp_offset
+        elif isinstance(instruction, (x64.CallLabel, x64.CallReg)):
+            alignments.append(rsp_offset % 16)
+    return alignments
+
+class Test_generate_program:
+    def test__empty_function(self):
+        instructions = generate_str("def f() {}")
+        assert intel_syntax(instructions) == [
+            "f:",
+            "push rbp",
+            "mov rbp, rsp",
+            "mov rax, 0",
+            "f.epilogue1:",
+            "mov rsp, rbp",
+            "pop rbp",
+            "ret",
+        ]
+
+    def test__arguments_are_stored_in_slots(self):
+        instructions = intel_syntax(generate_str("def f(a, b) { return b; }"))
+        assert "mov [rbp - 8], rdi" in instructions
+        assert "mov [rbp - 16], rsi" in instructions
+        assert "mov rax, [rbp - 16]" in instructions
+
+    def test__stack_arguments(self):
+        instructions = intel_syntax(generate_str("def f(a, b, c, d, e, f, g) { return g; }"))
+        assert "mov rax, [rbp + 16]" in instructions
+
+    def test__direct_call(self):
+        instructions = generate_str("def f(a) { return g(a, 1); } def g(a, b) { return a; }")
+        assert x64.CallLabel("g") in instructions
+        assert assemble(instructions).relocations == []
+
+    def test__indirect_call(self):
+        instructions = generate_str("def f(a) { return a(1); }")
+        assert x64.CallReg(x64.rax) in instructions
+
+    def test__function_as_value(self):
+        instructions = generate_str("def f() { return f; }")
+        assert x64.LoadLabelAddress(x64.rax, "f") in instructions
+
+    @pytest.mark.parametrize("code", [
+        "def f(a) { return a + h(g()); } def g() { return 1; } def h(a) { return a; }",
+        "def f(a) { return a + (a * h(a + g())); } def g() { return 1; } def h(a) { return a; }",
+        "def f(a) { return m(1, 2, 3, 4, 5, 6, 7, g()) + m(1, 2, 3, 4, 5, 6, h(g()), a(a + g())); } "
+        "def g() { return 1; } def h(a) { return a; } def m(a, b, c, d, e, f, g, h) { return h; }",
+    ])
+    def test__stack_is_aligned_at_calls(self, code):
+        program = parse_str(code)
+        function_arities = get_function_arities(program)
+        for function in program.functions:
+            assert set(get_call_alignments(generate_function(function, function_arities))) <= {0}
+
+    def test__labels_are_unique(self):
+        instructions = generate_str("def f(a) { while (a) { if (a) a = 1; else a = 2; } if (a) a = 3; }")
+        labels = [instruction.name for instruction in instructions if isinstance(instruction, x64.Label)]
+        assert len(labels) == len(set(labels))
+
+    def test__unknown_name(self):
+        with pytest.raises(Exception):
+            generate_str("def f() { return a; }")
+
+    def test__wrong_argument_amount(self):
+        with pytest.raises(Exception):
+            generate_str("def f(a) { return f(1, 2); }")
+
+    def test__duplicate_function(self):
+        with pytest.raises(Exception):
+            generate_str("def f() {} def f() {}")
@@ -0,0 +1,100 @@
+import os
+import pytest
+from . import compile_cache
+from . import jit
+from . parser import parse_str
+from . compile_cache import CompileCache
+
+pytestmark = pytest.mark.skipif(not jit.is_supported(), reason="requires x86-64 Linux")
+
+code = """
+    def fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+    def twice(x) { return 2 * x; }"""
+
+def get_entry_paths(cache):
+    return sorted(cache.directory.glob("*.entry"))
+
+def fail_to_compile(code, optimize):
+    raise AssertionError("compiled although the code is cached")
+
+class Test_CompileCache:
+    def test__hit_skips_compiling(self, tmp_path, monkeypatch):
+        cache = CompileCache(tmp_path)
+        assert cache.compile_str(code).fib(10) == 55
+        assert len(get_entry_paths(cache)) == 1
+
+        monkeypatch.setattr(compile_cache, "compile_entry", fail_to_compile)
+        compiled = CompileCache(tmp_path).compile_str(code)
+        assert compiled.fib(15) == 610
+        assert compiled.twice(21) == 42
+
+    def test__entry_holds_the_program(self, tmp_path):
+        cache = CompileCache(tmp_path)
+        cache.compile_str(code)
+        entry = CompileCache(tmp_path).get_entry(code)
+        assert entry.get_program() == parse_str(code)
+        assert entry.function_arities == {"fib": 1, "twice": 1}
+
+    def test__keys(self, tmp_path):
+        cache = CompileCache(tmp_path)
+        cache.compile_str(code)
+        cache.compile_str(code, optimize=True)
+        cache.compile_str(code + " ")
+        assert len(get_entry_paths(cache)) == 3
+
+    def test__compiler_version_is_part_of_the_key(self, tmp_path, monkeypatch):
+        cache = CompileCache(tmp_path)
+        cache.compile_str(code)
+        monkeypatch.setattr(compile_cache, "_compiler_version", "other")
+        cache.compile_str(code)
+        assert len(get_entry_paths(cache)) == 2
+
+    def test__compile_file(self, tmp_path):
+        path = tmp_path / "code.i64"
+        path.write_text(code)
+        cache = CompileCache(tmp_path / "cache")
+        assert cache.compile_file(path).fib(10) == 55
+        assert cache.compile_file(path).twice(3) == 6
+        assert len(get_entry_paths(cache)) == 1
+
+    def test__unreadable_entry_is_replaced(self, tmp_path):
+        cache = CompileCache(tmp_path)
+        cache.compile_str(code)
+        [path] = get_entry_paths(cache)
+        path.write_bytes(b"garbage")
+        assert cache.compile_str(code).fib(10) == 55
+        assert path.read_bytes() != b"garbage"
+
+    def test__errors_are_not_cached(self, tmp_path):
+        cache = CompileCache(tmp_path)
+        with pytest.raises(RuntimeError, match="function defined twice: f"):
+            cache.compile_str("def f() {} def f() {}")
+        assert get_entry_paths(cache) == []
+        assert list(tmp_path.iterdir()) == []
+
+    def test__least_recently_used_entries_are_evicted(self, tmp_path):
+        cache = CompileCache(tmp_path)
+        codes = [f"def f() {{ return {i}; }}" for i in range(4)]
+        for i, program_code in enumerate(codes):
+            cache.compile_str(program_code)
+            os.utime(cache.get_path(compile_cache.get_key(program_code, False)), (i, i))
+        entry_size = cache.get_path(compile_cache.get_key(codes[0], False)).stat().st_size
+
+        # Using the oldest entry makes it the most recently used one.
+        cache.compile_str(codes[0])
+        cache.max_size = entry_size * 3
+        cache.compile_str("def f() { return 4; }")
+        remaining = {path.name for path in get_entry_paths(cache)}
+        assert cache.get_path(compile_cache.get_key(codes[0], False)).name in remaining
+        assert cache.get_path(compile_cache.get_key(codes[1], False)).name not in remaining
+        assert cache.get_path(compile_cache.get_key(codes[2], False)).name not in remaining
+        assert len(remaining) == 3
+
+def compile_in_worker(directory):
+    return CompileCache(directory).compile_str(code).fib(12)
+
+def test_concurrent_workers(tmp_path):
+    import multiprocessing
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        assert pool.map(compile_in_worker, [tmp_path] * 8) == [144] * 8
+    assert [path.suffix for path in tmp_path.iterdir()] == [".entry"]
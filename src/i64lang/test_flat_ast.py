@@ -0,0 +1,57 @@
+import pickle
+from . import ast
+from . parser import parse_str
+from . ast_utils import walk
+from . flat_ast import FlatAst, flatten
+
+code = """
+    def f(a, b) {
+        while (a < b * 2) { a = a + -f(a, 1)(2); if (a) { return 1; } else if (b) b = 2; else {} }
+        return 123456789012345678901234567890 + -9223372036854775808;
+    }
+    def g() {}"""
+
+def get_spans(node):
+    return [getattr(sub_node, "span", None) for sub_node in walk(node)]
+
+class Test_flatten:
+    def test__round_trip(self):
+        program = parse_str(code)
+        converted = flatten(program).to_node()
+        assert converted == program
+        assert get_spans(converted) == get_spans(program)
+
+    def test__children_before_parents(self):
+        flat = flatten(parse_str("def f(a) { return a + 1; }"))
+        assert list(flat.kinds) == [FlatAst.IDENTIFIER, FlatAst.INT, FlatAst.INFIX, FlatAst.RETURN,
+                                    FlatAst.BLOCK, FlatAst.FUNCTION, FlatAst.PROGRAM]
+        assert list(flat.get_children(flat.root)) == [5]
+        assert list(flat.get_children(2)) == [0, 1]
+        assert flat.operators[flat.values[2]] == "+"
+
+    def test__names_are_interned(self):
+        flat = flatten(parse_str("def f(a) { a = a; return a; }"))
+        assert flat.name_table.names == ["a", "f"]
+
+    def test__big_ints(self):
+        flat = flatten(ast.Int(2**70))
+        assert list(flat.kinds) == [FlatAst.BIG_INT]
+        assert flat.to_node() == ast.Int(2**70)
+
+    def test__nodes_without_spans(self):
+        expr = ast.InfixExpr("*", ast.Identifier("a"), ast.Int(2))
+        assert get_spans(flatten(expr).to_node()) == [None, None, None]
+
+    def test__pickle(self):
+        program = parse_str(code)
+        flat = pickle.loads(pickle.dumps(flatten(program)))
+        assert flat.to_node() == program
+
+class Test_nodes:
+    def test__no_instance_dict(self):
+        expr = parse_str("def f(a) { return a; }").functions[0].stmt.statements[0].expr
+        assert not hasattr(expr, "__dict__")
+
+    def test__pickle_keeps_spans(self):
+        program = parse_str(code)
+        assert get_spans(pickle.loads(pickle.dumps(program))) == get_spans(program)
@@ -0,0 +1,99 @@
+import random
+import pytest
+from . parser import parse_str
+from . incremental import ParsedCode
+
+code = """def f(a) { return a + 1; }
+
+def g(a, b) {
+    while (a < b) a = a + 1;
+    return a;
+}
+def h() { return g(1, 2); }
+"""
+
+def edit(parsed, start, end, text):
+    program = parsed.edit(start, end, text)
+    assert program == parse_str(parsed.code)
+    return program
+
+class Test_ParsedCode:
+    def test__unchanged_functions_are_reused(self):
+        parsed = ParsedCode(code)
+        f, g, h = parsed.program.functions
+        position = code.index("a + 1")
+        new_f, new_g, new_h = edit(parsed, position, position + 1, "abc").functions
+        assert new_f is not f
+        assert new_g is g
+        assert new_h is h
+
+    def test__edit_between_functions(self):
+        parsed = ParsedCode(code)
+        functions = list(parsed.program.functions)
+        position = code.index("\n\ndef g") + 1
+        program = edit(parsed, position, position, "def x() {}\n")
+        assert [function.name for function in program.functions] == ["f", "x", "g", "h"]
+        assert program.functions[0] is functions[0]
+        assert program.functions[2] is functions[1]
+
+    def test__whitespace_edit_reuses_everything(self):
+        parsed = ParsedCode(code)
+        functions = list(parsed.program.functions)
+        position = code.index("\n\ndef g") + 1
+        program = edit(parsed, position, position, "\n\n  ")
+        assert all(new is old for new, old in zip(program.functions, functions))
+
+    def test__merging_and_splitting_functions(self):
+        parsed = ParsedCode(code)
+        header = "}\n\ndef g(a, b) {"
+        position = code.index(header)
+        edit(parsed, position, position + len(header), "")
+        assert len(parsed.program.functions) == 2
+        edit(parsed, position, position, header)
+        assert len(parsed.program.functions) == 3
+
+    def test__spans_are_shifted(self):
+        parsed = ParsedCode(code)
+        edit(parsed, 0, 0, "def new() { return 0; }\n")
+        function_index = 2
+        g = parsed.program.functions[function_index]
+        start, end = parsed.get_span(function_index, g.stmt.statements[1])
+        assert parsed.code[start:end] == "return a;"
+        assert parsed.get_function_span(function_index) == (code.index("def g") + 24, code.index("def h") + 23)
+
+    def test__error_is_raised_and_recovered_from(self):
+        parsed = ParsedCode(code)
+        position = code.index("return a;") + len("return a")
+        with pytest.raises(RuntimeError):
+            parsed.edit(position, position + 1, "")
+        edit(parsed, position, position, ";")
+        assert len(parsed.program.functions) == 3
+
+    def test__tokens_outside_of_functions(self):
+        parsed = ParsedCode(code)
+        position = code.index("def g")
+        program = edit(parsed, position, position, "x ")
+        assert len(program.functions) == 1
+        program = edit(parsed, position, position + 2, "")
+        assert len(program.functions) == 3
+
+    def test__random_edits(self):
+        rng = random.Random(0)
+        pieces = ["a", "1", " ", "\n", ";", "}", "{", "def ", "return ", "(", ")", "+", "x = 2;"]
+        parsed = ParsedCode(code)
+        for _ in range(500):
+            start = rng.randint(0, len(parsed.code))
+            end = min(len(parsed.code), start + rng.choice([0, 0, 1, 2, 5]))
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 2)))
+            try:
+                program = parsed.edit(start, end, text)
+            except RuntimeError:
+                with pytest.raises(RuntimeError):
+                    parse_str(parsed.code)
+            else:
+                assert program == parse_str(parsed.code)
+                spans = [function.span for function in parse_str(parsed.code).functions]
+                assert [parsed.get_function_span(i) for i in range(len(program.functions))] == spans
+                assert [parsed.get_span(i, function) for i, function in enumerate(program.functions)] == spans
+            if rng.random() < 0.1:
+                parsed = ParsedCode(code)
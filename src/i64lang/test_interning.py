@@ -0,0 +1,70 @@
+import pickle
+from . import ast
+from . parser import parse_str
+from . ast_utils import iter_expressions, walk
+from . interning import ExpressionInterner
+
+code = """
+    def f(a, b) {
+        x = a * 2 + g(a * 2, b);
+        while (a * 2 < b) { a = a * 2 + g(a * 2, b); }
+        return a * 2 + g(a * 2, b);
+    }
+    def g(a, b) { return a * 2; }"""
+
+def get_statement_expressions(program):
+    return [stmt.expr for function in program.functions for stmt in function.stmt.statements if hasattr(stmt, "expr")]
+
+class Test_parse_interned:
+    def test__same_tree(self):
+        assert parse_str(code, intern=True) == parse_str(code)
+        assert parse_str(code, iterative=True, intern=True) == parse_str(code)
+
+    def test__equal_expressions_are_shared(self):
+        program = parse_str(code, intern=True)
+        x, r, g = get_statement_expressions(program)
+        assert x is r
+        # Also across functions, names are not bound to the function they are used in.
+        assert x.left_expr is x.right_expr.args[0] is g
+        loop_body = program.functions[0].stmt.statements[1].body_stmt.statements[0]
+        assert loop_body.expr is x
+
+    def test__every_expression_once(self):
+        program = parse_str(code, intern=True)
+        expressions = [expr for function in program.functions for expr in iter_expressions(function.stmt)]
+        # a, b, 2, g, a * 2, g(...), a * 2 + g(...) and a * 2 < b
+        assert len({id(expr) for expr in expressions}) == 8
+        assert all(expr.span is None for expr in expressions)
+
+    def test__statements_keep_spans(self):
+        interned = parse_str(code, intern=True)
+        program = parse_str(code)
+        assert [getattr(node, "span", None) for node in walk(interned) if not isinstance(node, ast.Expression)] == \
+            [getattr(node, "span", None) for node in walk(program) if not isinstance(node, ast.Expression)]
+
+class Test_ExpressionInterner:
+    def test__structural_hash(self):
+        first = ExpressionInterner().intern(parse_str(code))
+        second = ExpressionInterner().intern(parse_str(code))
+        for expr, other_expr in zip(get_statement_expressions(first), get_statement_expressions(second)):
+            assert expr is not other_expr
+            assert expr.structural_hash == other_expr.structural_hash
+        x, _, g = get_statement_expressions(first)
+        assert x.structural_hash != g.structural_hash
+
+    def test__fields_are_part_of_the_key(self):
+        interner = ExpressionInterner()
+        a = interner.identifier("a")
+        assert interner.infix("+", a, a) is not interner.infix("-", a, a)
+        assert interner.call(a, []) is not interner.call(a, [a])
+        assert interner.int(1) is interner.intern(ast.Int(1))
+        assert len(interner) == 6
+
+    def test__unchanged_statements_are_reused(self):
+        interner = ExpressionInterner()
+        function = interner.intern(parse_str("def f(a) { return a; }").functions[0])
+        assert interner.intern(function) is function
+
+    def test__pickle(self):
+        program = parse_str(code, intern=True)
+        assert pickle.loads(pickle.dumps(program)) == program
@@ -0,0 +1,89 @@
+import pytest
+from . import i64
+from . parser import parse_str
+from . interpreter import Interpreter
+
+def interpret(code):
+    return Interpreter(parse_str(code))
+
+class Test_Interpreter:
+    def test__add(self):
+        assert interpret("def f(a, b) { return a + b; }").f(2, 3) == 5
+
+    def test__call_by_name(self):
+        assert interpret("def f(a) { return a * 2; }").call("f", 4) == 8
+
+    def test__loop(self):
+        program = interpret("""
+            def sum(n) {
+                s = 0;
+                i = 0;
+                while (i < n) { s = s + i; i = i + 1; }
+                return s;
+            }""")
+        assert program.sum(100) == 4950
+
+    def test__recursion(self):
+        program = interpret("""
+            def fib(n) {
+                if (n < 2) return n;
+                else return fib(n - 1) + fib(n - 2);
+            }""")
+        assert program.fib(15) == 610
+
+    def test__return_from_loop(self):
+        program = interpret("""
+            def f(n) {
+                i = 0;
+                while (1) { if (i == n) return i * 10; i = i + 1; }
+            }""")
+        assert program.f(4) == 40
+
+    def test__function_pointer(self):
+        program = interpret("""
+            def twice(x) { return x * 2; }
+            def apply(f, x) { return f(x); }
+            def main(x) { return apply(twice, x); }""")
+        assert program.main(21) == 42
+
+    def test__unassigned_variable_is_zero(self):
+        program = interpret("def f(a) { if (a) b = 5; return b; }")
+        assert program.f(0) == 0
+        assert program.f(1) == 5
+
+    def test__missing_return_gives_zero(self):
+        assert interpret("def f(a) { b = a; }").f(3) == 0
+
+    def test__wraparound(self):
+        program = interpret("def f(a, b) { return a * b; }")
+        assert program.f(2**62, 4) == 0
+        assert program.f(2**62, 2) == i64.MIN
+
+    def test__division_truncates(self):
+        program = interpret("def f(a, b) { return a / b; }")
+        assert program.f(7, 2) == 3
+        assert program.f(-7, 2) == -3
+        assert program.f(7, -2) == -3
+        with pytest.raises(ZeroDivisionError):
+            program.f(1, 0)
+
+    def test__unknown_name(self):
+        with pytest.raises(RuntimeError):
+            interpret("def f() { return a; }").f()
+
+    def test__wrong_argument_amount(self):
+        with pytest.raises(RuntimeError):
+            interpret("def f(a) { return f(1, 2); }").f(1)
+
+    def test__calling_integer(self):
+        with pytest.raises(RuntimeError):
+            interpret("def f(a) { return a(1); }").f(1)
+
+class Test_i64:
+    def test__wrap(self):
+        assert i64.wrap(i64.MAX + 1) == i64.MIN
+        assert i64.wrap(i64.MIN - 1) == i64.MAX
+        assert i64.wrap(-5) == -5
+
+    def test__division_overflow(self):
+        assert i64.div(i64.MIN, -1) == i64.MIN
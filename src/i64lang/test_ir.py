@@ -0,0 +1,125 @@
+import pytest
+from . import ir
+from . parser import parse_str
+from . ast_to_ir import build_program
+
+def build_str(code):
+    return build_program(parse_str(code))
+
+def dump(code):
+    return ir.format_program(build_str(code))
+
+class Test_build_program:
+    def test__empty_function(self):
+        assert dump("def f() {}") == "\n".join([
+            "def f() {",
+            "entry:",
+            "    v0 = 0",
+            "    return v0",
+            "}",
+        ])
+
+    def test__expression(self):
+        assert dump("def f(a, b) { return a + b * 2; }") == "\n".join([
+            "def f(a, b) {",
+            "entry:",
+            "    v0 = arg 0",
+            "    v1 = arg 1",
+            "    v2 = 2",
+            "    v3 = v1 * v2",
+            "    v4 = v0 + v3",
+            "    return v4",
+            "}",
+        ])
+
+    def test__assignments_become_values(self):
+        assert dump("def f(a) { b = a; b = b + b; return b; }") == "\n".join([
+            "def f(a) {",
+            "entry:",
+            "    v0 = arg 0",
+            "    v1 = v0 + v0",
+            "    return v1",
+            "}",
+        ])
+
+    def test__if_else_merges_with_phi(self):
+        assert dump("def f(a) { if (a) b = 1; else b = 2; return b; }") == "\n".join([
+            "def f(a) {",
+            "entry:",
+            "    v0 = arg 0",
+            "    branch v0, then1, else2",
+            "then1:",
+            "    v1 = 1",
+            "    jump end_if3",
+            "else2:",
+            "    v2 = 2",
+            "    jump end_if3",
+            "end_if3:",
+            "    v3 = phi [then1: v1, else2: v2]",
+            "    return v3",
+            "}",
+        ])
+
+    def test__loop(self):
+        assert dump("def f(n) { i = 0; while (i < n) i = i + 1; return i; }") == "\n".join([
+            "def f(n) {",
+            "entry:",
+            "    v0 = arg 0",
+            "    v1 = 0",
+            "    jump while1",
+            "while1:",
+            "    v2 = phi [entry: v1, body2: v5]",
+            "    v3 = v2 < v0",
+            "    branch v3, body2, end_while3",
+            "body2:",
+            "    v4 = 1",
+            "    v5 = v2 + v4",
+            "    jump while1",
+            "end_while3:",
+            "    return v2",
+            "}",
+        ])
+
+    def test__unassigned_variable_is_zero(self):
+        function = build_str("def f(a) { if (a) b = 5; return b; }").functions[0]
+        phi = function.blocks[-1].phis[0]
+        assert sorted(value.value for value in phi.incoming.values()) == [0, 5]
+
+    def test__loop_without_assignment_has_no_phi(self):
+        function = build_str("def f(a) { while (a) { b = a; } return a; }").functions[0]
+        assert all(not block.phis for block in function.blocks)
+
+    def test__code_after_return_is_removed(self):
+        function = build_str("def f(a) { return a; a = a + 1; return a; }").functions[0]
+        assert len(function.blocks) == 1
+
+    def test__calls(self):
+        code = dump("def f(a) { return g(a, 1) + a(2); } def g(x, y) { return g; }")
+        assert "v2 = call g(v0, v1)" in code
+        assert "v4 = call v0(v3)" in code
+        assert "v2 = function g" in code
+
+    def test__unknown_name(self):
+        with pytest.raises(Exception):
+            build_str("def f() { return a; }")
+
+    def test__wrong_argument_amount(self):
+        with pytest.raises(Exception):
+            build_str("def f(a) { return f(1, 2); }")
+
+class Test_compute_dominators:
+    def test__if_else(self):
+        function = build_str("def f(a) { if (a) a = 1; else a = 2; return a; }").functions[0]
+        entry, then_block, else_block, end_block = function.blocks
+        idoms = ir.compute_dominators(function)
+        assert idoms[then_block] is entry
+        assert idoms[else_block] is entry
+        assert idoms[end_block] is entry
+
+    def test__loop(self):
+        function = build_str("def f(a) { while (a) { if (a) a = 1; } return a; }").functions[0]
+        idoms = ir.compute_dominators(function)
+        header = function.blocks[1]
+        for block in function.blocks[2:]:
+            assert idoms[block] is not function.entry
+        assert idoms[header] is function.entry
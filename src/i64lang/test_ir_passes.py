@@ -0,0 +1,151 @@
+from . import ir
+from . parser import parse_str
+from . ast_to_ir import build_program
+from . ir_passes import (
+    eliminate_common_subexpressions,
+    eliminate_dead_code,
+    fold_constants,
+    hoist_loop_invariants,
+    optimize_program,
+)
+
+def build_function(code):
+    return build_program(parse_str(code)).functions[0]
+
+def instructions_of_type(function, instruction_cls):
+    return [instruction for block in function.blocks for instruction in block.instructions
+            if isinstance(instruction, instruction_cls)]
+
+class Test_fold_constants:
+    def test__arithmetic(self):
+        function = build_function("def f() { return 2 * 3 + 4 - -1; }")
+        fold_constants(function)
+        eliminate_dead_code(function)
+        assert ir.format_function(function) == "\n".join([
+            "def f() {",
+            "entry:",
+            "    v0 = 11",
+            "    return v0",
+            "}",
+        ])
+
+    def test__wraps_around(self):
+        function = build_function("def f() { return 9223372036854775807 + 1; }")
+        fold_constants(function)
+        assert function.entry.terminator.value.value == -2**63
+
+    def test__division_by_zero_is_kept(self):
+        function = build_function("def f() { return 1 / 0; }")
+        fold_constants(function)
+        eliminate_dead_code(function)
+        assert len(instructions_of_type(function, ir.BinaryOp)) == 1
+
+    def test__identities(self):
+        function = build_function("def f(a) { return (a + 0) * 1 - 0 + (a - a) + a * 0; }")
+        fold_constants(function)
+        eliminate_dead_code(function)
+        assert isinstance(function.entry.terminator.value, ir.Argument)
+
+    def test__self_comparison(self):
+        function = build_function("def f(a) { return (a <= a) + (a < a); }")
+        fold_constants(function)
+        assert function.entry.terminator.value.value == 1
+
+    def test__constant_branch(self):
+        function = build_function("def f(a) { if (1 < 2) a = 3; else a = 4; return a; }")
+        fold_constants(function)
+        eliminate_dead_code(function)
+        assert len(function.blocks) == 1
+        assert function.entry.terminator.value.value == 3
+
+    def test__loop_that_never_runs(self):
+        function = build_function("def f(a) { while (0) a = a + 1; return a; }")
+        fold_constants(function)
+        assert not any(block.name.startswith("body") for block in function.blocks)
+        assert isinstance(function.blocks[-1].terminator.value, ir.Argument)
+
+class Test_eliminate_dead_code:
+    def test__unused_values(self):
+        function = build_function("def f(a) { b = a * 2; c = b + 1; return a; }")
+        eliminate_dead_code(function)
+        assert instructions_of_type(function, ir.BinaryOp) == []
+
+    def test__calls_are_kept(self):
+        function = build_function("def f(a) { b = f(a); return a; }")
+        eliminate_dead_code(function)
+        assert len(instructions_of_type(function, ir.Call)) == 1
+
+    def test__divisions_that_might_fail_are_kept(self):
+        function = build_function("def f(a) { b = 1 / a; c = a / 2; d = a / -1; return a; }")
+        fold_constants(function)
+        eliminate_dead_code(function)
+        assert len(instructions_of_type(function, ir.BinaryOp)) == 1
+
+class Test_eliminate_common_subexpressions:
+    def test__same_block(self):
+        function = build_function("def f(a, b) { return (a + b) * (b + a); }")
+        eliminate_common_subexpressions(function)
+        multiply = function.entry.terminator.value
+        assert multiply.left is multiply.right
+
+    def test__dominating_block(self):
+        function = build_function("def f(a, b) { c = a * b; if (a) c = a * b + 1; return c; }")
+        eliminate_common_subexpressions(function)
+        assert len([i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "*"]) == 1
+
+    def test__sibling_blocks_are_not_merged(self):
+        function = build_function("def f(a, b) { if (a) c = a * b; else c = a * b; return c; }")
+        eliminate_common_subexpressions(function)
+        assert len([i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "*"]) == 2
+
+    def test__calls_are_not_merged(self):
+        function = build_function("def f(a) { return f(a) + f(a); }")
+        eliminate_common_subexpressions(function)
+        assert len(instructions_of_type(function, ir.Call)) == 2
+
+class Test_hoist_loop_invariants:
+    def test__invariant_is_moved_before_loop(self):
+        function = build_function("def f(a, n) { s = 0; while (s < n) s = s + a * 3; return s; }")
+        hoist_loop_invariants(function)
+        multiply = [i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "*"][0]
+        assert multiply in function.entry.instructions
+
+    def test__variant_stays_in_loop(self):
+        function = build_function("def f(n) { s = 0; while (s < n) s = s * 3 + 1; return s; }")
+        hoist_loop_invariants(function)
+        multiply = [i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "*"][0]
+        assert multiply not in function.entry.instructions
+
+    def test__division_that_might_fail_stays_in_loop(self):
+        function = build_function("def f(a, n) { s = 0; while (s < n) s = s + 1 / a; return s; }")
+        hoist_loop_invariants(function)
+        division = [i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "/"][0]
+        assert division not in function.entry.instructions
+
+    def test__nested_loops(self):
+        function = build_function("""
+            def f(a, n) {
+                i = 0;
+                while (i < n) {
+                    j = 0;
+                    while (j < n) { j = j + a * a; }
+                    i = i + 1;
+                }
+                return i;
+            }""")
+        hoist_loop_invariants(function)
+        multiply = [i for i in instructions_of_type(function, ir.BinaryOp) if i.operator == "*"][0]
+        assert multiply in function.entry.instructions
+
+def test_optimize_program_dump():
+    program = build_program(parse_str("def f(a) { b = 2 * 3; if (b > 5) return a + b; return 0; }"))
+    optimize_program(program)
+    assert ir.format_program(program) == "\n".join([
+        "def f(a) {",
+        "entry:",
+        "    v0 = arg 0",
+        "    v1 = 6",
+        "    v2 = v0 + v1",
+        "    return v2",
+        "}",
+    ])
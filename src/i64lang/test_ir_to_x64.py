@@ -0,0 +1,64 @@
+import pytest
+from . import x64
+from . import jit
+from . parser import parse_str
+from . ast_to_ir import build_program
+from . ir_passes import optimize_program
+from . ir_to_x64 import generate_program
+
+def generate_str(code):
+    program = build_program(parse_str(code))
+    optimize_program(program)
+    return generate_program(program)
+
+def intel_syntax(instructions):
+    return [instruction.to_intel_syntax() for instruction in instructions]
+
+class Test_generate_program:
+    def test__values_stay_in_registers(self):
+        instructions = intel_syntax(generate_str("def f(a, b) { return a * b + a; }"))
+        assert not any("[rbp" in instruction for instruction in instructions)
+
+    def test__comparison_is_fused_with_branch(self):
+        instructions = intel_syntax(generate_str("def f(a, b) { if (a < b) return 1; return 2; }"))
+        assert any(instruction.startswith("cmp") for instruction in instructions)
+        assert not any(instruction.startswith("set") for instruction in instructions)
+
+    def test__callee_saved_registers_are_restored(self):
+        instructions = generate_str("def f(a) { return f(a) + a; }")
+        pushed = [instruction.reg for instruction in instructions if isinstance(instruction, x64.Push)]
+        popped = [instruction.reg for instruction in instructions if isinstance(instruction, x64.Pop)]
+        assert len(pushed) > 1
+        assert popped == list(reversed(pushed))
+
+    def test__immediate_operands(self):
+        instructions = intel_syntax(generate_str("def f(a) { return a + 5; }"))
+        assert "add rdi, 5" in instructions or "add rax, 5" in instructions
+
+@pytest.mark.skipif(not jit.is_supported(), reason="requires x86-64 Linux")
+class Test_run_optimized_code:
+    def test__swapping_phis(self):
+        compiled = jit.compile_str("""
+            def f(n) {
+                a = 1;
+                b = 2;
+                i = 0;
+                while (i < n) { t = a; a = b; b = t; i = i + 1; }
+                return a * 10 + b;
+            }""", optimize=True)
+        assert compiled.f(0) == 12
+        assert compiled.f(3) == 21
+
+    def test__many_live_values_across_calls(self):
+        names = [f"x{i}" for i in range(20)]
+        assignments = " ".join(f"{name} = g(a + {i});" for i, name in enumerate(names))
+        compiled = jit.compile_str(f"""
+            def g(a) {{ return a * 2; }}
+            def f(a) {{ {assignments} return {" + ".join(names)}; }}""", optimize=True)
+        assert compiled.f(1) == sum((1 + i) * 2 for i in range(20))
+
+    def test__stack_arguments(self):
+        compiled = jit.compile_str("""
+            def f(a, b, c, d, e, f, g, h, i) { return a - b + c - d + e - f + g - h + i * 100; }
+            def main(x) { return f(x, 1, 2, 3, 4, 5, 6, 7, 8) + f(1, x, 2, x, 3, x, 4, x, x); }""", optimize=True)
+        assert compiled.main(10) == (10 - 1 + 2 - 3 + 4 - 5 + 6 - 7 + 800) + (1 - 10 + 2 - 10 + 3 - 10 + 4 - 10 + 1000)
@@ -0,0 +1,140 @@
+import gc
+import threading
+import ctypes
+import pytest
+from . import jit
+from . parser import parse_str
+
+pytestmark = pytest.mark.skipif(not jit.is_supported(), reason="requires x86-64 Linux")
+
+class Test_compile_str:
+    def test__add(self):
+        compiled = jit.compile_str("def f(a, b) { return a + b; }")
+        assert compiled.f(2, 3) == 5
+
+    def test__arithmetic(self):
+        compiled = jit.compile_str("def f(a, b) { return a * b - a / b + -b; }")
+        assert compiled.f(7, 2) == 7 * 2 - 3 - 2
+        assert compiled.f(-7, 2) == -7 * 2 + 3 - 2
+
+    def test__comparisons(self):
+        compiled = jit.compile_str("""
+            def f(a, b) {
+                return (a == b) + 2 * (a != b) + 4 * (a < b) + 8 * (a > b) + 16 * (a <= b) + 32 * (a >= b);
+            }""")
+        assert compiled.f(1, 1) == 1 + 16 + 32
+        assert compiled.f(1, 2) == 2 + 4 + 16
+        assert compiled.f(3, 2) == 2 + 8 + 32
+
+    def test__loop(self):
+        compiled = jit.compile_str("""
+            def sum(n) {
+                s = 0;
+                i = 0;
+                while (i < n) { s = s + i; i = i + 1; }
+                return s;
+            }""")
+        assert compiled.sum(100) == 4950
+
+    def test__recursion(self):
+        compiled = jit.compile_str("""
+            def fib(n) {
+                if (n < 2) return n;
+                else return fib(n - 1) + fib(n - 2);
+            }""")
+        assert compiled.fib(20) == 6765
+
+    def test__many_arguments(self):
+        compiled = jit.compile_str("""
+            def f(a, b, c, d, e, f, g, h) { return a - b + c - d + e - f + g - h; }
+            def g(x) { return f(x, 1, 2, 3, 4, 5, 6, 7); }""")
+        assert compiled.f(1, 2, 3, 4, 5, 6, 7, 8) == -4
+        assert compiled.g(10) == 6
+
+    def test__function_pointer(self):
+        compiled = jit.compile_str("""
+            def twice(x) { return x * 2; }
+            def apply(f, x) { return f(x); }
+            def main(x) { return apply(twice, x); }""")
+        assert compiled.main(21) == 42
+
+    def test__missing_return_gives_zero(self):
+        compiled = jit.compile_str("def f(a) { b = a; }")
+        assert compiled.f(3) == 0
+
+    def test__unknown_function(self):
+        compiled = jit.compile_str("def f() { return 1; }")
+        with pytest.raises(AttributeError):
+            compiled.g
+
+def get_code(compiled):
+    return ctypes.string_at(compiled.allocation.address, compiled.allocation.size)
+
+class Test_compile_program_parallel:
+    code = """
+        def fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+        def twice(x) { return x * 2; }
+        def apply(f, x) { return f(x); }
+        def main(x) { return apply(twice, fib(x)); }
+        def sum(n) { s = 0; while (n > 0) { s = s + n; n = n - 1; } return s; }"""
+
+    @pytest.mark.parametrize("optimize", [False, True])
+    def test__same_code_as_compile_program(self, optimize):
+        program = parse_str(self.code)
+        compiled = jit.compile_program_parallel(program, optimize=optimize, workers=2)
+        assert get_code(compiled) == get_code(jit.compile_program(program, optimize=optimize))
+        assert compiled.main(10) == 110
+        assert compiled.sum(100) == 5050
+
+    def test__error(self):
+        program = parse_str(self.code + " def f() { return g(1); } def g() { return a; }")
+        with pytest.raises(RuntimeError, match="g expects 0 arguments, got 1"):
+            jit.compile_program_parallel(program, workers=2)
+
+class Test_CodePool:
+    def test__programs_get_own_pages(self):
+        pool = jit.CodePool()
+        compiled1 = jit.compile_str("def f() { return 1; }", pool)
+        compiled2 = jit.compile_str("def f() { return 2; }", pool)
+        assert len(pool.pages) == 2
+        assert compiled1.allocation.page is not compiled2.allocation.page
+        assert compiled1.f() == 1
+        assert compiled2.f() == 2
+
+    def test__allocating_while_code_runs(self):
+        # Calls release the GIL, the running code must stay executable while other code is loaded.
+        pool = jit.CodePool()
+        compiled = jit.compile_str("def count(n) { i = 0; while (i < n) i = i + 1; return i; }", pool)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(compiled.count(50_000_000)))
+        thread.start()
+        programs = [jit.compile_str(f"def f() {{ return {i}; }}", pool) for i in range(200)]
+        thread.join()
+        assert results == [50_000_000]
+        assert [program.f() for program in programs] == list(range(200))
+
+    def test__smallest_free_page_is_reused(self):
+        pool = jit.CodePool(page_size=4096)
+        body = " ".join(f"a = a + {i};" for i in range(500))
+        large = jit.compile_str(f"def f(a) {{ {body} return a; }}", pool)
+        small = jit.compile_str("def f() { return 1; }", pool)
+        small_page = small.allocation.page
+        del large, small
+        gc.collect()
+        assert jit.compile_str("def f() { return 2; }", pool).allocation.page is small_page
+
+    def test__page_is_reused_after_release(self):
+        pool = jit.CodePool()
+        compiled = jit.compile_str("def f() { return 1; }", pool)
+        address = compiled.allocation.address
+        del compiled
+        gc.collect()
+        compiled = jit.compile_str("def f() { return 2; }", pool)
+        assert compiled.allocation.address == address
+        assert compiled.f() == 2
+
+    def test__large_code(self):
+        pool = jit.CodePool(page_size=4096)
+        body = " ".join(f"a = a + {i};" for i in range(2000))
+        compiled = jit.compile_str(f"def f(a) {{ {body} return a; }}", pool)
+        assert compiled.f(0) == sum(range(2000))
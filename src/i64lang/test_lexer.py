@@ -1,10 +1,19 @@
 import pytest
+import io
+import random
+from string import digits, whitespace
 
-from . code_stream import CodeStream
+from . import lexer
+from . code_stream import CodeStream, ByteCodeStream
 
 from . lexer import (
+    iter_file_chunks,
+    iter_tokens,
     tokenize,
+    tokenize_file,
     tokenize_str,
+    tokenize_str_to_buffer,
+    tokenize_to_buffer,
     try_tokenize_symbol,
     tokenize_int,
     tokenize_name,
@@ -14,6 +23,7 @@ from . tokens import (
     NameToken,
     IntToken,
     SymbolToken,
+    TokenBuffer,
 )
 
 class Test_tokenize:
@@ -54,6 +64,143 @@ class Test_tokenize:
     def test__invalid_tokens(self):
         with pytest.raises(Exception):
             tokenize_str(":")
+        with pytest.raises(Exception):
+            tokenize_str("a ! b")
+        with pytest.raises(Exception):
+            tokenize_str("a\xa0b")
+
+    def test__equal_tokens_are_shared(self):
+        tokens = tokenize_str("a = a + 1 + 1;")
+        assert tokens[0] is tokens[2]
+        assert tokens[3] is tokens[5]
+        assert tokens[4] is tokens[6]
+
+    def test__same_tokens_as_char_by_char_lexing(self):
+        rng = random.Random(0)
+        pieces = ["if", "_x1", "abc", "0", "123", "007", "==", "!=", "<=", ">=", "=", "<", ">", "{", "}",
+                  "(", ")", "+", "-", "*", "/", ";", ",", " ", "\n", "\t"]
+        for _ in range(200):
+            code = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 40)))
+            assert tokenize_str(code) == tokenize_by_chars(code), code
+
+class Test_tokenize_to_buffer:
+    def test__empty(self):
+        assert len(tokenize_str_to_buffer("")) == 0
+        assert len(tokenize_str_to_buffer(" \n ")) == 0
+
+    def test__same_tokens_as_list(self):
+        code = "def f(a, b_2) {\n  while (a <= 10) a = a + b_2 * 3; return -a != f(1, 2);\n}"
+        assert tokenize_str_to_buffer(code).to_tokens() == tokenize_str(code)
+
+    def test__offsets(self):
+        buffer = tokenize_str_to_buffer("  ab ==\n\t12(")
+        assert list(buffer.offsets) == [2, 5, 9, 11]
+
+    def test__starts_at_stream_position(self):
+        code = CodeStream("abc de 5")
+        code.skip_n(4)
+        buffer = tokenize_to_buffer(code)
+        assert buffer.to_tokens() == [NameToken("de"), IntToken(5)]
+        assert list(buffer.offsets) == [4, 7]
+        assert code.try_peek_next() is None
+
+    def test__names_are_interned(self):
+        buffer = tokenize_str_to_buffer("a b a a b")
+        assert buffer.name_table.names == ["a", "b"]
+        assert list(buffer.values) == [0, 1, 0, 0, 1]
+        assert all(kind == TokenBuffer.NAME for kind in buffer.kinds)
+
+    def test__big_int(self):
+        buffer = tokenize_str_to_buffer("9223372036854775807 9223372036854775808")
+        assert buffer.to_tokens() == [IntToken(2**63 - 1), IntToken(2**63)]
+
+    def test__invalid_tokens(self):
+        with pytest.raises(Exception):
+            tokenize_str_to_buffer("a ! b")
+        with pytest.raises(Exception):
+            tokenize_str_to_buffer("a : b")
+
+    def test__small_windows(self, monkeypatch):
+        monkeypatch.setattr(lexer, "window_size", 3)
+        code = "abcdefgh = 1;\n  b ==c 12345678\t( "
+        buffer = tokenize_str_to_buffer(code)
+        assert buffer.to_tokens() == tokenize_str(code)
+        assert [code[offset] for offset in buffer.offsets] == [text[0] for text in "abcdefgh = 1 ; b == c 12345678 (".split()]
+
+    def test__bytes(self):
+        code = "def f(a) { return a <= 42; }"
+        str_buffer = tokenize_str_to_buffer(code)
+        bytes_buffer = tokenize_to_buffer(ByteCodeStream(code.encode("ascii")))
+        assert bytes_buffer.to_tokens() == str_buffer.to_tokens()
+        assert bytes_buffer.offsets == str_buffer.offsets
+
+class Test_tokenize_file:
+    def test__same_as_str(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(lexer, "window_size", 16)
+        code = "def f(a, b_2) {\n  while (a <= 10) a = a + b_2 * 3; return -a != f(1, 99999999999999999999);\n}\n"
+        path = tmp_path / "code.i64"
+        path.write_text(code)
+        buffer = tokenize_file(path)
+        expected = tokenize_str_to_buffer(code)
+        assert buffer.to_tokens() == expected.to_tokens()
+        assert buffer.offsets == expected.offsets
+
+    def test__empty_file(self, tmp_path):
+        path = tmp_path / "code.i64"
+        path.write_text("")
+        assert len(tokenize_file(path)) == 0
+
+    def test__invalid_tokens(self, tmp_path):
+        path = tmp_path / "code.i64"
+        path.write_text("a \u00e9 b", encoding="utf8")
+        with pytest.raises(ValueError):
+            tokenize_file(path)
+
+class Test_iter_tokens:
+    code = "def f(a, bc) {\n  while (a <= 10) a = a + bc * 345; return a != f(1, 2) == a;}  "
+
+    def test__all_chunk_sizes(self):
+        expected = tokenize_str(self.code)
+        for chunk_size in range(1, len(self.code) + 1):
+            chunks = [self.code[i:i + chunk_size] for i in range(0, len(self.code), chunk_size)]
+            assert list(iter_tokens(chunks)) == expected, chunk_size
+
+    def test__symbol_split_between_chunks(self):
+        assert list(iter_tokens(["a=", "=b"])) == tokenize_str("a==b")
+        assert list(iter_tokens(["a", "", "b", " 1", "2"])) == tokenize_str("ab 12")
+
+    def test__no_chunks(self):
+        assert list(iter_tokens([])) == []
+
+    def test__tokens_are_produced_before_all_chunks_are_read(self):
+        def chunks():
+            yield "a b "
+            raise AssertionError("read too far")
+        tokens = iter_tokens(chunks())
+        assert next(tokens) == NameToken("a")
+        assert next(tokens) == NameToken("b")
+
+    def test__file(self):
+        file = io.StringIO(self.code)
+        assert list(iter_tokens(iter_file_chunks(file, chunk_size=7))) == tokenize_str(self.code)
+
+    def test__invalid_tokens(self):
+        with pytest.raises(Exception):
+            list(iter_tokens(["a :", " b"]))
+
+def tokenize_by_chars(code):
+    stream = CodeStream(code)
+    tokens = []
+    while next_char := stream.try_peek_next():
+        if symbol_token := try_tokenize_symbol(stream):
+            tokens.append(symbol_token)
+        elif next_char in digits:
+            tokens.append(tokenize_int(stream))
+        elif next_char in whitespace:
+            stream.consume_next()
+        else:
+            tokens.append(tokenize_name(stream))
+    return tokens
 
 class Test_try_tokenize_symbol:
     def test__finds_single_char(self):
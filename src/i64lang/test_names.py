@@ -0,0 +1,9 @@
+from . names import NameTable
+
+class Test_NameTable:
+    def test__intern(self):
+        table = NameTable()
+        assert [table.intern(name) for name in ["b", "a", "b", "c", "a"]] == [0, 1, 0, 2, 1]
+        assert table.names == ["b", "a", "c"]
+        assert table.ids == {"b" : 0, "a" : 1, "c" : 2}
+        assert len(table) == 3
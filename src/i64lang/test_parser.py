@@ -1,10 +1,20 @@
+import io
+import random
 import pytest
 from . import ast
-from . lexer import tokenize_str
-from . token_stream import TokenStream
+from . ast_utils import iter_subexpressions, walk
+from . lexer import tokenize_str, tokenize_str_to_buffer
+from . lexer import iter_file_chunks
+from . token_stream import TokenStream, LazyTokenStream, TokenBufferStream
 
 from . parser import (
+    iter_functions,
+    parse,
+    parse_chunks,
+    parse_file,
+    parse_parallel,
     parse_str,
+    find_function_ends,
     parse__function,
     parse__argument_names,
     parse__statement,
@@ -13,6 +23,7 @@ from . parser import (
     parse__statement__while,
     parse__statement__if,
     parse__statement__assignment,
+    parse__expression,
     parse__expression__comparison_level,
     parse__expression__add_sub_level,
     parse__expression__mul_div_level,
@@ -50,6 +61,255 @@ class Test_parse_str:
         with pytest.raises(Exception):
             parse_str("def hello {}")
 
+class Test_parse:
+    @pytest.mark.parametrize("code", [
+        "",
+        "def f(a, b) { return a + b * -c(1, (2)); }",
+        "def f() { while (a <= 3) { if (a == b) x = 1; else { x = (f)(b); } } return 12345678901234567890; }",
+        "def g(x) { return (x >= 1) != ((x < 2) > x / 3); }",
+    ])
+    def test__token_buffer_gives_same_tree(self, code):
+        assert parse(tokenize_str_to_buffer(code)) == parse(tokenize_str(code))
+
+    @pytest.mark.parametrize("code", ["def", "def f(", "def f() { return }", "def f() { a = ; }", "def 1() {}"])
+    def test__token_buffer_errors(self, code):
+        with pytest.raises(RuntimeError):
+            parse(tokenize_str(code))
+        with pytest.raises(RuntimeError):
+            parse(tokenize_str_to_buffer(code))
+
+class Test_TokenBufferStream:
+    def test__peeks(self):
+        tokens = TokenBufferStream(tokenize_str_to_buffer("def f (1"))
+        assert tokens.next_is_name("def")
+        assert not tokens.next_is_name("f")
+        assert not tokens.next_is_symbol("(")
+        tokens.skip_name("def")
+        assert tokens.consume_name() == "f"
+        assert tokens.next_is_any_symbol_of({"(", ")"})
+        assert tokens.consume_symbol() == "("
+        assert tokens.next_is_int()
+        assert tokens.consume_int() == 1
+        assert not tokens.next_is_any_name()
+        assert not tokens.next_is_int()
+        assert not tokens.next_is_symbol(")")
+        assert tokens.try_peek_next_token() is None
+
+class Test_spans:
+    code = "def f(a) {\n  b = -a * (c + 12);\n  return f(b);\n}"
+
+    def text(self, node):
+        return self.code[node.span[0]:node.span[1]]
+
+    def test__function_and_statements(self):
+        function = parse_str(self.code).functions[0]
+        assert self.text(function) == self.code
+        assert self.text(function.stmt) == self.code[9:]
+        assert self.text(function.stmt.statements[0]) == "b = -a * (c + 12);"
+        assert self.text(function.stmt.statements[1]) == "return f(b);"
+
+    def test__expressions(self):
+        statements = parse_str(self.code).functions[0].stmt.statements
+        product = statements[0].expr
+        assert self.text(product) == "-a * (c + 12)"
+        assert self.text(product.left_expr) == "-a"
+        assert self.text(product.left_expr.left_expr) == "-"
+        assert self.text(product.right_expr) == "c + 12"
+        assert self.text(product.right_expr.right_expr) == "12"
+        assert self.text(statements[1].expr) == "f(b)"
+
+    def test__spans_are_ignored_in_comparisons(self):
+        assert parse_str("def f() { return 1; }") == parse_str("def f()\n{\n  return 1;\n}")
+
+    def test__tokens_without_positions(self):
+        program = parse(tokenize_str("def f() { return 1; }"))
+        assert program.functions[0].span is None
+        assert program.functions[0].stmt.statements[0].expr.span is None
+
+    def test__token_spans(self):
+        tokens = tokenize_str_to_buffer("ab  ==12")
+        assert [tokens[i].span for i in range(len(tokens))] == [(0, 2), (4, 6), (6, 8)]
+
+    def test__error_location(self):
+        with pytest.raises(RuntimeError) as info:
+            parse_str("def f() {\n  a = 1\n  return a;\n}")
+        assert str(info.value) == "expected ; at line 3, column 3"
+
+    def test__error_at_end(self):
+        with pytest.raises(RuntimeError) as info:
+            parse_str("def f() {\n  return 1;")
+        assert str(info.value) == "unexpected token at line 2, column 12"
+
+    def test__error_location_in_file(self, tmp_path):
+        path = tmp_path / "code.i64"
+        path.write_text("def f() {\n\n  return 1 +;\n}")
+        with pytest.raises(RuntimeError) as info:
+            parse_file(path)
+        assert str(info.value) == "invalid atom at line 3, column 13"
+
+class Test_parse_chunks:
+    code = "def f(a, b) { return a + b * -c(1, (2)); } def g() { while (x) x = x - 1; }"
+
+    def test__same_tree_as_parse_str(self):
+        file = io.StringIO(self.code)
+        assert parse_chunks(iter_file_chunks(file, chunk_size=5)) == parse_str(self.code)
+
+    def test__functions_are_parsed_before_all_chunks_are_read(self):
+        def chunks():
+            yield "def f() { return 1; } "
+            yield "def g() { "
+            raise AssertionError("read too far")
+        functions = iter_functions(chunks())
+        assert next(functions).name == "f"
+
+    def test__error(self):
+        with pytest.raises(RuntimeError):
+            parse_chunks(["def f() { return 1 }"])
+
+def test_parse_file(tmp_path):
+    code = "def f(a, b) { return a + b * -c(1, (2)); } def g() { while (x) x = x - 1; }"
+    path = tmp_path / "code.i64"
+    path.write_text(code)
+    assert parse_file(path) == parse_str(code)
+
+class Test_parse_parallel:
+    code = "".join(f"def f{i}(a) {{ if (a) {{ return f{i + 1}(a - 1); }} return {i}; }}\n" for i in range(20))
+
+    def test__same_as_parse_str(self):
+        program = parse_parallel(self.code, workers=2)
+        expected = parse_str(self.code)
+        assert program == expected
+        assert [function.span for function in program.functions] == [function.span for function in expected.functions]
+        last_return = program.functions[-1].stmt.statements[-1]
+        assert last_return.span == expected.functions[-1].stmt.statements[-1].span
+
+    def test__tokens_between_functions(self):
+        code = "def f() {} x def g() {}"
+        assert parse_parallel(code, workers=2) == parse_str(code)
+
+    def test__error(self):
+        code = self.code + "def g() { return 1 }\n" + self.code
+        with pytest.raises(RuntimeError) as info:
+            parse_parallel(code, workers=2)
+        assert str(info.value) == "expected ; at line 21, column 20"
+
+class Test_parse_iterative:
+    code = """
+        def f(a, b) {
+            while (a < b * 2) { a = a + -f(a, 1)(2); if (a) { return 1; } else if (b) b = 2; else {} }
+            return (a + b) * -(a / 3) == b;
+        }
+        def g() {}"""
+
+    def test__same_as_recursive(self):
+        program = parse_str(self.code, iterative=True)
+        expected = parse_str(self.code)
+        assert program == expected
+        assert [node.span for node in walk(program.functions[0])] == [node.span for node in walk(expected.functions[0])]
+
+    def test__token_list(self):
+        assert parse(tokenize_str(self.code), iterative=True) == parse(tokenize_str(self.code))
+
+    def test__error(self):
+        with pytest.raises(RuntimeError) as info:
+            parse_str("def f(a) {\n  return a < a < a;\n}", iterative=True)
+        assert str(info.value) == "expected ; at line 2, column 16"
+
+    def test__deep_nesting(self):
+        depth = 20000
+        code = f"def f(a) {{ {'if (a) a = 1; else ' * depth} return {'(-' * depth}a{')' * depth}; }}"
+        with pytest.raises(RecursionError):
+            parse_str(code)
+        stmt = parse_str(code, iterative=True).functions[0].stmt.statements[0]
+        for _ in range(depth):
+            stmt = stmt.else_stmt
+        expr = stmt.expr
+        for _ in range(depth):
+            expr = expr.right_expr
+        assert expr == ast.Identifier("a")
+
+class Test_parse_lazy:
+    code = """
+        def f(a, b) {
+            while (a < b * 2) { a = a + -f(a, 1)(2); if (a) { return 1; } else if (b) b = 2; else { { } } }
+            return (a + b) * -(a / 3) == b;
+        }
+        def g() {}"""
+
+    def test__same_as_eager(self):
+        program = parse_str(self.code, lazy=True)
+        expected = parse_str(self.code)
+        assert program == expected
+        assert [node.span for node in walk(program.functions[0])] == [node.span for node in walk(expected.functions[0])]
+
+    def test__bodies_are_parsed_on_access(self):
+        program = parse_str(self.code, lazy=True)
+        f, g = program.functions
+        assert (f.name, f.arg_names, f.span) == ("f", ["a", "b"], parse_str(self.code).functions[0].span)
+        assert not ast.is_function_loaded(f) and not ast.is_function_loaded(g)
+        assert g.stmt == ast.BlockStmt([])
+        assert ast.is_function_loaded(g) and not ast.is_function_loaded(f)
+        assert f.stmt is f.stmt
+
+    def test__token_list(self):
+        assert parse(tokenize_str(self.code), lazy=True) == parse(tokenize_str(self.code))
+
+    def test__iterative(self):
+        assert parse_str(self.code, iterative=True, lazy=True) == parse_str(self.code)
+
+    def test__error_in_body_is_raised_on_access(self):
+        program = parse_str("def f() {}\ndef g(a) {\n  return a < a < a;\n}", lazy=True)
+        assert program.functions[0].stmt == ast.BlockStmt([])
+        with pytest.raises(RuntimeError) as info:
+            program.functions[1].stmt
+        assert str(info.value) == "expected ; at line 3, column 16"
+
+    def test__unclosed_brace(self):
+        with pytest.raises(RuntimeError) as info:
+            parse_str("def f() { { }", lazy=True)
+        assert str(info.value) == "expected } at line 1, column 14"
+        with pytest.raises(RuntimeError, match="expected }"):
+            parse(tokenize_str("def f() { { }"), lazy=True)
+
+    def test__not_with_interning(self):
+        with pytest.raises(ValueError):
+            parse_str(self.code, intern=True, lazy=True)
+
+class Test_find_function_ends:
+    def test__functions(self):
+        assert find_function_ends(" def f() { { } }def g(a) {}\n") == [16, 27]
+
+    def test__empty(self):
+        assert find_function_ends("  ") == []
+
+    def test__not_only_functions(self):
+        assert find_function_ends("def f() {} x") is None
+        assert find_function_ends("def f() {} x def g() {}") is None
+        assert find_function_ends("define f() {}") is None
+        assert find_function_ends("def f() { { }") is None
+        assert find_function_ends("def f() { } }") is None
+
+class Test_LazyTokenStream:
+    def test__pulls_tokens_on_demand(self):
+        pulled = []
+        def tokens():
+            for token in tokenize_str("a b c"):
+                pulled.append(token)
+                yield token
+        stream = LazyTokenStream(tokens())
+        assert stream.consume_name() == "a"
+        assert len(pulled) == 1
+        assert stream.next_is_name("b")
+        assert len(pulled) == 2
+
+    def test__window_stays_small(self):
+        stream = LazyTokenStream(iter(tokenize_str("a " * 1000)))
+        for _ in range(1000):
+            stream.consume_name()
+            assert len(stream.tokens) <= 65
+        assert stream.position == 1000
+        assert stream.try_peek_next_token() is None
+
 class Test_parse__function:
     def test__zero_arguments(self):
         function = parse__function(stream("def hello() {}"))
@@ -135,6 +395,15 @@ class Test_parse__statement__return:
         assert isinstance(stmt, ast.ReturnStmt)
         assert stmt.expr.name == "a"
 
+    def test__followed_by_statement(self):
+        stmt = parse__statement__block(stream("{return a; b = c;}"))
+        assert isinstance(stmt.statements[0], ast.ReturnStmt)
+        assert isinstance(stmt.statements[1], ast.AssignmentStmt)
+
+    def test__missing_semicolon(self):
+        with pytest.raises(Exception):
+            parse__statement__return(stream("return a"))
+
 class Test_parse__statement__while:
     def test__simple(self):
         stmt = parse__statement__while(stream("while (a < b) a = 6;"))
@@ -266,3 +535,111 @@ class Test_parse__expression__atom_level:
         expr = parse__expression__atom_level(stream("-ab"))
         assert isinstance(expr, ast.InfixExpr)
         assert expr.operator == "-"
+
+class Test_parse__expression:
+    def test__precedence(self):
+        expr = parse__expression(stream("a - b * c < -d / e + f"))
+        assert expr == parse__expression(stream("(a - (b * c)) < (((0 - d) / e) + f)"))
+
+    def test__unary_minus_binds_tighter_than_operators(self):
+        expr = parse__expression(stream("-a * b"))
+        assert expr == ast.InfixExpr("*", ast.InfixExpr("-", ast.Int(0), ast.Identifier("a")), ast.Identifier("b"))
+
+    def test__comparisons_are_not_chained(self):
+        tokens = stream("a < b < c")
+        expr = parse__expression(tokens)
+        assert expr.operator == "<"
+        assert tokens.try_peek_symbol() == "<"
+
+    def test__same_trees_and_spans_as_parsing_by_levels(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            self.check_same_as_parsing_by_levels(generate_expression(rng, 3))
+
+    def test__same_errors_as_parsing_by_levels(self):
+        rng = random.Random(0)
+        pieces = ["a", "12", "f", "(", ")", ",", "+", "-", "*", "/", "==", "<"]
+        for _ in range(300):
+            self.check_same_as_parsing_by_levels(" ".join(rng.choice(pieces) for _ in range(rng.randint(1, 12))))
+
+    def check_same_as_parsing_by_levels(self, code):
+        tokens = TokenBufferStream(tokenize_str_to_buffer(code))
+        reference_tokens = TokenBufferStream(tokenize_str_to_buffer(code))
+        try:
+            reference = parse_by_levels__comparison(reference_tokens)
+        except RuntimeError as error:
+            with pytest.raises(RuntimeError) as info:
+                parse__expression(tokens)
+            assert str(info.value) == str(error), code
+            return
+        expr = parse__expression(tokens)
+        assert expr == reference, code
+        assert [e.span for e in iter_subexpressions(expr)] == [e.span for e in iter_subexpressions(reference)], code
+        assert tokens.position == reference_tokens.position, code
+
+def generate_expression(rng, depth):
+    '''Operands and operators in turn, comparisons might be chained.'''
+    operands = ["a", "12", "b_2"]
+    if depth > 0:
+        operands += [f"({generate_expression(rng, depth - 1)})", f"-{generate_expression(rng, depth - 1)}",
+                     f"f({generate_expression(rng, depth - 1)}, b)", "g()"]
+    code = rng.choice(operands)
+    for _ in range(rng.randint(0, 5)):
+        code += f" {rng.choice(['+', '-', '*', '/', '==', '<=', '>'])} {rng.choice(operands)}"
+    return code
+
+# Reference parser with one function per precedence level.
+
+def parse_by_levels__comparison(tokens):
+    start = tokens.position
+    left_expr = parse_by_levels__operators(tokens, ["+", "-"], parse_by_levels__product)
+    if tokens.next_is_any_symbol_of({"==", "<=", ">=", "!=", "<", ">"}):
+        operator = tokens.consume_symbol()
+        right_expr = parse_by_levels__operators(tokens, ["+", "-"], parse_by_levels__product)
+        return ast.InfixExpr(operator, left_expr, right_expr, tokens.get_span(start))
+    return left_expr
+
+def parse_by_levels__product(tokens):
+    return parse_by_levels__operators(tokens, ["*", "/"], parse_by_levels__call)
+
+def parse_by_levels__operators(tokens, operators, parse_operand):
+    start = tokens.position
+    left_expr = parse_operand(tokens)
+    while tokens.next_is_any_symbol_of(set(operators)):
+        operator = tokens.consume_symbol()
+        right_expr = parse_operand(tokens)
+        left_expr = ast.InfixExpr(operator, left_expr, right_expr, tokens.get_span(start))
+    return left_expr
+
+def parse_by_levels__call(tokens):
+    start = tokens.position
+    ptr_expr = parse_by_levels__atom(tokens)
+    if tokens.next_is_symbol("("):
+        tokens.skip_symbol("(")
+        args = []
+        while not tokens.next_is_symbol(")"):
+            args.append(parse_by_levels__comparison(tokens))
+            if not tokens.next_is_symbol(","):
+                break
+            tokens.skip_symbol(",")
+        tokens.skip_symbol(")")
+        return ast.Call(ptr_expr, args, tokens.get_span(start))
+    return ptr_expr
+
+def parse_by_levels__atom(tokens):
+    start = tokens.position
+    if tokens.next_is_any_name():
+        return ast.Identifier(tokens.consume_name(), tokens.get_span(start))
+    elif tokens.next_is_int():
+        return ast.Int(tokens.consume_int(), tokens.get_span(start))
+    elif tokens.next_is_symbol("("):
+        tokens.skip_symbol("(")
+        expr = parse_by_levels__comparison(tokens)
+        tokens.skip_symbol(")")
+        return expr
+    elif tokens.next_is_symbol("-"):
+        tokens.skip_symbol("-")
+        left_expr = ast.Int(0, tokens.get_span(start))
+        right_expr = parse_by_levels__call(tokens)
+        return ast.InfixExpr("-", left_expr, right_expr, tokens.get_span(start))
+    raise tokens.error("invalid atom")
@@ -0,0 +1,150 @@
+import ctypes
+import pytest
+from . import x64
+from . import jit
+from . assembler import assemble
+from . regalloc import (
+    VirtualRegister,
+    allocate_registers,
+    callee_saved_registers,
+    rewrite_instructions,
+    scratch_registers,
+)
+
+v = [VirtualRegister(i) for i in range(40)]
+
+def allocate(instructions):
+    allocation = allocate_registers(instructions)
+    return allocation, rewrite_instructions(instructions, allocation)
+
+def intel_syntax(instructions):
+    return [instruction.to_intel_syntax() for instruction in instructions]
+
+def run(body, *args):
+    allocation, instructions = allocate(body)
+    saved = allocation.used_callee_saved_registers
+    code = [x64.Push(x64.rbp), x64.MovRegToReg(x64.rbp, x64.rsp)]
+    if allocation.spill_size:
+        code.append(x64.SubImmFromReg(x64.rsp, allocation.spill_size))
+    code += [x64.Push(reg) for reg in saved]
+    code += instructions
+    code += [x64.Pop(reg) for reg in reversed(saved)]
+    code += [x64.MovRegToReg(x64.rsp, x64.rbp), x64.Pop(x64.rbp), x64.Return()]
+
+    pool = jit.CodePool()
+    code_allocation = pool.allocate(assemble(code).code)
+    function_type = ctypes.CFUNCTYPE(ctypes.c_int64, *([ctypes.c_int64] * len(args)))
+    return function_type(code_allocation.address)(*args)
+
+class Test_allocate_registers:
+    def test__overlapping_values_get_different_registers(self):
+        allocation, _ = allocate([
+            x64.MovImmToReg(v[0], 1),
+            x64.MovImmToReg(v[1], 2),
+            x64.AddRegToReg(v[0], v[1]),
+            x64.MovRegToReg(x64.rax, v[0]),
+            x64.Return(),
+        ])
+        assert allocation.registers[v[0]] != allocation.registers[v[1]]
+        assert allocation.spill_offsets == {}
+
+    def test__moves_to_hinted_registers_are_removed(self):
+        _, instructions = allocate([
+            x64.MovRegToReg(v[0], x64.rdi),
+            x64.MovRegToReg(v[1], x64.rsi),
+            x64.AddRegToReg(v[0], v[1]),
+            x64.MovRegToReg(x64.rax, v[0]),
+            x64.Return(),
+        ])
+        assert intel_syntax(instructions) == ["add rdi, rsi", "mov rax, rdi", "ret"]
+
+    def test__argument_register_is_not_reused_while_needed(self):
+        allocation, _ = allocate([
+            x64.MovRegToReg(v[0], x64.rdi),
+            x64.MovImmToReg(v[1], 5),
+            x64.MovRegToReg(x64.rax, x64.rsi),
+            x64.AddRegToReg(x64.rax, v[1]),
+            x64.AddRegToReg(x64.rax, v[0]),
+            x64.Return(),
+        ])
+        assert allocation.registers[v[1]] not in (x64.rax, x64.rsi, allocation.registers[v[0]])
+
+    def test__values_live_across_calls_are_callee_saved(self):
+        allocation, _ = allocate([
+            x64.MovRegToReg(v[0], x64.rdi),
+            x64.MovImmToReg(x64.rdi, 1),
+            x64.CallLabel("f"),
+            x64.MovRegToReg(v[1], x64.rax),
+            x64.AddRegToReg(v[1], v[0]),
+            x64.MovRegToReg(x64.rax, v[1]),
+            x64.Return(),
+        ])
+        assert allocation.registers[v[0]] in callee_saved_registers
+        assert allocation.used_callee_saved_registers == [allocation.registers[v[0]]]
+
+    def test__divide_operands_avoid_rax_and_rdx(self):
+        allocation, _ = allocate([
+            x64.MovRegToReg(v[0], x64.rdi),
+            x64.MovRegToReg(v[1], x64.rsi),
+            x64.MovRegToReg(x64.rax, v[0]),
+            x64.SignExtendRaxToRdx(),
+            x64.SignedDivide(v[1]),
+            x64.MovRegToReg(v[2], x64.rax),
+            x64.MovRegToReg(x64.rax, v[2]),
+            x64.Return(),
+        ])
+        assert allocation.registers[v[1]] not in (x64.rax, x64.rdx)
+
+    def test__loop_carried_value_stays_live(self):
+        allocation, _ = allocate([
+            x64.MovImmToReg(v[0], 0),
+            x64.Label("loop"),
+            x64.MovImmToReg(v[1], 1),
+            x64.AddRegToReg(v[0], v[1]),
+            x64.Compare(v[0], v[1]),
+            x64.JumpIfLess("loop"),
+            x64.MovRegToReg(x64.rax, v[0]),
+            x64.Return(),
+        ])
+        assert allocation.registers[v[0]] != allocation.registers[v[1]]
+
+    def test__spills_only_under_pressure(self):
+        body = [x64.MovImmToReg(v[i], i) for i in range(14)]
+        body += [x64.AddRegToReg(v[0], v[i]) for i in range(1, 14)]
+        allocation, _ = allocate(body)
+        assert allocation.spill_offsets == {}
+
+        body = [x64.MovImmToReg(v[i], i) for i in range(20)]
+        body += [x64.AddRegToReg(v[0], v[i]) for i in range(1, 20)]
+        allocation, _ = allocate(body)
+        assert len(allocation.spill_offsets) > 0
+        assert allocation.spill_size % 16 == 0
+        assert not any(reg in scratch_registers for reg in allocation.registers.values())
+
+@pytest.mark.skipif(not jit.is_supported(), reason="requires x86-64 Linux")
+class Test_run_allocated_code:
+    def test__arguments(self):
+        assert run([
+            x64.MovRegToReg(v[0], x64.rdi),
+            x64.MovRegToReg(v[1], x64.rsi),
+            x64.SubRegFromReg(v[0], v[1]),
+            x64.MovRegToReg(x64.rax, v[0]),
+        ], 10, 3) == 7
+
+    def test__high_pressure(self):
+        amount = 30
+        body = [x64.MovRegToReg(v[0], x64.rdi)]
+        body += [x64.MovImmToReg(v[i], i) for i in range(1, amount)]
+        body += [x64.SignedMultiply(v[i], v[0]) for i in range(1, amount)]
+        body += [x64.AddRegToReg(v[0], v[i]) for i in range(1, amount)]
+        body += [x64.MovRegToReg(x64.rax, v[0])]
+        assert run(body, 2) == 2 + sum(i * 2 for i in range(1, amount))
+
+    def test__division_with_spilled_values(self):
+        amount = 20
+        body = [x64.MovRegToReg(v[0], x64.rdi)]
+        body += [x64.MovImmToReg(v[i], i + 1) for i in range(1, amount)]
+        body += [x64.MovRegToReg(x64.rax, v[0]), x64.SignExtendRaxToRdx(), x64.SignedDivide(v[1]), x64.MovRegToReg(v[0], x64.rax)]
+        body += [x64.AddRegToReg(v[0], v[i]) for i in range(1, amount)]
+        body += [x64.MovRegToReg(x64.rax, v[0])]
+        assert run(body, 100) == 50 + sum(range(2, amount + 1))
@@ -0,0 +1,31 @@
+from . spans import LineIndex, ParseError
+
+class Test_LineIndex:
+    def test__first_line(self):
+        index = LineIndex("abc")
+        assert index.get_line_column(0) == (1, 1)
+        assert index.get_line_column(2) == (1, 3)
+
+    def test__multiple_lines(self):
+        index = LineIndex("ab\ncd\n\nef")
+        assert index.get_line_column(2) == (1, 3)
+        assert index.get_line_column(3) == (2, 1)
+        assert index.get_line_column(6) == (3, 1)
+        assert index.get_line_column(8) == (4, 2)
+
+    def test__end_of_code(self):
+        index = LineIndex("ab\n")
+        assert index.get_line_column(3) == (2, 1)
+
+    def test__bytes(self):
+        assert LineIndex(b"a\nbc").get_line_column(3) == (2, 2)
+
+class Test_ParseError:
+    def test__message_without_location(self):
+        assert str(ParseError("expected ;", (4, 5))) == "expected ;"
+
+    def test__message_with_location(self):
+        error = ParseError("expected ;", (4, 5))
+        error.locate(LineIndex("abc\nde"))
+        assert (error.line, error.column) == (2, 1)
+        assert str(error) == "expected ; at line 2, column 1"
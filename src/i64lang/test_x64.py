@@ -94,3 +94,134 @@ def test_SetIfNotEqual():
 
     test([x64.r10], "49C7C200000000410F95C2", "setne r10")
     test([x64.r12], "49C7C400000000410F95C4", "setne r12")
+
+    test([x64.rsi], "48C7C600000000400F95C6", "setne rsi")
+    test([x64.rdi], "48C7C700000000400F95C7", "setne rdi")
+
+def test_encode_into_appends_to_buffer():
+    buffer = bytearray(b"\x90")
+    x64.AddRegToReg(x64.rax, x64.rbx).encode_into(buffer)
+    x64.Return().encode_into(buffer)
+    assert buffer == bytes.fromhex("904801d8c3")
+
+def test_encode_instructions():
+    instructions = [
+        x64.MovImmToReg(x64.rax, 20),
+        x64.MovRegToMem(x64.rsp, x64.rax),
+        x64.Return(),
+    ]
+    expected = b"".join(instruction.to_machine_code().to_bytes() for instruction in instructions)
+    assert x64.encode_instructions(instructions) == expected
+
+# Reference encodings computed from the instruction format in the Intel manual,
+# independently of the encoders in x64.
+
+# Registers in the order of their 4 bit encoding, the high bit goes into the REX prefix.
+register_encodings = {name : i for i, name in enumerate([
+    "rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi",
+    "r8", "r9", "r10", "r11", "r12", "r13", "r14", "r15",
+])}
+
+def encode_rex_and_modrm(opcode, mod, reg_operand, rm_operand):
+    reg = register_encodings[reg_operand.name]
+    rm = register_encodings[rm_operand.name]
+    # REX.W, REX.R extends the reg field and REX.B the rm field.
+    rex = 0x48 | ((reg >> 3) << 2) | (rm >> 3)
+    return bytes([rex]) + opcode + bytes([(mod << 6) | ((reg & 7) << 3) | (rm & 7)])
+
+def reference_register_encoding(opcode, reg_operand, rm_operand):
+    return encode_rex_and_modrm(opcode, 0b11, reg_operand, rm_operand)
+
+def reference_memory_encoding(opcode, reg_operand, base, offset):
+    rm = register_encodings[base.name] & 7
+    # An rm of 0b101 with mod 00 means rip-relative, so rbp and r13 need a displacement.
+    if offset == 0 and rm != 0b101:
+        mod, displacement = 0b00, b""
+    elif -128 <= offset <= 127:
+        mod, displacement = 0b01, offset.to_bytes(1, "little", signed=True)
+    else:
+        mod, displacement = 0b10, offset.to_bytes(4, "little", signed=True)
+    # An rm of 0b100 means that a SIB byte follows, 0x24 is rsp or r12 as base without index.
+    sib = b"\x24" if rm == 0b100 else b""
+    return encode_rex_and_modrm(opcode, mod, reg_operand, base) + sib + displacement
+
+def encode(instruction):
+    buffer = bytearray()
+    instruction.encode_into(buffer)
+    return bytes(buffer)
+
+def register_pairs():
+    assert sorted(reg.name for reg in x64.all_registers) == sorted(register_encodings)
+    return [(reg1, reg2) for reg1 in x64.all_registers for reg2 in x64.all_registers]
+
+@pytest.mark.parametrize("instruction_cls, opcode", [
+    (x64.AddRegToReg, b"\x01"),
+    (x64.SubRegFromReg, b"\x29"),
+    (x64.Compare, b"\x39"),
+    (x64.MovRegToReg, b"\x89"),
+    (x64.TestRegs, b"\x85"),
+])
+def test_register_pairs_match_reference(instruction_cls, opcode):
+    for dst, src in register_pairs():
+        # The destination is the rm operand.
+        assert encode(instruction_cls(dst, src)) == reference_register_encoding(opcode, src, dst), (dst.name, src.name)
+
+def test_SignedMultiply_register_pairs_match_reference():
+    for dst, src in register_pairs():
+        # The destination is the reg operand.
+        assert encode(x64.SignedMultiply(dst, src)) == reference_register_encoding(b"\x0f\xaf", dst, src), (dst.name, src.name)
+
+@pytest.mark.parametrize("offset", [0, 8, -8, 127, -128, 128, -129, 2**31 - 1, -2**31])
+def test_memory_accesses_match_reference(offset):
+    for base, reg in register_pairs():
+        instruction = x64.MovRegToMem(base, reg, offset)
+        assert encode(instruction) == reference_memory_encoding(b"\x89", reg, base, offset), instruction.to_intel_syntax()
+        instruction = x64.MovMemToReg(reg, base, offset)
+        assert encode(instruction) == reference_memory_encoding(b"\x8b", reg, base, offset), instruction.to_intel_syntax()
+
+def test_all_registers_are_ordered_by_index():
+    assert [reg.index for reg in x64.all_registers] == list(range(16))
+
+def test_MovRegToMem_with_offset():
+    test = get_instruction_tester(x64.MovRegToMem)
+
+    test([x64.rbp, x64.rax, -8],   "488945f8",         "mov [rbp - 8], rax")
+    test([x64.rsp, x64.r9, 16],    "4c894c2410",       "mov [rsp + 16], r9")
+    test([x64.rbp, x64.rcx, -200], "48898d38ffffff",   "mov [rbp - 200], rcx")
+
+def test_MovMemToReg_with_offset():
+    test = get_instruction_tester(x64.MovMemToReg)
+
+    test([x64.rax, x64.rbp, 16],   "488b4510",         "mov rax, [rbp + 16]")
+    test([x64.r12, x64.r13, -1000], "4d8ba518fcffff",  "mov r12, [r13 - 1000]")
+
+def test_SignedMultiply():
+    test = get_instruction_tester(x64.SignedMultiply)
+
+    test([x64.rax, x64.rcx], "480fafc1", "imul rax, rcx")
+    test([x64.r9, x64.rbx],  "4c0fafcb", "imul r9, rbx")
+    test([x64.rdx, x64.r14], "490fafd6", "imul rdx, r14")
+
+def test_SignedDivide():
+    test = get_instruction_tester(x64.SignedDivide)
+
+    test([x64.rcx], "48f7f9", "idiv rcx")
+    test([x64.r11], "49f7fb", "idiv r11")
+
+def test_Negate():
+    test = get_instruction_tester(x64.Negate)
+
+    test([x64.rax], "48f7d8", "neg rax")
+    test([x64.r13], "49f7dd", "neg r13")
+
+def test_Push_and_Pop():
+    get_instruction_tester(x64.Push)([x64.rbp], "55", "push rbp")
+    get_instruction_tester(x64.Push)([x64.r12], "4154", "push r12")
+    get_instruction_tester(x64.Pop)([x64.rdi], "5f", "pop rdi")
+    get_instruction_tester(x64.Pop)([x64.r9], "4159", "pop r9")
+
+def test_label_references_encode_zero_displacement():
+    get_instruction_tester(x64.Jump)(["a"], "e900000000", "jmp a")
+    get_instruction_tester(x64.JumpIfEqual)(["a"], "0f8400000000", "je a")
+    get_instruction_tester(x64.CallLabel)(["f"], "e800000000", "call f")
+    get_instruction_tester(x64.LoadLabelAddress)([x64.r10, "f"], "4c8d1500000000", "lea r10, [rip + f]")
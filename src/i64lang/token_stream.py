@@ -1,5 +1,6 @@
-from typing import List, Optional, Set
-from . tokens import NameToken, IntToken, SymbolToken, Token
+from typing import Iterator, List, Optional, Set
+from . tokens import NameToken, IntToken, SymbolToken, Token, TokenBuffer
+from . spans import ParseError, Span
 
 class TokenStream:
     def __init__(self, tokens: List[Token]):
@@ -11,6 +12,26 @@ class TokenStream:
             return self.tokens[self.position]
         return None
 
+    def get_span(self, start: int) -> Optional[Span]:
+        '''Span of the tokens from the start position up to the last consumed token.'''
+        first_span = self.tokens[start].span
+        last_span = self.tokens[self.position - 1].span
+        if first_span is None or last_span is None:
+            return None
+        return first_span[0], last_span[1]
+
+    def get_next_span(self) -> Optional[Span]:
+        token = self.try_peek_next_token()
+        return None if token is None else token.span
+
+    def error(self, message: str) -> ParseError:
+        return ParseError(message, self.get_next_span())
+
+    def try_peek_symbol(self) -> Optional[str]:
+        if token := self.try_peek_next_token_of_type(SymbolToken):
+            return token.symbol
+        return None
+
     def try_peek_next_token_of_type(self, TokenCls) -> Optional[Token]:
         if token := self.try_peek_next_token():
             if isinstance(token, TokenCls):
@@ -40,31 +61,238 @@ class TokenStream:
         if self.next_is_name(name):
             self.position += 1
         else:
-            raise RuntimeError(f"expected {name}")
+            raise self.error(f"expected {name}")
 
     def skip_symbol(self, symbol: str):
         if self.next_is_symbol(symbol):
             self.position += 1
         else:
-            raise RuntimeError(f"expected {symbol}")
+            raise self.error(f"expected {symbol}")
+
+    def skip_braces(self):
+        '''Skips an opening brace, everything up to the matching closing brace and that brace.'''
+        self.skip_symbol("{")
+        depth = 1
+        while depth > 0:
+            if self.next_is_symbol("{"):
+                depth += 1
+            elif self.next_is_symbol("}"):
+                depth -= 1
+            elif self.try_peek_next_token() is None:
+                raise self.error("expected }")
+            self.position += 1
 
     def consume_name(self):
         if token := self.try_peek_next_token_of_type(NameToken):
             self.position += 1
             return token.name
         else:
-            raise RuntimeError("expected name")
+            raise self.error("expected name")
+
+    def try_consume_name(self) -> Optional[str]:
+        if token := self.try_peek_next_token_of_type(NameToken):
+            self.position += 1
+            return token.name
+        return None
 
     def consume_symbol(self):
         if token := self.try_peek_next_token_of_type(SymbolToken):
             self.position += 1
             return token.symbol
         else:
-            raise RuntimeError("expected symbol")
+            raise self.error("expected symbol")
 
     def consume_int(self):
         if token := self.try_peek_next_token_of_type(IntToken):
             self.position += 1
             return token.value
         else:
-            raise RuntimeError("expected int")
+            raise self.error("expected int")
+
+class LazyTokenStream(TokenStream):
+    '''
+    Pulls tokens from the iterator only when they are peeked at. Consumed tokens are
+    dropped, so only a small window of tokens is kept in memory. `position` still
+    counts all tokens since the start.
+    '''
+
+    def __init__(self, tokens: Iterator[Token]):
+        super().__init__([])
+        self.token_iterator = tokens
+        # Position of the first token in `self.tokens`.
+        self.window_start = 0
+
+    def try_peek_next_token(self) -> Optional[Token]:
+        index = self.position - self.window_start
+        if index >= 64:
+            del self.tokens[:index]
+            self.window_start = self.position
+            index = 0
+        while index >= len(self.tokens):
+            token = next(self.token_iterator, None)
+            if token is None:
+                return None
+            self.tokens.append(token)
+        return self.tokens[index]
+
+    def get_span(self, start: int) -> Optional[Span]:
+        return None
+
+class TokenBufferStream(TokenStream):
+    '''
+    Same interface as `TokenStream`, but peeks compare the integers in the buffer
+    instead of creating token objects.
+    '''
+
+    def __init__(self, buffer: TokenBuffer):
+        super().__init__(buffer)
+        self.kinds = buffer.kinds
+        self.values = buffer.values
+        self.name_ids = buffer.name_table.ids
+        self.symbol_ids = buffer.symbol_ids
+        self.names = buffer.name_table.names
+        self.symbols = buffer.symbols
+        self.offsets = buffer.offsets
+        self.lengths = buffer.lengths
+
+    def get_span(self, start: int) -> Optional[Span]:
+        end = self.position - 1
+        return self.offsets[start], self.offsets[end] + self.lengths[end]
+
+    def get_next_span(self) -> Optional[Span]:
+        if self.position < len(self.kinds):
+            return self.tokens.get_span(self.position)
+        elif self.position > 0:
+            end = self.tokens.get_span(self.position - 1)[1]
+            return end, end
+        else:
+            return None
+
+    # Reading past the end raises IndexError, that is cheaper than checking the position every time.
+
+    def next_is_any_name(self) -> bool:
+        try:
+            return self.kinds[self.position] == NAME
+        except IndexError:
+            return False
+
+    def next_is_name(self, name: str) -> bool:
+        position = self.position
+        try:
+            return self.kinds[position] == NAME and self.values[position] == self.name_ids.get(name, -1)
+        except IndexError:
+            return False
+
+    def next_is_symbol(self, symbol: str) -> bool:
+        position = self.position
+        try:
+            return self.kinds[position] == SYMBOL and self.values[position] == self.symbol_ids[symbol]
+        except IndexError:
+            return False
+
+    def next_is_any_symbol_of(self, symbols: Set[str]) -> bool:
+        position = self.position
+        try:
+            return self.kinds[position] == SYMBOL and self.symbols[self.values[position]] in symbols
+        except IndexError:
+            return False
+
+    def try_peek_symbol(self) -> Optional[str]:
+        position = self.position
+        try:
+            if self.kinds[position] == SYMBOL:
+                return self.symbols[self.values[position]]
+        except IndexError:
+            pass
+        return None
+
+    def next_is_int(self) -> bool:
+        try:
+            return self.kinds[self.position] in (INT, BIG_INT)
+        except IndexError:
+            return False
+
+    def skip_name(self, name: str):
+        if self.next_is_name(name):
+            self.position += 1
+        else:
+            raise self.error(f"expected {name}")
+
+    def skip_symbol(self, symbol: str):
+        position = self.position
+        try:
+            if self.kinds[position] == SYMBOL and self.values[position] == self.symbol_ids[symbol]:
+                self.position = position + 1
+                return
+        except IndexError:
+            pass
+        raise self.error(f"expected {symbol}")
+
+    def skip_braces(self):
+        self.skip_symbol("{")
+        kinds = self.kinds
+        values = self.values
+        open_id = self.symbol_ids["{"]
+        close_id = self.symbol_ids["}"]
+        depth = 1
+        for position in range(self.position, len(kinds)):
+            if kinds[position] == SYMBOL:
+                value = values[position]
+                if value == open_id:
+                    depth += 1
+                elif value == close_id:
+                    depth -= 1
+                    if depth == 0:
+                        self.position = position + 1
+                        return
+        self.position = len(kinds)
+        raise self.error("expected }")
+
+    def consume_name(self):
+        position = self.position
+        try:
+            if self.kinds[position] == NAME:
+                self.position = position + 1
+                return self.names[self.values[position]]
+        except IndexError:
+            pass
+        raise self.error("expected name")
+
+    def try_consume_name(self) -> Optional[str]:
+        position = self.position
+        try:
+            if self.kinds[position] == NAME:
+                self.position = position + 1
+                return self.names[self.values[position]]
+        except IndexError:
+            pass
+        return None
+
+    def consume_symbol(self):
+        position = self.position
+        try:
+            if self.kinds[position] == SYMBOL:
+                self.position = position + 1
+                return self.symbols[self.values[position]]
+        except IndexError:
+            pass
+        raise self.error("expected symbol")
+
+    def consume_int(self):
+        position = self.position
+        try:
+            kind = self.kinds[position]
+        except IndexError:
+            kind = None
+        if kind == INT:
+            self.position = position + 1
+            return self.values[position]
+        elif kind == BIG_INT:
+            self.position = position + 1
+            return self.tokens.big_ints[self.values[position]]
+        raise self.error("expected int")
+
+NAME = TokenBuffer.NAME
+INT = TokenBuffer.INT
+BIG_INT = TokenBuffer.BIG_INT
+SYMBOL = TokenBuffer.SYMBOL
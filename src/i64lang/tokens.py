@@ -1,16 +1,74 @@
-from dataclasses import dataclass
+from array import array
+from typing import List, Optional
+from dataclasses import dataclass, field
+
+from . names import NameTable
+from . spans import Span
 
 class Token:
     pass
 
-@dataclass
+@dataclass(frozen=True)
 class NameToken(Token):
     name: str
+    # Only tokens taken from a `TokenBuffer` know where they are.
+    span: Optional[Span] = field(default=None, compare=False, repr=False)
 
-@dataclass
+@dataclass(frozen=True)
 class IntToken(Token):
     value: int
+    # Only tokens taken from a `TokenBuffer` know where they are.
+    span: Optional[Span] = field(default=None, compare=False, repr=False)
 
-@dataclass
+@dataclass(frozen=True)
 class SymbolToken(Token):
     symbol: str
+    # Only tokens taken from a `TokenBuffer` know where they are.
+    span: Optional[Span] = field(default=None, compare=False, repr=False)
+
+class TokenBuffer:
+    '''
+    Stores tokens as parallel arrays instead of one object per token.
+    For names the value is an id in `name_table`, for symbols an index into
+    `symbols` and for integers the value itself. Integers that don't fit into
+    64 bits are stored in `big_ints` and referenced by index. `offsets` and
+    `lengths` give the span of every token in the source code.
+    '''
+
+    NAME = 0
+    INT = 1
+    BIG_INT = 2
+    SYMBOL = 3
+
+    def __init__(self, symbols: List[str]):
+        self.kinds = array("b")
+        self.values = array("q")
+        self.offsets = array("q")
+        self.lengths = array("i")
+        self.name_table = NameTable()
+        self.symbols = symbols
+        self.symbol_ids = {symbol : i for i, symbol in enumerate(symbols)}
+        self.big_ints: List[int] = []
+
+    def get_span(self, index: int) -> Span:
+        start = self.offsets[index]
+        return start, start + self.lengths[index]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> Token:
+        kind = self.kinds[index]
+        value = self.values[index]
+        span = self.get_span(index)
+        if kind == TokenBuffer.NAME:
+            return NameToken(self.name_table.names[value], span)
+        elif kind == TokenBuffer.INT:
+            return IntToken(value, span)
+        elif kind == TokenBuffer.BIG_INT:
+            return IntToken(self.big_ints[value], span)
+        else:
+            return SymbolToken(self.symbols[value], span)
+
+    def to_tokens(self) -> List[Token]:
+        return [self[i] for i in range(len(self))]
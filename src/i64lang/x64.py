@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from typing import Dict, List
+from dataclasses import dataclass, field
 from . bits import Bits
 
 @dataclass
@@ -18,16 +19,25 @@ class Register:
 
     bits: Bits = Bits("")
 
+    # 0 for rax, 8 for r8, ...
+    index: int = field(default=0, repr=False, compare=False)
+
     def __post_init__(self):
         self.bits = Bits.from_int(self.number, length=3)
+        self.index = self.group * 8 + self.number
 
 class Instruction:
     def to_intel_syntax(self) -> str:
         raise NotImplementedError()
 
-    def to_machine_code(self) -> str:
+    def encode_into(self, buffer: bytearray):
         raise NotImplementedError()
 
+    def to_machine_code(self) -> Bits:
+        buffer = bytearray()
+        self.encode_into(buffer)
+        return Bits.from_bytes(buffer)
+
 @dataclass
 class MovImmToReg(Instruction):
     reg: Register
@@ -36,69 +46,52 @@ class MovImmToReg(Instruction):
     def to_intel_syntax(self):
         return f"mov {self.reg.name}, {self.value}"
 
-    def to_machine_code(self):
-        prefix = Bits.from_hex("48" if self.reg.group == 0 else "49")
+    def encode_into(self, buffer: bytearray):
+        prefix = 0x48 | self.reg.group
 
         imm_size = get_imm_size(self.value)
         if imm_size <= 4:
-            opcode = Bits.from_hex("c7")
-            args = Bits("11000") + self.reg.bits
-            imm = Bits.from_int(self.value, 32).reversed_bytes()
-            return prefix + opcode + args + imm
+            buffer += bytes((prefix, 0xc7, 0xc0 | self.reg.number))
+            buffer += self.value.to_bytes(4, "little", signed=True)
         else:
-            opcode = Bits.from_hex_and_offset("b8", self.reg.number)
-            imm = Bits.from_int(self.value, 64).reversed_bytes()
-            return prefix + opcode + imm
+            buffer += bytes((prefix, 0xb8 + self.reg.number))
+            buffer += (self.value & 0xffffffffffffffff).to_bytes(8, "little")
 
 @dataclass
 class MovRegToMem(Instruction):
     addr_reg: Register
     src_reg: Register
+    offset: int = 0
 
     def to_intel_syntax(self):
-        return f"mov [{self.addr_reg.name}], {self.src_reg.name}"
+        return f"mov {format_address(self.addr_reg, self.offset)}, {self.src_reg.name}"
 
-    def to_machine_code(self):
-        prefix = get_register_group_prefix(self.addr_reg, self.src_reg)
-        opcode = Bits.from_hex("89")
-
-        if self.addr_reg.number != 5:
-            mod_bits = Bits("00")
-            imm = Bits("")
+    def encode_into(self, buffer: bytearray):
+        if self.offset == 0:
+            encode_from_table(buffer, MovRegToMem, self.addr_reg, self.src_reg)
         else:
-            mod_bits = Bits("01")
-            imm = Bits.zeros(8)
-
-        args = mod_bits + self.src_reg.bits + self.addr_reg.bits
-        if self.addr_reg.number == 4:
-            args += Bits.from_hex("24")
+            self.encode_directly(buffer)
 
-        return prefix + opcode + args + imm
+    def encode_directly(self, buffer: bytearray):
+        encode_memory_access(buffer, 0x89, self.src_reg, self.addr_reg, self.offset)
 
 @dataclass
 class MovMemToReg(Instruction):
     dst_reg: Register
     addr_reg: Register
+    offset: int = 0
 
     def to_intel_syntax(self):
-        return f"mov {self.dst_reg.name}, [{self.addr_reg.name}]"
+        return f"mov {self.dst_reg.name}, {format_address(self.addr_reg, self.offset)}"
 
-    def to_machine_code(self):
-        prefix = get_register_group_prefix(self.addr_reg, self.dst_reg)
-        opcode = Bits.from_hex("8b")
-
-        if self.addr_reg.number != 5:
-            mod_bits = Bits("00")
-            imm = Bits("")
+    def encode_into(self, buffer: bytearray):
+        if self.offset == 0:
+            encode_from_table(buffer, MovMemToReg, self.dst_reg, self.addr_reg)
         else:
-            mod_bits = Bits("01")
-            imm = Bits.zeros(8)
-
-        args = mod_bits + self.dst_reg.bits + self.addr_reg.bits
-        if self.addr_reg.number == 4:
-            args += Bits.from_hex("24")
+            self.encode_directly(buffer)
 
-        return prefix + opcode + args + imm
+    def encode_directly(self, buffer: bytearray):
+        encode_memory_access(buffer, 0x8b, self.dst_reg, self.addr_reg, self.offset)
 
 @dataclass
 class SimpleTwoRegisterInstruction(Instruction):
@@ -108,11 +101,13 @@ class SimpleTwoRegisterInstruction(Instruction):
     dst_reg: Register
     src_reg: Register
 
-    def to_machine_code(self):
-        prefix = get_register_group_prefix(self.dst_reg, self.src_reg)
-        opcode = Bits.from_hex(self.opcode_hex)
-        args = Bits("11") + self.src_reg.bits + self.dst_reg.bits
-        return prefix + opcode + args
+    def encode_into(self, buffer: bytearray):
+        encode_from_table(buffer, type(self), self.dst_reg, self.src_reg)
+
+    def encode_directly(self, buffer: bytearray):
+        buffer.append(get_register_group_prefix(self.dst_reg, self.src_reg))
+        buffer += bytes.fromhex(self.opcode_hex)
+        buffer.append(0xc0 | (self.src_reg.number << 3) | self.dst_reg.number)
 
     def to_intel_syntax(self):
         return f"{self.intel_syntax_name} {self.dst_reg.name}, {self.src_reg.name}"
@@ -129,6 +124,99 @@ class Compare(SimpleTwoRegisterInstruction):
     opcode_hex = "39"
     intel_syntax_name = "cmp"
 
+class MovRegToReg(SimpleTwoRegisterInstruction):
+    opcode_hex = "89"
+    intel_syntax_name = "mov"
+
+class TestRegs(SimpleTwoRegisterInstruction):
+    opcode_hex = "85"
+    intel_syntax_name = "test"
+
+class SignedMultiply(SimpleTwoRegisterInstruction):
+    opcode_hex = "0faf"
+    intel_syntax_name = "imul"
+
+    def encode_directly(self, buffer: bytearray):
+        # The destination is encoded in the reg field here, unlike in the other instructions.
+        buffer.append(get_register_group_prefix(self.src_reg, self.dst_reg))
+        buffer += bytes.fromhex(self.opcode_hex)
+        buffer.append(0xc0 | (self.dst_reg.number << 3) | self.src_reg.number)
+
+@dataclass
+class ImmediateToRegInstruction(Instruction):
+    opcode_extension = NotImplemented
+    intel_syntax_name = NotImplemented
+
+    reg: Register
+    value: int
+
+    def encode_into(self, buffer: bytearray):
+        buffer += bytes((0x48 | self.reg.group, 0x81, 0xc0 | (self.opcode_extension << 3) | self.reg.number))
+        buffer += self.value.to_bytes(4, "little", signed=True)
+
+    def to_intel_syntax(self):
+        return f"{self.intel_syntax_name} {self.reg.name}, {self.value}"
+
+class AddImmToReg(ImmediateToRegInstruction):
+    opcode_extension = 0
+    intel_syntax_name = "add"
+
+class SubImmFromReg(ImmediateToRegInstruction):
+    opcode_extension = 5
+    intel_syntax_name = "sub"
+
+class SignExtendRaxToRdx(Instruction):
+    def encode_into(self, buffer: bytearray):
+        buffer += b"\x48\x99"
+
+    def to_intel_syntax(self):
+        return "cqo"
+
+@dataclass
+class SignedDivide(Instruction):
+    # Divides rdx:rax by the register, the quotient ends up in rax.
+    reg: Register
+
+    def encode_into(self, buffer: bytearray):
+        buffer += bytes((0x48 | self.reg.group, 0xf7, 0xf8 | self.reg.number))
+
+    def to_intel_syntax(self):
+        return f"idiv {self.reg.name}"
+
+@dataclass
+class Negate(Instruction):
+    reg: Register
+
+    def encode_into(self, buffer: bytearray):
+        buffer += bytes((0x48 | self.reg.group, 0xf7, 0xd8 | self.reg.number))
+
+    def to_intel_syntax(self):
+        return f"neg {self.reg.name}"
+
+@dataclass
+class Push(Instruction):
+    reg: Register
+
+    def encode_into(self, buffer: bytearray):
+        if self.reg.group == 1:
+            buffer.append(0x41)
+        buffer.append(0x50 + self.reg.number)
+
+    def to_intel_syntax(self):
+        return f"push {self.reg.name}"
+
+@dataclass
+class Pop(Instruction):
+    reg: Register
+
+    def encode_into(self, buffer: bytearray):
+        if self.reg.group == 1:
+            buffer.append(0x41)
+        buffer.append(0x58 + self.reg.number)
+
+    def to_intel_syntax(self):
+        return f"pop {self.reg.name}"
+
 @dataclass
 class SetOnConditionInstruction(Instruction):
     opcode_hex = NotImplemented
@@ -136,15 +224,17 @@ class SetOnConditionInstruction(Instruction):
 
     reg: Register
 
-    def to_machine_code(self):
-        zeroing = MovImmToReg(self.reg, 0).to_machine_code()
+    def encode_into(self, buffer: bytearray):
+        MovImmToReg(self.reg, 0).encode_into(buffer)
 
-        prefix = Bits.from_hex("41" if self.reg.group == 1 else "")
-        opcode = Bits.from_hex(self.opcode_hex)
-        args = Bits("11000") + self.reg.bits
-        set_byte_on_condition = prefix + opcode + args
-
-        return zeroing + set_byte_on_condition
+        # Without a REX prefix, the low bytes of rsp, rbp, rsi and rdi
+        # cannot be addressed, the numbers refer to ah, ch, dh and bh instead.
+        if self.reg.group == 1:
+            buffer.append(0x41)
+        elif self.reg.number >= 4:
+            buffer.append(0x40)
+        buffer += bytes.fromhex(self.opcode_hex)
+        buffer.append(0xc0 | self.reg.number)
 
     def to_intel_syntax(self):
         # This is a combination of two instructions.
@@ -175,13 +265,173 @@ class SetIfLessOrEqual(SetOnConditionInstruction):
     intel_syntax_name = "setle"
 
 class Return(Instruction):
-    def to_machine_code(self):
-        return Bits.from_hex("c3")
+    def encode_into(self, buffer: bytearray):
+        buffer.append(0xc3)
 
     def to_intel_syntax(self):
         return "ret"
 
-def get_register_group_prefix(reg1: Register, reg2: Register) -> Bits:
+@dataclass
+class CallReg(Instruction):
+    reg: Register
+
+    def encode_into(self, buffer: bytearray):
+        if self.reg.group == 1:
+            buffer.append(0x41)
+        buffer += bytes((0xff, 0xd0 | self.reg.number))
+
+    def to_intel_syntax(self):
+        return f"call {self.reg.name}"
+
+@dataclass
+class Label(Instruction):
+    # Marks a position in the code, does not generate any machine code.
+    name: str
+
+    def encode_into(self, buffer: bytearray):
+        pass
+
+    def to_intel_syntax(self):
+        return f"{self.name}:"
+
+class LabelReferenceInstruction(Instruction):
+    '''
+    Instructions that end with a 32 bit displacement relative to the end of the
+    instruction. The displacement is encoded as zero and has to be patched by
+    the assembler once the position of the label is known.
+    '''
+    label: str
+
+    def encode_prefix_into(self, buffer: bytearray):
+        raise NotImplementedError()
+
+    def encode_into(self, buffer: bytearray):
+        self.encode_prefix_into(buffer)
+        buffer += bytes(4)
+
+@dataclass
+class Jump(LabelReferenceInstruction):
+    label: str
+
+    def encode_prefix_into(self, buffer: bytearray):
+        buffer.append(0xe9)
+
+    def to_intel_syntax(self):
+        return f"jmp {self.label}"
+
+@dataclass
+class ConditionalJumpInstruction(LabelReferenceInstruction):
+    opcode_hex = NotImplemented
+    intel_syntax_name = NotImplemented
+
+    label: str
+
+    def encode_prefix_into(self, buffer: bytearray):
+        buffer += bytes.fromhex(self.opcode_hex)
+
+    def to_intel_syntax(self):
+        return f"{self.intel_syntax_name} {self.label}"
+
+class JumpIfEqual(ConditionalJumpInstruction):
+    opcode_hex = "0f84"
+    intel_syntax_name = "je"
+
+class JumpIfNotEqual(ConditionalJumpInstruction):
+    opcode_hex = "0f85"
+    intel_syntax_name = "jne"
+
+class JumpIfLess(ConditionalJumpInstruction):
+    opcode_hex = "0f8c"
+    intel_syntax_name = "jl"
+
+class JumpIfGreaterOrEqual(ConditionalJumpInstruction):
+    opcode_hex = "0f8d"
+    intel_syntax_name = "jge"
+
+class JumpIfLessOrEqual(ConditionalJumpInstruction):
+    opcode_hex = "0f8e"
+    intel_syntax_name = "jle"
+
+class JumpIfGreater(ConditionalJumpInstruction):
+    opcode_hex = "0f8f"
+    intel_syntax_name = "jg"
+
+@dataclass
+class CallLabel(LabelReferenceInstruction):
+    label: str
+
+    def encode_prefix_into(self, buffer: bytearray):
+        buffer.append(0xe8)
+
+    def to_intel_syntax(self):
+        return f"call {self.label}"
+
+@dataclass
+class LoadLabelAddress(LabelReferenceInstruction):
+    reg: Register
+    label: str
+
+    def encode_prefix_into(self, buffer: bytearray):
+        # lea reg, [rip + displacement]
+        buffer += bytes((0x48 | (self.reg.group << 2), 0x8d, (self.reg.number << 3) | 0b101))
+
+    def to_intel_syntax(self):
+        return f"lea {self.reg.name}, [rip + {self.label}]"
+
+def encode_instructions(instructions) -> bytearray:
+    buffer = bytearray()
+    for instruction in instructions:
+        instruction.encode_into(buffer)
+    return buffer
+
+def encode_from_table(buffer: bytearray, instruction_cls, reg1: Register, reg2: Register):
+    table = encoding_tables.get(instruction_cls)
+    if table is None:
+        table = build_encoding_table(instruction_cls)
+    buffer += table[(reg1.index << 4) | reg2.index]
+
+def build_encoding_table(instruction_cls) -> List[bytes]:
+    '''
+    Precomputes the encoding of an instruction that only depends on two register
+    operands for every register pair. The table is indexed by the register indices.
+    '''
+    table = []
+    for reg1 in all_registers:
+        for reg2 in all_registers:
+            buffer = bytearray()
+            instruction_cls(reg1, reg2).encode_directly(buffer)
+            table.append(bytes(buffer))
+    encoding_tables[instruction_cls] = table
+    return table
+
+encoding_tables: Dict[type, List[bytes]] = {}
+
+def encode_memory_access(buffer: bytearray, opcode: int, reg: Register, addr_reg: Register, offset: int = 0):
+    buffer.append(get_register_group_prefix(addr_reg, reg))
+    buffer.append(opcode)
+
+    # rbp and r13 can only be used as base with a displacement,
+    # rsp and r12 require a SIB byte.
+    if offset == 0 and addr_reg.number != 5:
+        mod, displacement_size = 0b00, 0
+    elif -2**7 <= offset <= 2**7 - 1:
+        mod, displacement_size = 0b01, 1
+    else:
+        mod, displacement_size = 0b10, 4
+    buffer.append((mod << 6) | (reg.number << 3) | addr_reg.number)
+    if addr_reg.number == 4:
+        buffer.append(0x24)
+    buffer += offset.to_bytes(displacement_size, "little", signed=True)
+
+def format_address(addr_reg: Register, offset: int) -> str:
+    if offset == 0:
+        return f"[{addr_reg.name}]"
+    elif offset > 0:
+        return f"[{addr_reg.name} + {offset}]"
+    else:
+        return f"[{addr_reg.name} - {-offset}]"
+
+def get_register_group_prefix(reg1: Register, reg2: Register) -> int:
     return prefixes_for_64_bit_registers[(reg1.group, reg2.group)]
 
 def get_imm_size(n):
@@ -199,10 +449,10 @@ def get_imm_size(n):
         raise NotImplementedError("unsupported immediate value size")
 
 prefixes_for_64_bit_registers = {
-    (0, 0) : Bits.from_hex("48"),
-    (1, 0) : Bits.from_hex("49"),
-    (0, 1) : Bits.from_hex("4c"),
-    (1, 1) : Bits.from_hex("4d")
+    (0, 0) : 0x48,
+    (1, 0) : 0x49,
+    (0, 1) : 0x4c,
+    (1, 1) : 0x4d
 }
 
 rax = Register("rax", 0, 0)
@@ -224,3 +474,8 @@ r12 = Register("r12", 1, 4)
 r13 = Register("r13", 1, 5)
 r14 = Register("r14", 1, 6)
 r15 = Register("r15", 1, 7)
+
+all_registers = [
+    rax, rcx, rdx, rbx, rsp, rbp, rsi, rdi,
+    r8, r9, r10, r11, r12, r13, r14, r15,
+]